@@ -1,7 +1,18 @@
 import pandas as pd
 import os
 import glob
+import io
+import json
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+from functools import partial
+
+from cache_colunar import calcular_hash, preparar_para_parquet
+from configuracao import FORMATO_SAIDA_JWM
+from gravador_tabelas import FORMATOS_SAIDA, caminho_com_formato, gravar_tabela
+from mapeamento_locais import carregar_indice, codigo_cidade, codigo_cnpj
 
 # --- Parte 1: Inteligência para Encontrar o Arquivo ---
 
@@ -17,115 +28,320 @@ def encontrar_relatorio_recente():
     arquivo_mais_recente = max(arquivos_encontrados, key=os.path.getmtime)
     return arquivo_mais_recente
 
-# --- Início do processamento principal ---
+# --- Parte 2: Configuração ---
+
+COLUNAS_ENTRADA = ['N° CT-e', 'Notas Fiscais', 'Cidade origem', 'CPF/CNPJ Remetente',
+                   'Cidade destino', 'CPF/CNPJ Destinatário', 'Data Frete', 'Data Entrega']
+ARQUIVO_SAIDA = 'Relatório Tratado.xlsx'
+# CNPJs e cidades que não estão na tabela de locais (mapeamento_locais.csv)
+ARQUIVO_SEM_MAPEAMENTO = 'Locais sem mapeamento.csv'
+
+# Modo lote (--lote): relatórios já tratados, pelo hash do conteúdo, e o
+# resultado tratado de cada um (Parquet), usado para montar a saída combinada
+ARQUIVO_MANIFESTO = 'manifesto_jwm.json'
+PASTA_TRATADOS = 'tratados'
+# Formatos e larguras das colunas da planilha final (CNPJs como número sem casas decimais)
+FORMATOS_COLUNAS = {'CNPJ ORIGEM': '0', 'CNPJ DESTINO': '0'}
+LARGURAS_COLUNAS = {'N° OC': 10, 'Nft': 15, 'Origem': 10, 'CNPJ ORIGEM': 18, 'Destino': 10, 'CNPJ DESTINO': 18,
+                    'Data inclusão': 15, 'Data expedida': 15, 'Data chegada': 15}
+# Uma linha por CT-e + nota fiscal na saída combinada
+CHAVE_COMBINADA = ['N° OC', 'Nft']
+
+# --- Parte 3: Tratamento (vetorizado) ---
+
+def aplicar_por_valor(serie, funcao):
+    """
+    Aplica `funcao` (Series -> Series) só aos valores distintos da coluna e
+    espalha o resultado pelas linhas. CNPJs e cidades se repetem muito:
+    o trabalho de texto é feito uma vez por valor, não uma vez por linha.
+    """
+    codigos, valores = pd.factorize(serie)
+    resultado = funcao(pd.Series(valores, dtype=serie.dtype)).to_numpy(dtype=object).take(codigos)
+    # Vazios (código -1) passam pela função como estão (None e NaN dão resultados diferentes)
+    vazios = codigos == -1
+    if vazios.any():
+        resultado[vazios] = funcao(serie[vazios]).to_numpy(dtype=object)
+    return pd.Series(resultado, index=serie.index)
+
 
-try:
-    # ETAPA 1: Ler e fazer o tratamento inicial do arquivo
-    arquivo_entrada = encontrar_relatorio_recente()
-    print(f"ETAPA 1: Processando o arquivo '{os.path.basename(arquivo_entrada)}'")
+def cnpj_como_texto(serie):
+    """CNPJ numérico como texto sem casas decimais ('<NA>' quando vazio)."""
+    return pd.to_numeric(serie, errors='coerce').astype('Int64').astype(str)
 
-    colunas = ['N° CT-e', 'Notas Fiscais', 'Cidade origem', 'CPF/CNPJ Remetente', 
-               'Cidade destino', 'CPF/CNPJ Destinatário', 'Data Frete', 'Data Entrega']
-    df = pd.read_excel(arquivo_entrada, usecols=colunas)
 
-    df['Data Frete'] = pd.to_datetime(df['Data Frete'], dayfirst=True)
-    df['Data Entrega'] = pd.to_datetime(df['Data Entrega'], dayfirst=True, errors='coerce')
+def cidade_codificada(serie, indice):
+    """
+    Código do local pelo nome da cidade (sem diferenciar acentos); cidades fora
+    da tabela seguem com o nome sem espaços nas pontas, em maiúsculas.
+    """
+    cidades = serie.str.strip().str.upper()
+    return codigo_cidade(cidades, indice).fillna(cidades)
 
-    new_rows = []
-    for index, row in df.iterrows():
-        notas_fiscais = str(row['Notas Fiscais']).split(', ')
-        for nota in notas_fiscais:
-            new_row = row.copy()
-            new_row['Notas Fiscais'] = nota
-            new_rows.append(new_row)
 
-    df_processado = pd.DataFrame(new_rows)
+def explodir_notas(df):
+    """Uma linha por nota fiscal: 'Notas Fiscais' com '123, 456' vira duas linhas."""
+    notas = df['Notas Fiscais'].astype(str).str.split(', ', regex=False)
+    return df.assign(**{'Notas Fiscais': notas}).explode('Notas Fiscais')
 
-    df_processado['CPF/CNPJ Remetente'] = pd.to_numeric(df_processado['CPF/CNPJ Remetente'], errors='coerce')
-    df_processado['CPF/CNPJ Destinatário'] = pd.to_numeric(df_processado['CPF/CNPJ Destinatário'], errors='coerce')
 
+def tratar_relatorio(df, indice=None):
+    """
+    ETAPAS 1 a 3 sobre o relatório de CT-e lido (colunas COLUNAS_ENTRADA):
+    explode as notas fiscais, codifica origem/destino pelo CNPJ (ou pela
+    cidade, quando o CNPJ não está na tabela de locais) e monta as colunas finais.
+    `indice` é o índice da tabela de locais (mapeamento_locais.carregar_indice).
+    """
+    indice = indice if indice is not None else carregar_indice()
+    df = df.assign(**{
+        'Data Frete': pd.to_datetime(df['Data Frete'], dayfirst=True),
+        'Data Entrega': pd.to_datetime(df['Data Entrega'], dayfirst=True, errors='coerce'),
+    })
+    df = explodir_notas(df)
     print("✔ ETAPA 1: Tratamento inicial concluído.")
 
-    # ETAPA 2: Aplicar a lógica de mapeamento (DE-PARA)
     print("\nETAPA 2: Aplicando mapeamento de CNPJ e Cidades para códigos...")
+    cnpj_origem = aplicar_por_valor(df['CPF/CNPJ Remetente'], cnpj_como_texto)
+    cnpj_destino = aplicar_por_valor(df['CPF/CNPJ Destinatário'], cnpj_como_texto)
+    cidade = partial(cidade_codificada, indice=indice)
+    origem = aplicar_por_valor(cnpj_origem, partial(codigo_cnpj, indice=indice))
+    origem = origem.fillna(aplicar_por_valor(df['Cidade origem'], cidade))
+    destino = aplicar_por_valor(cnpj_destino, partial(codigo_cnpj, indice=indice))
+    destino = destino.fillna(aplicar_por_valor(df['Cidade destino'], cidade))
+    print("✔ ETAPA 2: Mapeamento concluído.")
 
-    map_cnpj = {
-        '2012862022996': 'CML', '2012862002294': 'GRU', '2012862001050': 'SDU',
-        '2012862002456': 'GIG', '2012862006109': 'MRO', '2012862000917': 'CGH'
-    }
-    map_cidades = {
-        'ARACAJU': 'AJU', 'BELÉM': 'BEL', 'BOA VISTA': 'BVB', 'BRASÍLIA': 'BSB', 'CAMPO GRANDE': 'CGR',
-        'CONFINS': 'CNF', 'CURITIBA': 'CWB', 'FLORIANÓPOLIS': 'FLN', 'FORTALEZA': 'FOR',
-        'FOZ DO IGUACU': 'IGU', 'GOIANIA': 'GYN', 'ILHEUS': 'IOS', 'IMPERATRIZ': 'IMP',
-        'JAGUARUNA': 'JJG', 'BAYEUX': 'JPA', 'JOINVILLE': 'JOI', 'LONDRINA': 'LDB', 'MACAPA': 'MCP',
-        'MANAUS': 'MAO', 'MARABA': 'MAB', 'MARINGA': 'MGF', 'NAVEGANTES': 'NVT', 'PALMAS': 'PMW',
-        'PORTO ALEGRE': 'POA', 'PORTO SEGURO': 'BPS', 'PORTO VELHO': 'PVH', 'RECIFE': 'REC',
-        'RIBEIRAO PRETO': 'RAO', 'RIO BRANCO': 'RBR', 'RIO LARGO': 'MCZ',
-        'SAO JOSE DO RIO PRETO': 'SJP', 'SALVADOR': 'SSA', 'SANTAREM': 'STM', 'SAO LUIS': 'SLZ',
-        'TERESINA': 'THE', 'UBERLANDIA': 'UDI', 'VARZEA GRANDE': 'CGB', 'CAMPINAS': 'VCP',
-        'VITORIA': 'VIX', 'CHAPECO': 'XAP', 'SINOP': 'OPS', 'AGUA VERMELHA (SAO CARLOS)': 'MRO',
-        'SÃO GONÇALO DO AMARANTE': 'NAT', 'SÃO JOSÉ DOS PINHAIS': 'CWB', 'GUARULHOS': 'CML',
-        'SÃO PAULO': 'CGH', 'SÃO CARLOS': 'MRO'
-    }
-    
-    df_codificado = df_processado.copy()
-    
-    df_codificado['CPF/CNPJ Remetente'] = df_codificado['CPF/CNPJ Remetente'].astype('Int64').astype(str)
-    df_codificado['CPF/CNPJ Destinatário'] = df_codificado['CPF/CNPJ Destinatário'].astype('Int64').astype(str)
-    
-    df_codificado['Origem_Codificada'] = df_codificado['CPF/CNPJ Remetente'].map(map_cnpj)
-    df_codificado['Destino_Codificada'] = df_codificado['CPF/CNPJ Destinatário'].map(map_cnpj)
+    return pd.DataFrame({
+        'N° OC': df['N° CT-e'],
+        'Nft': df['Notas Fiscais'],
+        'Origem': origem,
+        'CNPJ ORIGEM': cnpj_origem,
+        'Destino': destino,
+        'CNPJ DESTINO': cnpj_destino,
+        'Data inclusão': df['Data Frete'],
+        'Data expedida': df['Data Frete'],
+        'Data chegada': df['Data Entrega'],
+    })
 
-    map_cidade_origem = df_codificado['Cidade origem'].str.strip().str.upper().replace(map_cidades)
-    map_cidade_destino = df_codificado['Cidade destino'].str.strip().str.upper().replace(map_cidades)
-    
-    df_codificado['Origem_Codificada'] = df_codificado['Origem_Codificada'].fillna(map_cidade_origem)
-    df_codificado['Destino_Codificada'] = df_codificado['Destino_Codificada'].fillna(map_cidade_destino)
-    
-    print("✔ ETAPA 2: Mapeamento concluído.")
 
-    # ETAPA 3: REORGANIZAR, RENOMEAR E SALVAR O ARQUIVO FINAL
-    print("\nETAPA 3: Reorganizando colunas e salvando o arquivo final...")
-    
-    df_final = pd.DataFrame()
-
-    df_final['N° OC'] = df_codificado['N° CT-e']
-    df_final['Nft'] = df_codificado['Notas Fiscais']
-    df_final['Origem'] = df_codificado['Origem_Codificada']
-    df_final['CNPJ ORIGEM'] = df_codificado['CPF/CNPJ Remetente']
-    df_final['Destino'] = df_codificado['Destino_Codificada']
-    df_final['CNPJ DESTINO'] = df_codificado['CPF/CNPJ Destinatário']
-    df_final['Data inclusão'] = df_codificado['Data Frete']
-    df_final['Data expedida'] = df_codificado['Data Frete']
-    df_final['Data chegada'] = df_codificado['Data Entrega']
-
-    data_processamento = datetime.now().strftime('%d-%m-%Y_%Hh%M')
-    arquivo_codificado = f'Relatório Tratado.xlsx'
-    
-    with pd.ExcelWriter(arquivo_codificado,
-                        engine='xlsxwriter',
-                        datetime_format='d/m/yy h:mm') as writer:
-        
-        df_final.to_excel(writer, sheet_name='Sheet1', index=False)
-
-        workbook  = writer.book
-        worksheet = writer.sheets['Sheet1']
-
-        formato_inteiro = workbook.add_format({'num_format': '0'})
-        worksheet.set_column('D:D', 18, formato_inteiro)
-        worksheet.set_column('F:F', 18, formato_inteiro)
-        
-        worksheet.set_column('A:A', 10)
-        worksheet.set_column('B:B', 15)
-        worksheet.set_column('C:C', 10)
-        worksheet.set_column('E:E', 10)
-        worksheet.set_column('G:I', 15)
-
-    print(f"✔ ETAPA 3: Arquivo final salvo como '{arquivo_codificado}'")
-    print(f"\nProcesso completo finalizado com sucesso!")
-    print(f"Caminho do arquivo final: {os.path.abspath(arquivo_codificado)}")
-
-except FileNotFoundError as e:
-    print(f"\n❌ ERRO: {e}")
-except Exception as e:
-    print(f"\n❌ Ocorreu um erro inesperado: {e}")
\ No newline at end of file
+def listar_sem_mapeamento(df, indice=None):
+    """
+    CNPJs e cidades de origem/destino que não estão na tabela de locais (nem
+    pelo CNPJ, nem pela cidade), com a quantidade de CT-e de cada um.
+    """
+    indice = indice if indice is not None else carregar_indice()
+    partes = []
+    for lado, coluna_cnpj, coluna_cidade in (('Origem', 'CPF/CNPJ Remetente', 'Cidade origem'),
+                                              ('Destino', 'CPF/CNPJ Destinatário', 'Cidade destino')):
+        pares = df.groupby([coluna_cnpj, coluna_cidade], dropna=False).size().reset_index(name='CT-e')
+        cnpj = cnpj_como_texto(pares[coluna_cnpj])
+        cidade = pares[coluna_cidade].astype('string').str.strip().str.upper()
+        sem_codigo = (codigo_cnpj(cnpj, indice).isna() & codigo_cidade(cidade, indice).isna()).to_numpy()
+        partes.append(pd.DataFrame({'Lado': lado, 'CNPJ': cnpj[sem_codigo], 'Cidade': cidade[sem_codigo],
+                                    'CT-e': pares['CT-e'][sem_codigo]}))
+    return pd.concat(partes, ignore_index=True).sort_values('CT-e', ascending=False, ignore_index=True)
+
+
+def salvar_relatorio(df_final, arquivo_codificado=ARQUIVO_SAIDA, formato=None):
+    """
+    Grava o relatório tratado em planilha (com os formatos de coluna da
+    planilha final), CSV ou Parquet, conforme a extensão ou o `formato`.
+    A planilha é gravada em fluxo (constant_memory), linha a linha.
+    """
+    return gravar_tabela(df_final, arquivo_codificado, formato,
+                         formatos_colunas=FORMATOS_COLUNAS, larguras=LARGURAS_COLUNAS)
+
+
+# --- Parte 4: Modo lote ---
+
+def listar_relatorios(origem):
+    """Relatórios de uma pasta ('Relatório*.xlsx') ou de um padrão glob, do mais antigo para o mais recente."""
+    padrao = os.path.join(origem, 'Relatório*.xlsx') if os.path.isdir(origem) else origem
+    arquivos = [a for a in glob.glob(padrao)
+                if os.path.isfile(a) and not os.path.basename(a).startswith('~$')]
+    return sorted(arquivos, key=os.path.getmtime)
+
+
+def ler_manifesto(pasta_saida):
+    """Manifesto do lote: {hash: {arquivo, tratado, saida, linhas, processado_em}}."""
+    try:
+        with open(os.path.join(pasta_saida, ARQUIVO_MANIFESTO), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def salvar_manifesto(pasta_saida, manifesto):
+    """Grava o manifesto de forma atômica (arquivo temporário + rename)."""
+    caminho = os.path.join(pasta_saida, ARQUIVO_MANIFESTO)
+    with open(caminho + '.tmp', 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, indent=1, ensure_ascii=False)
+    os.replace(caminho + '.tmp', caminho)
+
+
+def nome_saida_individual(arquivo, formato):
+    return f"{os.path.splitext(os.path.basename(arquivo))[0]} - Tratado{FORMATOS_SAIDA[formato]}"
+
+
+def ja_processado(entrada, pasta_saida, saida=None):
+    """O relatório está no manifesto e os arquivos que ele gerou (inclusive a `saida` pedida) ainda existem."""
+    if entrada is None or not os.path.exists(os.path.join(pasta_saida, entrada['tratado'])):
+        return False
+    return saida is None or entrada.get('saida') == saida and os.path.exists(os.path.join(pasta_saida, saida))
+
+
+def processar_relatorio(arquivo, hash_arquivo, pasta_saida, por_arquivo, formato=FORMATO_SAIDA_JWM):
+    """
+    Trata um relatório (roda num processo do pool): grava o resultado em
+    Parquet e, com `por_arquivo`, também a saída própria dele no `formato`.
+    Retorna a entrada do manifesto e os locais sem mapeamento.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = pd.read_excel(arquivo, usecols=COLUNAS_ENTRADA)
+        indice = carregar_indice()
+        df_final = tratar_relatorio(df, indice)
+        sem_mapeamento = listar_sem_mapeamento(df, indice)
+
+    tratado = os.path.join(PASTA_TRATADOS, f"{hash_arquivo[:16]}.parquet")
+    caminho_tratado = os.path.join(pasta_saida, tratado)
+    preparar_para_parquet(df_final).to_parquet(caminho_tratado + '.tmp', index=False)
+    os.replace(caminho_tratado + '.tmp', caminho_tratado)
+
+    saida = None
+    if por_arquivo:
+        saida = nome_saida_individual(arquivo, formato)
+        salvar_relatorio(df_final, os.path.join(pasta_saida, saida), formato)
+
+    entrada = {'arquivo': os.path.abspath(arquivo), 'tratado': tratado, 'saida': saida,
+               'linhas': len(df_final), 'processado_em': datetime.now().isoformat(timespec='seconds')}
+    return entrada, sem_mapeamento
+
+
+def combinar_tratados(pasta_saida, entradas):
+    """Junta os resultados tratados (na ordem dos relatórios) com uma linha por CT-e + nota fiscal; a mais recente vale."""
+    partes = [pd.read_parquet(os.path.join(pasta_saida, entrada['tratado'])) for entrada in entradas]
+    combinado = pd.concat(partes, ignore_index=True)
+    return combinado.drop_duplicates(CHAVE_COMBINADA, keep='last', ignore_index=True)
+
+
+def processar_lote(origem, pasta_saida='.', por_arquivo=False, processos=None, reprocessar=False,
+                   formato=FORMATO_SAIDA_JWM):
+    """
+    Trata todos os relatórios de `origem` (pasta ou padrão glob) num pool de
+    processos. Relatórios cujo conteúdo já está no manifesto são pulados.
+    Sem `por_arquivo`, grava uma saída combinada com todos os relatórios
+    da origem (inclusive os pulados), sem CT-e + nota fiscal repetidos.
+    """
+    arquivos = listar_relatorios(origem)
+    if not arquivos:
+        raise FileNotFoundError(f"Nenhum relatório encontrado em '{origem}'")
+    os.makedirs(os.path.join(pasta_saida, PASTA_TRATADOS), exist_ok=True)
+
+    # Compila a tabela de locais uma vez aqui; os processos só leem o índice do cache
+    carregar_indice()
+
+    manifesto = {} if reprocessar else ler_manifesto(pasta_saida)
+    hashes = {arquivo: calcular_hash(arquivo) for arquivo in arquivos}
+    pendentes = {}
+    for arquivo, hash_arquivo in hashes.items():
+        saida = nome_saida_individual(arquivo, formato) if por_arquivo else None
+        if ja_processado(manifesto.get(hash_arquivo), pasta_saida, saida) or hash_arquivo in pendentes.values():
+            print(f"  = {os.path.basename(arquivo)} (já processado)")
+        else:
+            pendentes[arquivo] = hash_arquivo
+    print(f"{len(arquivos)} relatório(s) em '{origem}', {len(pendentes)} a processar.")
+
+    falhas = []
+    sem_mapeamento = []
+    if pendentes:
+        processos = max(1, min(processos or os.cpu_count() or 1, len(pendentes)))
+        with ProcessPoolExecutor(max_workers=processos) as pool:
+            futuros = {pool.submit(processar_relatorio, arquivo, hash_arquivo, pasta_saida, por_arquivo, formato): arquivo
+                       for arquivo, hash_arquivo in pendentes.items()}
+            for futuro in as_completed(futuros):
+                arquivo = futuros[futuro]
+                try:
+                    entrada, locais = futuro.result()
+                except Exception as e:
+                    falhas.append(arquivo)
+                    print(f"  ❌ {os.path.basename(arquivo)}: {e}")
+                    continue
+                manifesto[pendentes[arquivo]] = entrada
+                sem_mapeamento.append(locais)
+                # Grava a cada relatório: uma interrupção não perde o que já foi tratado
+                salvar_manifesto(pasta_saida, manifesto)
+                print(f"  ✔ {os.path.basename(arquivo)}: {entrada['linhas']} linha(s)")
+
+    if sem_mapeamento:
+        locais = pd.concat(sem_mapeamento, ignore_index=True)
+        if len(locais):
+            locais = (locais.groupby(['Lado', 'CNPJ', 'Cidade'], dropna=False)['CT-e'].sum()
+                      .reset_index().sort_values('CT-e', ascending=False, ignore_index=True))
+            caminho = os.path.join(pasta_saida, ARQUIVO_SEM_MAPEAMENTO)
+            locais.to_csv(caminho, sep=';', index=False, encoding='utf-8-sig')
+            print(f"⚠ {len(locais)} CNPJ/cidade(s) fora da tabela de locais, lista em '{caminho}'.")
+
+    if not por_arquivo:
+        entradas = [manifesto[h] for h in dict.fromkeys(hashes.values()) if h in manifesto]
+        if entradas:
+            combinado = combinar_tratados(pasta_saida, entradas)
+            caminho = os.path.join(pasta_saida, caminho_com_formato(ARQUIVO_SAIDA, formato))
+            salvar_relatorio(combinado, caminho, formato)
+            print(f"✔ Saída combinada ({len(entradas)} relatório(s), {len(combinado)} linha(s)) salva em '{caminho}'")
+
+    if falhas:
+        print(f"❌ {len(falhas)} relatório(s) com erro; serão tentados de novo na próxima execução.")
+    return falhas
+
+
+# --- Início do processamento principal ---
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Tratamento do relatório de CT-e da transportadora")
+    parser.add_argument('--lote', metavar='PASTA_OU_PADRAO',
+                        help="Trata todos os relatórios da pasta ('Relatório*.xlsx') ou do padrão glob")
+    parser.add_argument('--por-arquivo', action='store_true',
+                        help="No modo lote, grava uma planilha por relatório em vez da combinada")
+    parser.add_argument('--formato', choices=list(FORMATOS_SAIDA), default=FORMATO_SAIDA_JWM,
+                        help="Formato da saída: planilha (padrão, JWM_FORMATO_SAIDA), csv ou parquet")
+    parser.add_argument('--pasta-saida', default='.', help="Pasta das planilhas e do manifesto do modo lote")
+    parser.add_argument('--processos', type=int, help="Processos do modo lote (padrão: um por núcleo)")
+    parser.add_argument('--reprocessar', action='store_true',
+                        help="Ignora o manifesto e trata de novo todos os relatórios")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    argumentos = ler_argumentos()
+    try:
+        if argumentos.lote:
+            falhas = processar_lote(argumentos.lote, argumentos.pasta_saida, argumentos.por_arquivo,
+                                    argumentos.processos, argumentos.reprocessar, argumentos.formato)
+            raise SystemExit(1 if falhas else 0)
+
+        # ETAPA 1: Ler e fazer o tratamento inicial do arquivo
+        arquivo_entrada = encontrar_relatorio_recente()
+        print(f"ETAPA 1: Processando o arquivo '{os.path.basename(arquivo_entrada)}'")
+        df = pd.read_excel(arquivo_entrada, usecols=COLUNAS_ENTRADA)
+
+        indice = carregar_indice()
+        df_final = tratar_relatorio(df, indice)
+
+        sem_mapeamento = listar_sem_mapeamento(df, indice)
+        if len(sem_mapeamento):
+            sem_mapeamento.to_csv(ARQUIVO_SEM_MAPEAMENTO, sep=';', index=False, encoding='utf-8-sig')
+            print(f"⚠ {len(sem_mapeamento)} CNPJ/cidade(s) fora da tabela de locais "
+                  f"(mantidos com o nome da cidade), lista em '{ARQUIVO_SEM_MAPEAMENTO}':")
+            print(sem_mapeamento.head(10).to_string(index=False))
+
+        # ETAPA 3: REORGANIZAR, RENOMEAR E SALVAR O ARQUIVO FINAL
+        print("\nETAPA 3: Reorganizando colunas e salvando o arquivo final...")
+        arquivo_saida = caminho_com_formato(ARQUIVO_SAIDA, argumentos.formato)
+        salvar_relatorio(df_final, arquivo_saida, argumentos.formato)
+
+        print(f"✔ ETAPA 3: Arquivo final salvo como '{arquivo_saida}'")
+        print(f"\nProcesso completo finalizado com sucesso!")
+        print(f"Caminho do arquivo final: {os.path.abspath(arquivo_saida)}")
+
+    except FileNotFoundError as e:
+        print(f"\n❌ ERRO: {e}")
+    except Exception as e:
+        print(f"\n❌ Ocorreu um erro inesperado: {e}")
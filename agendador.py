@@ -0,0 +1,160 @@
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from functools import partial
+
+
+@dataclass
+class Etapa:
+    """
+    Uma etapa do processo: o que ela lê (entradas), o que ela grava (saídas)
+    e a função que a executa. As dependências entre etapas são deduzidas
+    dos arquivos: uma etapa só começa quando todas as suas entradas
+    produzidas por outras etapas estiverem prontas.
+    """
+    nome: str
+    funcao: object
+    entradas: list = field(default_factory=list)
+    saidas: list = field(default_factory=list)
+    # Etapas de SAP recebem uma sessão; etapas de pandas rodam sem ocupar sessão
+    usa_sessao: bool = True
+    # Com um número, a etapa recebe a lista de funções que abrem até essa
+    # quantidade de sessões (as que estiverem livres, no mínimo uma), em vez da sessão
+    sessoes: int = None
+
+
+def montar_dependencias(etapas):
+    """
+    Retorna {nome_da_etapa: conjunto de etapas das quais ela depende}.
+    Entradas que nenhuma etapa produz são consideradas arquivos externos.
+    """
+    produtor = {}
+    for etapa in etapas:
+        for saida in etapa.saidas:
+            if saida in produtor:
+                raise ValueError(f"O arquivo '{saida}' é gerado por '{produtor[saida]}' e por '{etapa.nome}'.")
+            produtor[saida] = etapa.nome
+
+    dependencias = {
+        etapa.nome: {produtor[entrada] for entrada in etapa.entradas if entrada in produtor}
+        for etapa in etapas
+    }
+
+    # Verifica se não há ciclo (ordenação topológica)
+    restantes = {nome: set(deps) for nome, deps in dependencias.items()}
+    while restantes:
+        livres = [nome for nome, deps in restantes.items() if not deps]
+        if not livres:
+            raise ValueError(f"Dependência circular entre as etapas: {sorted(restantes)}")
+        for nome in livres:
+            del restantes[nome]
+        for deps in restantes.values():
+            deps.difference_update(livres)
+    return dependencias
+
+
+def calcular_prioridades(dependencias):
+    """
+    Prioridade de cada etapa = tamanho da maior cadeia de etapas que depende dela.
+    Etapas do caminho crítico ganham as sessões livres primeiro.
+    """
+    dependentes = {nome: set() for nome in dependencias}
+    for nome, deps in dependencias.items():
+        for dep in deps:
+            dependentes[dep].add(nome)
+
+    prioridades = {}
+
+    def altura(nome):
+        if nome not in prioridades:
+            prioridades[nome] = 1 + max((altura(d) for d in dependentes[nome]), default=0)
+        return prioridades[nome]
+
+    for nome in dependencias:
+        altura(nome)
+    return prioridades
+
+
+def executar_etapas(etapas, abrir_sessao, max_sessoes=1, rastreador=None, manifesto=None):
+    """
+    Executa as etapas respeitando as dependências, rodando ao mesmo tempo as
+    que já estão prontas, com no máximo `max_sessoes` etapas de SAP em paralelo.
+
+    `abrir_sessao(indice)` é chamada dentro da thread da etapa e deve devolver
+    a sessão SAP de número `indice` (0 até max_sessoes - 1) utilizável nela.
+    Etapas com `sessoes` recebem [partial(abrir_sessao, indice), ...] e abrem
+    cada sessão na thread em que for usada.
+    Com um `rastreador` (rastreamento.Rastreador), cada etapa é medida e as
+    chamadas COM feitas nas suas sessões são contadas.
+    Com um `manifesto` (retomada.ManifestoExecucao), cada etapa concluída é
+    registrada com o hash dos seus arquivos, para a retomada após uma falha.
+    Retorna {nome_da_etapa: segundos gastos}.
+    """
+    dependencias = montar_dependencias(etapas)
+    prioridades = calcular_prioridades(dependencias)
+    pendentes = sorted(etapas, key=lambda e: -prioridades[e.nome])
+    concluidas = set()
+    sessoes_livres = list(range(max_sessoes))
+    em_execucao = {}
+    tempos = {}
+    erro = None
+
+    def abrir_contada(registro, indice):
+        return registro.instrumentar(abrir_sessao(indice))
+
+    def rodar(etapa, indices_sessao):
+        if manifesto is not None:
+            manifesto.iniciar(etapa)
+        inicio = time.perf_counter()
+        medir = rastreador.etapa(etapa.nome, etapa.entradas, etapa.saidas) if rastreador else nullcontext()
+        with medir as registro:
+            abrir = partial(abrir_contada, registro) if registro is not None else abrir_sessao
+            if etapa.usa_sessao and etapa.sessoes is not None:
+                etapa.funcao([partial(abrir, indice) for indice in indices_sessao])
+            elif etapa.usa_sessao:
+                etapa.funcao(abrir(indices_sessao[0]))
+            else:
+                etapa.funcao()
+        segundos = time.perf_counter() - inicio
+        if manifesto is not None:
+            manifesto.concluir(etapa)
+        return segundos
+
+    with ThreadPoolExecutor(max_workers=max_sessoes + len(etapas)) as executor:
+        while (pendentes and erro is None) or em_execucao:
+            # Dispara todas as etapas prontas enquanto houver sessão livre
+            for etapa in list(pendentes) if erro is None else []:
+                if not dependencias[etapa.nome] <= concluidas:
+                    continue
+                indices_sessao = []
+                if etapa.usa_sessao:
+                    if not sessoes_livres:
+                        continue
+                    sessoes_livres.sort()
+                    quantidade = min(etapa.sessoes or 1, len(sessoes_livres))
+                    indices_sessao = sessoes_livres[:quantidade]
+                    del sessoes_livres[:quantidade]
+                pendentes.remove(etapa)
+                print(f"▶ Iniciando etapa {etapa.nome}" +
+                      (f" (sessão {', '.join(map(str, indices_sessao))})" if indices_sessao else ""))
+                futuro = executor.submit(rodar, etapa, indices_sessao)
+                em_execucao[futuro] = (etapa, indices_sessao)
+
+            prontos, _ = wait(list(em_execucao), return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                etapa, indices_sessao = em_execucao.pop(futuro)
+                sessoes_livres.extend(indices_sessao)
+                try:
+                    tempos[etapa.nome] = futuro.result()
+                    concluidas.add(etapa.nome)
+                    print(f"✔ Etapa {etapa.nome} concluída em {tempos[etapa.nome]:.1f}s")
+                except Exception as e:
+                    # Não inicia novas etapas, mas espera as que já estão rodando
+                    print(f"❌ Etapa {etapa.nome} falhou: {e}")
+                    if erro is None:
+                        erro = e
+
+    if erro is not None:
+        raise erro
+    return tempos
@@ -0,0 +1,117 @@
+"""
+Conta as idas e voltas COM de cada extração SE16N no SAP GUI falso, com os
+campos da mesma tela preenchidos juntos (sap_espera.preencher) e campo a campo
+(uma espera da sessão por campo, como antes). As chamadas são contadas pelo
+rastreamento (rastreamento.ObjetoContado). Cada chamada do SAP falso custa a
+latência --latencia, como uma ida e volta ao SAP GUI.
+
+O que sobra por extração é uma busca (findById) e uma ação por passo da tela,
+mais as esperas (Busy) da consulta e da exportação: a extração exporta o ALV
+para arquivo, sem ler células da grade, então não há leitura linha a linha
+para juntar.
+
+Uso: python benchmark_chamadas_com.py [--linhas N] [--repeticoes N] [--latencia S]
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark das chamadas COM das extrações SE16N")
+    parser.add_argument('--linhas', type=int, default=5_000, help="Linhas da ZPMMT_287 sintética")
+    parser.add_argument('--repeticoes', type=int, default=3, help="Extrações por tabela e modo")
+    parser.add_argument('--latencia', type=float, default=0.001, help="Segundos de cada ida e volta COM")
+    argumentos = parser.parse_args()
+    argumentos.formato = 'txt'
+    argumentos.formato_ontime = 'parquet'
+    argumentos.backend = 'gui'
+    argumentos.sessoes = 1
+    return argumentos
+
+
+def preencher_campo_a_campo(session, campos, timeout=None):
+    """O preenchimento anterior ao sap_espera.preencher: espera a sessão antes de cada campo."""
+    from sap_espera import aguardar_elemento
+    for id_elemento, valor in campos.items():
+        aguardar_elemento(session, id_elemento, timeout).text = valor
+
+
+def extrair(rastreador, session, spec, pasta, em_conjunto):
+    """Uma extração da tabela. Retorna (segundos, chamadas COM por tipo, linhas exportadas)."""
+    import sap_espera
+    import sap_se16n
+
+    sap_se16n.preencher = sap_espera.preencher if em_conjunto else preencher_campo_a_campo
+    with rastreador.etapa(spec.tabela) as registro:
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultado = sap_se16n.extrair_tabela(registro.instrumentar(session), spec, pasta)
+        segundos = time.perf_counter() - inicio
+    return segundos, registro.chamadas_com, resultado.linhas
+
+
+def resumir(chamadas):
+    busy = chamadas.get('leitura:Busy', 0)
+    find = sum(n for nome, n in chamadas.items() if nome.lower() == 'findbyid')
+    total = sum(chamadas.values())
+    return total, find, busy, total - find - busy
+
+
+if __name__ == '__main__':
+    argumentos = ler_argumentos()
+    raiz = os.path.join(tempfile.mkdtemp(prefix='benchmark_chamadas_com_'), 'ONTIME')
+    from benchmark_sap import preparar_ambiente
+    preparar_ambiente(argumentos, raiz)
+    os.makedirs(raiz)
+    try:
+        from benchmark_sessoes import login_completo
+        from gravador_tabelas import gravar_chaves
+        from rastreamento import Rastreador
+        from sap_fake import LatenciaFalsa, MotorSapFalso, gerar_tabelas
+        from sap_se16n import TABELAS
+
+        tabelas = gerar_tabelas(argumentos.linhas)
+        motor = MotorSapFalso(tabelas, LatenciaFalsa(chamada=argumentos.latencia))
+        rastreador = Rastreador(pasta=os.path.join(raiz, 'rastreamento'))
+        with rastreador.etapa('LOGIN') as registro:
+            session = motor.findById(login_completo(motor, 1, registro)[0])
+        for spec in TABELAS.values():
+            chaves = tabelas[spec.tabela][spec.campos[spec.campo_chave]].drop_duplicates()
+            gravar_chaves(chaves, os.path.join(raiz, spec.arquivo_chaves))
+
+        print(f"Chamadas COM por extração ({argumentos.latencia * 1000:.1f} ms cada), "
+              f"média de {argumentos.repeticoes} extrações por tabela e modo")
+        print(f"  {'tabela':<10} {'campos':<12} {'total':>6} {'findById':>9} {'Busy':>6} {'outras':>7} {'tempo':>8}")
+        totais = {False: [0, 0.0], True: [0, 0.0]}
+        for spec in TABELAS.values():
+            linhas = {}
+            for em_conjunto in (False, True):
+                medicoes = [extrair(rastreador, session, spec, raiz, em_conjunto)
+                            for _ in range(argumentos.repeticoes)]
+                # A espera da consulta e da exportação varia um pouco de uma extração para outra
+                total, find, busy, outras = (round(pd.Series(v).mean()) for v in
+                                             zip(*(resumir(chamadas) for _, chamadas, _ in medicoes)))
+                segundos = pd.Series([s for s, _, _ in medicoes]).mean()
+                linhas[em_conjunto] = {n for _, _, n in medicoes}
+                totais[em_conjunto][0] += total
+                totais[em_conjunto][1] += segundos
+                modo = 'em conjunto' if em_conjunto else 'um a um'
+                print(f"  {spec.tabela:<10} {modo:<12} {total:>6} {find:>9} {busy:>6} {outras:>7} {segundos:7.3f}s")
+            if linhas[False] != linhas[True]:
+                raise AssertionError(f"{spec.tabela}: linhas diferentes nos dois modos ({linhas}).")
+        (antes, tempo_antes), (depois, tempo_depois) = totais[False], totais[True]
+        print(f"  {'todas':<10} {'um a um':<12} {antes:>6} {'':>24} {tempo_antes:7.3f}s")
+        print(f"  {'todas':<10} {'em conjunto':<12} {depois:>6} {'':>24} {tempo_depois:7.3f}s")
+        print(f"  ✔ {1 - depois / antes:.0%} menos chamadas COM, {1 - tempo_depois / tempo_antes:.0%} menos tempo, "
+              f"mesmas linhas exportadas")
+    finally:
+        shutil.rmtree(os.path.dirname(raiz), ignore_errors=True)
+    sys.exit(0)
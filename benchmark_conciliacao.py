@@ -0,0 +1,132 @@
+"""
+Mede a conciliação das notas da transportadora com a J_1BNFDOC
+(conciliacao_nf.py) e confere o resultado com o par verdadeiro de cada nota.
+
+Os relatórios sintéticos trazem as variações dos relatórios reais: número
+com zeros à esquerda, série junto do número ('12345-1', '000012345/001'),
+notas sem CNPJ, notas que não existem no SAP e um mesmo número de nota em
+emissores diferentes. Os relatórios são incluídos um a um, para medir a
+atualização incremental do índice de entregas.
+
+Uso: python benchmark_conciliacao.py [notas ...] [--relatorios N]
+     (padrão: 100000 1000000 notas no SAP, em 4 relatórios)
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+CNPJS = np.array([61064838000180, 61064838008530, 61064838012406, 33000167000101])
+
+
+def gerar_documentos(notas, semente=42):
+    """J_1BNFDOC sintética: cada número de nota aparece em dois emissores, com séries 1 e 2."""
+    rng = np.random.default_rng(semente)
+    return pd.DataFrame({
+        'Nº documento': 1_000_000 + np.arange(notas),
+        'Nº NF-e': 100_000 + np.arange(notas) // 2,
+        'Série': (np.arange(notas) % 2 + 1).astype(str),
+        'CNPJ emissor': CNPJS[(np.arange(notas) // 2 + np.arange(notas) % 2) % len(CNPJS)].astype(str),
+        'Data do documento': pd.Timestamp('2026-01-01') + pd.to_timedelta(rng.integers(0, 200, notas), unit='D'),
+    })
+
+
+def gerar_relatorios(documentos, quantidade, semente=42):
+    """
+    Relatórios tratados (colunas do JWM.py) com 80% das notas do SAP e 2% de
+    notas que não estão no SAP. Retorna (relatórios, par verdadeiro de cada
+    DOCNUM entregue: CT-e e se a nota veio sem CNPJ).
+    """
+    rng = np.random.default_rng(semente)
+    entregues = documentos.sample(frac=0.8, random_state=semente)
+    numero = entregues['Nº NF-e'].astype(str)
+    forma = rng.integers(0, 4, len(entregues))
+    nft = np.select([forma == 0, forma == 1, forma == 2],
+                    [numero + '-' + entregues['Série'],
+                     numero.str.zfill(9) + '/' + entregues['Série'].str.zfill(3),
+                     numero.str.zfill(9)],
+                    numero)
+    cnpj = entregues['CNPJ emissor'].where(forma != 3)
+    cte = 17_000 + np.arange(len(entregues))
+    esperado = pd.DataFrame({'cte': cte, 'sem_cnpj': forma == 3}, index=entregues['Nº documento'].to_numpy())
+    extras = max(1, len(documentos) // 50)
+    df = pd.DataFrame({
+        'N° OC': np.concatenate([cte, 90_000_000 + np.arange(extras)]),
+        'Nft': np.concatenate([nft, (900_000_000 + np.arange(extras)).astype(str)]),
+        'CNPJ ORIGEM': np.concatenate([cnpj.to_numpy(dtype=object), np.full(extras, '61064838000180', dtype=object)]),
+    })
+    expedida = pd.Timestamp('2026-01-01') + pd.to_timedelta(rng.integers(0, 200 * 24, len(df)), unit='h')
+    df['Data expedida'] = expedida
+    df['Data chegada'] = expedida + pd.to_timedelta(rng.integers(1, 10 * 24, len(df)), unit='h')
+    df = df.sample(frac=1, random_state=semente, ignore_index=True)
+    limites = np.linspace(0, len(df), quantidade + 1).astype(int)
+    return [df.iloc[a:b] for a, b in zip(limites[:-1], limites[1:])], esperado
+
+
+def executar(notas, relatorios, raiz):
+    from conciliacao_nf import ARQUIVO_SEM_SAP, conciliar_nf, incluir_relatorios
+    from leitor_sap import arquivo_exportado, gravar_exportacao
+
+    pasta = os.path.join(raiz, str(notas))
+    pasta_conciliacao = os.path.join(pasta, 'conciliacao')
+    os.makedirs(pasta)
+    documentos = gerar_documentos(notas)
+    gravar_exportacao(documentos, os.path.join(pasta, arquivo_exportado('J_1BNFDOC')))
+    partes, esperado = gerar_relatorios(documentos, relatorios)
+
+    print(f"\n{notas} notas no SAP, {sum(len(p) for p in partes)} notas da transportadora")
+    for posicao, parte in enumerate(partes, 1):
+        arquivo = os.path.join(pasta, f'Relatório {posicao} Tratado.parquet')
+        parte.to_parquet(arquivo, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            incluir_relatorios([arquivo], pasta_conciliacao)
+        print(f"  inclusão do relatório {posicao} ({len(parte)} notas) {time.perf_counter() - inicio:8.2f}s")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        incluir_relatorios([os.path.join(pasta, f'Relatório {p} Tratado.parquet') for p in range(1, relatorios + 1)],
+                           pasta_conciliacao)
+        tempo_repetido = time.perf_counter() - inicio
+        # A primeira leitura converte a J_1BNFDOC para o cache colunar (no SAP.py quem
+        # paga a conversão é a primeira etapa que lê a tabela)
+        tempos = []
+        for _ in range(2):
+            inicio = time.perf_counter()
+            conciliadas = conciliar_nf(pasta, pasta_conciliacao, 'parquet')
+            tempos.append(time.perf_counter() - inicio)
+    print(f"  relatórios já incluídos        {tempo_repetido:8.2f}s")
+    print(f"  conciliação (com a conversão)  {tempos[0]:8.2f}s")
+    print(f"  conciliação (cache colunar)    {tempos[1]:8.2f}s")
+
+    obtido = conciliadas.dropna(subset=['CT-e']).set_index('Nº documento')['CT-e'].astype('int64')
+    errados = (obtido != esperado['cte'].reindex(obtido.index)).sum()
+    if errados:
+        raise AssertionError(f"{errados} nota(s) conciliada(s) com a entrega errada.")
+    # Com CNPJ, toda nota entregue precisa achar o par; sem CNPJ, só quando o número não é ambíguo
+    faltando = esperado.index[~esperado['sem_cnpj']].difference(obtido.index)
+    if len(faltando):
+        raise AssertionError(f"{len(faltando)} nota(s) com CNPJ sem par, ex.: {list(faltando[:5])}")
+    sem_sap = pd.read_csv(os.path.join(pasta_conciliacao, ARQUIVO_SEM_SAP), sep=';', encoding='utf-8-sig')
+    print(f"  {len(obtido)} de {len(esperado)} notas entregues conciliadas, nenhuma com o par errado; "
+          f"{len(sem_sap)} da transportadora sem par")
+    print("  " + conciliadas['Critério'].value_counts().to_string().replace('\n', '\n  '))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark da conciliação de notas fiscais")
+    parser.add_argument('notas', nargs='*', type=int, default=[100_000, 1_000_000])
+    parser.add_argument('--relatorios', type=int, default=4)
+    argumentos = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as raiz:
+        # configuracao.py lê o ambiente na importação
+        os.environ['ONTIME_PASTA'] = raiz
+        os.environ['SAP_FORMATO_EXPORTACAO'] = 'txt'
+        for notas in argumentos.notas:
+            executar(notas, argumentos.relatorios, raiz)
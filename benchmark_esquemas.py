@@ -0,0 +1,137 @@
+"""
+Mede a primeira leitura (conversão para o cache colunar) das exportações
+grandes da LIPS e da VBFA, com as colunas que as etapas de chaves leem:
+
+  tipos deduzidos  como antes dos esquemas: o arquivo inteiro com os tipos
+                   deduzidos pelos valores, juntado e copiado na memória antes
+                   de ir para o Parquet
+  esquema          cache_colunar.ler_tabela com o esquema da tabela
+                   (esquemas_sap.py): tipos declarados, Parquet gravado bloco a
+                   bloco e só as colunas pedidas lidas de volta
+
+Cada medição roda num processo próprio. O pico de memória soma o das
+alocações do pandas/numpy (tracemalloc) e o do pool de memória do pyarrow e
+é medido numa leitura à parte, porque o tracemalloc deixa a leitura lenta.
+
+Uso: python benchmark_esquemas.py [--linhas N] [--formato txt|xlsx]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+# Colunas lidas pelas etapas CHAVES_REMESSA e CHAVES_VBFA (etapas_ontime.py)
+COLUNAS = {
+    'LIPS': ['Remessa'],
+    'VBFA': ['Tipo de movimento', 'Doc.subsequente', 'Ano doc.material'],
+}
+MODOS = ('tipos deduzidos', 'esquema')
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark da leitura das exportações com os esquemas das tabelas")
+    parser.add_argument('--linhas', type=int, default=2_000_000, help="Linhas da ZPMMT_287 sintética")
+    parser.add_argument('--formato', choices=['txt', 'xlsx'], default='txt')
+    parser.add_argument('--medir', nargs=4, metavar=('MODO', 'ARQUIVO', 'CACHE', 'MEDIDA'), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def ler_como_antes(caminho, colunas, pasta_cache):
+    """A conversão de antes dos esquemas: tudo deduzido, juntado e copiado antes de gravar o Parquet."""
+    from cache_colunar import preparar_para_parquet
+    from leitor_sap import ler_exportacao
+
+    df_completo = preparar_para_parquet(ler_exportacao(caminho, tipos={}))
+    df_completo.to_parquet(os.path.join(pasta_cache, 'antes.parquet'), index=False)
+    return df_completo[colunas]
+
+
+def medir(modo, caminho, pasta_cache, medida):
+    """
+    Uma leitura, neste processo, medindo o tempo ou (medida='memoria') o pico
+    de memória. Imprime {segundos, pico_mb, memoria_mb, tipos, soma, linhas} em JSON.
+    """
+    import contextlib
+    import io
+    import tracemalloc
+
+    import pyarrow as pa
+    from cache_colunar import ler_tabela
+
+    tabela = os.path.splitext(os.path.basename(caminho))[0]
+    colunas = COLUNAS[tabela]
+    if medida == 'memoria':
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if modo == 'esquema':
+            df = ler_tabela(caminho, colunas=colunas, pasta_cache=pasta_cache)
+        else:
+            df = ler_como_antes(caminho, colunas, pasta_cache)
+    segundos = time.perf_counter() - inicio
+    pico = tracemalloc.get_traced_memory()[1] + pa.default_memory_pool().max_memory() if medida == 'memoria' else None
+    # Soma das chaves: confere que os dois modos leram os mesmos valores
+    chave = colunas[-1] if tabela == 'VBFA' else colunas[0]
+    print(json.dumps({
+        'segundos': segundos,
+        'pico_mb': pico and pico / 1024 ** 2,
+        'memoria_mb': df.memory_usage(deep=True).sum() / 1024 ** 2,
+        'tipos': {coluna: str(tipo) for coluna, tipo in df.dtypes.items()},
+        'soma': int(pd.to_numeric(df[chave]).sum()),
+        'linhas': len(df),
+    }))
+
+
+if __name__ == '__main__':
+    argumentos = ler_argumentos()
+    if argumentos.medir:
+        medir(*argumentos.medir)
+        sys.exit(0)
+
+    pasta = tempfile.mkdtemp(prefix='benchmark_esquemas_')
+    try:
+        from leitor_sap import arquivo_exportado, gravar_exportacao
+        from sap_fake import gerar_tabelas
+
+        inicio = time.perf_counter()
+        tabelas = gerar_tabelas(argumentos.linhas)
+        arquivos = {}
+        for tabela in COLUNAS:
+            arquivos[tabela] = os.path.join(pasta, arquivo_exportado(tabela, argumentos.formato))
+            gravar_exportacao(tabelas[tabela], arquivos[tabela])
+        del tabelas
+        print(f"Exportações da LIPS e da VBFA geradas em {time.perf_counter() - inicio:.1f}s "
+              f"({argumentos.linhas} linhas na ZPMMT_287, formato {argumentos.formato})")
+
+        print(f"  {'tabela':<6} {'modo':<16} {'linhas':>9} {'tamanho':>9} {'tempo':>8} {'pico':>9} "
+              f"{'resultado':>10}  tipos")
+        for tabela, caminho in arquivos.items():
+            medicoes = {}
+            for modo in MODOS:
+                m = medicoes[modo] = {}
+                for medida in ('tempo', 'memoria'):
+                    # Cada leitura começa com o cache vazio: é a primeira leitura que converte o arquivo
+                    pasta_cache = os.path.join(pasta, f"cache_{tabela}_{modo.replace(' ', '_')}_{medida}")
+                    os.makedirs(pasta_cache)
+                    saida = subprocess.run([sys.executable, os.path.abspath(__file__), '--medir', modo, caminho,
+                                            pasta_cache, medida], capture_output=True, text=True, check=True)
+                    resultado = json.loads(saida.stdout.strip().splitlines()[-1])
+                    m.update({chave: valor for chave, valor in resultado.items() if valor is not None
+                              and not (medida == 'memoria' and chave == 'segundos')})
+                print(f"  {tabela:<6} {modo:<16} {m['linhas']:>9} {os.path.getsize(caminho) / 1024 ** 2:6.0f} MB "
+                      f"{m['segundos']:7.2f}s {m['pico_mb']:6.0f} MB {m['memoria_mb']:7.1f} MB  "
+                      f"{', '.join(m['tipos'].values())}")
+            antes, depois = medicoes['tipos deduzidos'], medicoes['esquema']
+            if (antes['soma'], antes['linhas']) != (depois['soma'], depois['linhas']):
+                raise AssertionError(f"{tabela}: valores diferentes entre os modos ({antes} x {depois}).")
+            print(f"  ✔ {tabela}: {1 - depois['segundos'] / antes['segundos']:.0%} menos tempo, "
+                  f"pico de memória {1 - depois['pico_mb'] / antes['pico_mb']:.0%} menor, mesmos valores")
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    sys.exit(0)
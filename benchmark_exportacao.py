@@ -0,0 +1,115 @@
+"""
+Compara a leitura de uma exportação do SAP em planilha (&XXL + pd.read_excel)
+com a leitura em blocos do texto com tabulações (leitor_sap.py). Antes, confere
+que textos com aspas, tabulações e quebras de linha voltam iguais de
+gravar_exportacao para ler_exportacao.
+
+Uso: python benchmark_exportacao.py [linhas ...]   (padrão: 10000 100000)
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from leitor_sap import gravar_exportacao, ler_exportacao, ler_texto_sap
+
+
+def gerar_tabela(linhas, semente=42):
+    """Gera uma tabela sintética no formato da VBFA exportada pela SE16N."""
+    rng = np.random.default_rng(semente)
+    datas = pd.Timestamp('2026-01-01') + pd.to_timedelta(rng.integers(0, 365, linhas), unit='D')
+    return pd.DataFrame({
+        'Doc.SD precedente': rng.integers(80_000_000, 89_999_999, linhas),
+        'Item SD precedente': rng.integers(1, 50, linhas) * 10,
+        'Doc.subsequente': rng.integers(5_000_000_000, 5_099_999_999, linhas),
+        'Ano doc.material': rng.choice([2025, 2026], linhas),
+        'Tipo de movimento': rng.choice([101, 862, 861], linhas),
+        'Quantidade': np.round(rng.uniform(-500, 50_000, linhas), 3),
+        'Criado em': datas,
+        'Unidade': rng.choice(['UN', 'KG', 'PC'], linhas),
+    })
+
+
+def numero_br(valores, casas):
+    """Formata números como o SAP: 1.234,567 e sinal de menos no final."""
+    texto = [f"{abs(v):,.{casas}f}".replace(',', 'X').replace('.', ',').replace('X', '.') for v in valores]
+    return [t + '-' if v < 0 else t for t, v in zip(texto, valores)]
+
+
+def escrever_texto_sap(df, caminho):
+    """Escreve a tabela como o "Texto com tabulações" do SAP (valores no formato brasileiro)."""
+    colunas = {}
+    for nome, serie in df.items():
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            colunas[nome] = serie.dt.strftime('%d.%m.%Y')
+        elif pd.api.types.is_float_dtype(serie):
+            colunas[nome] = numero_br(serie.tolist(), 3)
+        else:
+            colunas[nome] = serie.astype(str)
+    pd.DataFrame(colunas).to_csv(caminho, sep='\t', index=False, encoding='utf-8')
+
+
+def conferir_ida_e_volta(pasta):
+    """Grava e relê descrições com aspas, tabulação, quebra de linha e '|' (como a Descrição da MARA)."""
+    descricoes = ['PARAFUSO 1/2" ACO', '"ARRUELA"', 'PORCA\tM8', 'TUBO\r\nPVC 3/4"', 'CABO | 2,5 MM', "LUVA 'NITRILICA'"]
+    df = pd.DataFrame({'Material': range(1, len(descricoes) + 1), 'Descrição': descricoes})
+    caminho = os.path.join(pasta, 'MARA.tsv')
+    gravar_exportacao(df, caminho)
+    lido = ler_exportacao(caminho)
+    # Tabulação e quebra de linha viram espaço, como no texto exportado pelo SAP
+    esperado = df['Descrição'].str.replace(r'[\t\r\n]', ' ', regex=True).str.strip()
+    if lido['Descrição'].tolist() != esperado.tolist() or lido['Material'].tolist() != df['Material'].tolist():
+        raise AssertionError(f"Ida e volta do texto com tabulações alterou os valores:\n{lido}")
+    print(f"✔ Ida e volta do texto com tabulações: {len(df)} descrições com aspas, tabulações e quebras iguais")
+
+
+def medir(funcao):
+    """
+    Retorna (segundos, pico de memória em MB) da função. O tempo é medido numa
+    execução sem tracemalloc, que deixa o código várias vezes mais lento.
+    """
+    inicio = time.perf_counter()
+    funcao()
+    tempo = time.perf_counter() - inicio
+    tracemalloc.start()
+    funcao()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tempo, pico / 1024 ** 2
+
+
+def executar(linhas, pasta):
+    df = gerar_tabela(linhas)
+    caminho_xlsx = os.path.join(pasta, f'VBFA_{linhas}.xlsx')
+    caminho_tsv = os.path.join(pasta, f'VBFA_{linhas}.tsv')
+    df.to_excel(caminho_xlsx, index=False, engine='xlsxwriter')
+    escrever_texto_sap(df, caminho_tsv)
+
+    def somar_blocos():
+        # Leitura em blocos mantendo só uma coluna agregada, como faria uma etapa de chaves
+        return sum(int(bloco['Quantidade'].count()) for bloco in ler_texto_sap(caminho_tsv))
+
+    casos = [
+        ('xlsx + pd.read_excel', lambda: pd.read_excel(caminho_xlsx)),
+        ('texto + ler_exportacao', lambda: ler_exportacao(caminho_tsv)),
+        ('texto em blocos', somar_blocos),
+    ]
+    print(f"\n{linhas} linhas  (xlsx: {os.path.getsize(caminho_xlsx) / 1024 ** 2:.1f} MB, "
+          f"texto: {os.path.getsize(caminho_tsv) / 1024 ** 2:.1f} MB)")
+    base = None
+    for nome, funcao in casos:
+        tempo, pico = medir(funcao)
+        base = base or tempo
+        print(f"  {nome:<24} {tempo:8.2f}s  pico {pico:8.1f} MB  ({base / tempo:5.1f}x)")
+
+
+if __name__ == '__main__':
+    tamanhos = [int(a) for a in sys.argv[1:]] or [10_000, 100_000]
+    with tempfile.TemporaryDirectory() as pasta:
+        conferir_ida_e_volta(pasta)
+        for linhas in tamanhos:
+            executar(linhas, pasta)
@@ -0,0 +1,148 @@
+"""
+Compara o tratamento do relatório de CT-e do JWM.py (ETAPAS 1 a 3) com a
+versão anterior, que explodia as notas fiscais com iterrows, e confere se a
+planilha gerada pelas duas é idêntica célula a célula.
+
+Uso: python benchmark_jwm.py [linhas ...] [--limite-original N]
+     (padrão: 100000 1000000 CT-e; a versão anterior só roda até 100000)
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from JWM import salvar_relatorio, tratar_relatorio
+from mapeamento_locais import ler_mapeamento
+
+# DE-PARA como dicionários, do jeito que a versão anterior usava
+_TABELA = ler_mapeamento()
+MAPA_CNPJ = dict(zip(_TABELA.loc[_TABELA['tipo'] == 'cnpj', 'valor'], _TABELA.loc[_TABELA['tipo'] == 'cnpj', 'codigo']))
+MAPA_CIDADES = dict(zip(_TABELA.loc[_TABELA['tipo'] == 'cidade', 'valor'], _TABELA.loc[_TABELA['tipo'] == 'cidade', 'codigo']))
+
+CIDADES = list(MAPA_CIDADES) + ['Campinas ', ' são paulo', 'Guarulhos', 'Cidade Sem Código', None]
+CNPJS = [int(c) for c in MAPA_CNPJ] + [61064838000180, 33000167000101, None]
+
+
+def gerar_relatorio(linhas, semente=42):
+    """Relatório sintético de CT-e como o lido do Excel (notas '123, 456' ou um número só)."""
+    rng = np.random.default_rng(semente)
+    quantidade_notas = rng.choice([1, 1, 1, 2, 3, 5], linhas)
+    primeira = 1_400_000 + np.cumsum(quantidade_notas)
+    notas = np.empty(linhas, dtype=object)
+    for quantidade in np.unique(quantidade_notas):
+        linhas_q = np.flatnonzero(quantidade_notas == quantidade)
+        if quantidade == 1:
+            notas[linhas_q] = primeira[linhas_q]
+        else:
+            texto = pd.Series(primeira[linhas_q]).astype(str)
+            for k in range(1, quantidade):
+                texto = texto + ', ' + pd.Series(primeira[linhas_q] + k).astype(str)
+            notas[linhas_q] = texto.to_numpy()
+    frete = pd.Timestamp('2025-09-01') + pd.to_timedelta(rng.integers(0, 90 * 24 * 60, linhas), unit='min')
+    entrega = pd.Series(frete + pd.to_timedelta(rng.integers(60, 5 * 24 * 60, linhas), unit='min'))
+    entrega[rng.random(linhas) < 0.1] = pd.NaT
+    cte = pd.Series(17_000 + np.arange(linhas), dtype='float64')
+    cte[rng.random(linhas) < 0.05] = np.nan
+    return pd.DataFrame({
+        'N° CT-e': cte,
+        'Notas Fiscais': notas,
+        'Cidade origem': rng.choice(np.array(CIDADES, dtype=object), linhas),
+        'CPF/CNPJ Remetente': rng.choice(np.array(CNPJS, dtype=object), linhas),
+        'Cidade destino': rng.choice(np.array(CIDADES, dtype=object), linhas),
+        'CPF/CNPJ Destinatário': rng.choice(np.array(CNPJS, dtype=object), linhas),
+        'Data Frete': frete.strftime('%d/%m/%Y %H:%M'),
+        'Data Entrega': entrega.dt.strftime('%d/%m/%Y %H:%M'),
+    })
+
+
+def tratar_original(df):
+    """ETAPAS 1 a 3 como eram antes (iterrows + row.copy por nota fiscal)."""
+    df = df.copy()
+    df['Data Frete'] = pd.to_datetime(df['Data Frete'], dayfirst=True)
+    df['Data Entrega'] = pd.to_datetime(df['Data Entrega'], dayfirst=True, errors='coerce')
+
+    new_rows = []
+    for index, row in df.iterrows():
+        notas_fiscais = str(row['Notas Fiscais']).split(', ')
+        for nota in notas_fiscais:
+            new_row = row.copy()
+            new_row['Notas Fiscais'] = nota
+            new_rows.append(new_row)
+
+    df_processado = pd.DataFrame(new_rows)
+    df_processado['CPF/CNPJ Remetente'] = pd.to_numeric(df_processado['CPF/CNPJ Remetente'], errors='coerce')
+    df_processado['CPF/CNPJ Destinatário'] = pd.to_numeric(df_processado['CPF/CNPJ Destinatário'], errors='coerce')
+
+    df_codificado = df_processado.copy()
+    df_codificado['CPF/CNPJ Remetente'] = df_codificado['CPF/CNPJ Remetente'].astype('Int64').astype(str)
+    df_codificado['CPF/CNPJ Destinatário'] = df_codificado['CPF/CNPJ Destinatário'].astype('Int64').astype(str)
+    df_codificado['Origem_Codificada'] = df_codificado['CPF/CNPJ Remetente'].map(MAPA_CNPJ)
+    df_codificado['Destino_Codificada'] = df_codificado['CPF/CNPJ Destinatário'].map(MAPA_CNPJ)
+    map_cidade_origem = df_codificado['Cidade origem'].str.strip().str.upper().replace(MAPA_CIDADES)
+    map_cidade_destino = df_codificado['Cidade destino'].str.strip().str.upper().replace(MAPA_CIDADES)
+    df_codificado['Origem_Codificada'] = df_codificado['Origem_Codificada'].fillna(map_cidade_origem)
+    df_codificado['Destino_Codificada'] = df_codificado['Destino_Codificada'].fillna(map_cidade_destino)
+
+    df_final = pd.DataFrame()
+    df_final['N° OC'] = df_codificado['N° CT-e']
+    df_final['Nft'] = df_codificado['Notas Fiscais']
+    df_final['Origem'] = df_codificado['Origem_Codificada']
+    df_final['CNPJ ORIGEM'] = df_codificado['CPF/CNPJ Remetente']
+    df_final['Destino'] = df_codificado['Destino_Codificada']
+    df_final['CNPJ DESTINO'] = df_codificado['CPF/CNPJ Destinatário']
+    df_final['Data inclusão'] = df_codificado['Data Frete']
+    df_final['Data expedida'] = df_codificado['Data Frete']
+    df_final['Data chegada'] = df_codificado['Data Entrega']
+    return df_final
+
+
+def celulas(caminho):
+    """(valor, tipo, formato) de todas as células da planilha."""
+    planilha = openpyxl.load_workbook(caminho).active
+    return [[(c.value, c.data_type, c.number_format) for c in linha] for linha in planilha.iter_rows()]
+
+
+def conferir_planilhas(df, pasta):
+    """Grava a planilha com as duas versões e confere se são idênticas."""
+    caminhos = {}
+    for nome, funcao in (('original', tratar_original), ('vetorizado', tratar_relatorio)):
+        caminhos[nome] = os.path.join(pasta, f'{nome}.xlsx')
+        with contextlib.redirect_stdout(io.StringIO()):
+            salvar_relatorio(funcao(df), caminhos[nome])
+    if celulas(caminhos['original']) != celulas(caminhos['vetorizado']):
+        raise AssertionError("As planilhas geradas pelas duas versões são diferentes.")
+    print(f"Planilha idêntica nas duas versões ({len(df)} CT-e).")
+
+
+def medir(funcao, df):
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        resultado = funcao(df)
+        return time.perf_counter() - inicio, resultado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark do tratamento do JWM.py")
+    parser.add_argument('linhas', nargs='*', type=int, default=[100_000, 1_000_000])
+    parser.add_argument('--limite-original', type=int, default=100_000,
+                        help="Maior quantidade de CT-e em que a versão anterior (lenta) também é medida")
+    argumentos = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        conferir_planilhas(gerar_relatorio(5_000), pasta)
+
+    for linhas in argumentos.linhas:
+        df = gerar_relatorio(linhas)
+        tempo_novo, novo = medir(tratar_relatorio, df)
+        print(f"\n{linhas} CT-e -> {len(novo)} linhas")
+        print(f"  vetorizado  {tempo_novo:8.2f}s")
+        if linhas <= argumentos.limite_original:
+            tempo_original, original = medir(tratar_original, df)
+            pd.testing.assert_frame_equal(novo.reset_index(drop=True), original.reset_index(drop=True))
+            print(f"  original    {tempo_original:8.2f}s  ({tempo_original / tempo_novo:.0f}x mais lento)")
@@ -0,0 +1,142 @@
+"""
+Mede a retomada de uma execução interrompida (retomada.py) no SAP falso do
+benchmark_sap.py: uma execução completa de referência, uma execução que falha
+numa etapa (padrão: J_1BNFDOC, a última tabela do caminho crítico) e a
+retomada com --retomar, que precisa pular as etapas concluídas e chegar à
+mesma tabela On-Time. Depois confere --somente e --a-partir-de.
+
+Uso: python benchmark_retomada.py [linhas] [--falhar-em ETAPA] [--sessoes N]
+     (padrão: 100000 linhas da ZPMMT_287)
+"""
+import argparse
+import contextlib
+import dataclasses
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark da retomada de execuções")
+    parser.add_argument('linhas', nargs='?', type=int, default=100_000)
+    parser.add_argument('--falhar-em', default='J_1BNFDOC')
+    parser.add_argument('--sessoes', type=int, default=3)
+    parser.add_argument('--latencia-chamada', type=float, default=0.001)
+    parser.add_argument('--latencia-consulta', type=float, default=0.05)
+    argumentos = parser.parse_args()
+    argumentos.formato = 'txt'
+    argumentos.formato_ontime = 'parquet'
+    argumentos.backend = 'gui'
+    return argumentos
+
+
+def rodar(tabelas, argumentos, raiz, retomar=False, a_partir_de=None, somente=None, falhar_em=None):
+    """
+    Uma execução como a do SAP.py: lê o manifesto anterior quando aproveita
+    etapas dele, seleciona as etapas e só abre o SAP falso se alguma precisa
+    de sessão. Retorna (segundos, etapas executadas, etapas puladas, erro).
+    """
+    from agendador import executar_etapas
+    from benchmark_sap import abrir_sap_falso
+    from etapas_ontime import montar_etapas
+    from historico_zpmmt import calcular_janela
+    from rastreamento import Rastreador
+    from retomada import ManifestoExecucao, selecionar_etapas
+
+    inicio = time.perf_counter()
+    anterior = ManifestoExecucao.carregar() if retomar or a_partir_de or somente else None
+    if anterior is not None:
+        inicio_zpmmt, fim_zpmmt = (datetime.strptime(d, '%d.%m.%Y') for d in anterior.parametros['janela_zpmmt'])
+    else:
+        inicio_zpmmt, fim_zpmmt = calcular_janela()
+    parametros = {'reconstruir_zpmmt': False,
+                  'janela_zpmmt': [f"{inicio_zpmmt:%d.%m.%Y}", f"{fim_zpmmt:%d.%m.%Y}"],
+                  'formato_exportacao': argumentos.formato, 'formato_ontime': argumentos.formato_ontime}
+    manifesto = ManifestoExecucao(parametros, anterior.etapas if anterior else None)
+    rastreador = Rastreador(pasta=os.path.join(raiz, 'rastreamento'))
+
+    etapas = montar_etapas(inicio_zpmmt, fim_zpmmt, False, [])
+    etapas, _, puladas = selecionar_etapas(etapas, manifesto, retomar, a_partir_de, somente)
+    manifesto.gravar()
+    if not etapas:
+        return time.perf_counter() - inicio, [], sorted(puladas), None
+    if falhar_em:
+        def falhar(*_):
+            raise RuntimeError(f"falha simulada na etapa {falhar_em}")
+        etapas = [dataclasses.replace(e, funcao=falhar) if e.nome == falhar_em else e for e in etapas]
+
+    sessoes, extrator = [], None
+    if any(etapa.usa_sessao for etapa in etapas):
+        sessoes, extrator = abrir_sap_falso(tabelas, argumentos, rastreador)
+    erro = None
+    try:
+        executar_etapas(etapas, lambda indice: sessoes[indice], len(sessoes), rastreador, manifesto)
+    except RuntimeError as e:
+        erro = e
+    finally:
+        if extrator is not None:
+            extrator.fechar()
+    return time.perf_counter() - inicio, [e.nome for e in etapas], sorted(puladas), erro
+
+
+def limpar(raiz):
+    from sap_fake import gravar_codigos_bases
+    shutil.rmtree(raiz, ignore_errors=True)
+    os.makedirs(raiz)
+    gravar_codigos_bases(raiz)
+
+
+def silencioso(funcao, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return funcao(*args, **kwargs)
+
+
+if __name__ == '__main__':
+    argumentos = ler_argumentos()
+    raiz = os.path.join(tempfile.mkdtemp(prefix='benchmark_retomada_'), 'ONTIME')
+    from benchmark_sap import preparar_ambiente
+    preparar_ambiente(argumentos, raiz)
+    try:
+        from sap_fake import gerar_tabelas
+        tabelas = gerar_tabelas(argumentos.linhas)
+        print(f"{argumentos.linhas} linhas na ZPMMT_287")
+
+        limpar(raiz)
+        completa, _, _, _ = silencioso(rodar, tabelas, argumentos, raiz)
+        referencia = pd.read_parquet(os.path.join(raiz, 'ONTIME.parquet'))
+        print(f"  execução completa                 {completa:8.2f}s")
+
+        limpar(raiz)
+        ate_falha, _, _, erro = silencioso(rodar, tabelas, argumentos, raiz, falhar_em=argumentos.falhar_em)
+        if erro is None:
+            raise AssertionError("A execução com falha simulada terminou sem erro.")
+        print(f"  até a falha em {argumentos.falhar_em:<18} {ate_falha:8.2f}s")
+
+        retomada, executadas, puladas, erro = silencioso(rodar, tabelas, argumentos, raiz, retomar=True)
+        if erro is not None:
+            raise erro
+        print(f"  retomada (--retomar)              {retomada:8.2f}s  "
+              f"({len(puladas)} etapas puladas; executadas: {', '.join(executadas)})")
+        pd.testing.assert_frame_equal(referencia, pd.read_parquet(os.path.join(raiz, 'ONTIME.parquet')))
+        print("  ✔ tabela On-Time igual à da execução completa")
+
+        segundos, executadas, _, _ = silencioso(rodar, tabelas, argumentos, raiz, retomar=True)
+        if executadas:
+            raise AssertionError(f"Etapas refeitas sem motivo: {executadas}")
+        print(f"  nova retomada sem nada a refazer  {segundos:8.2f}s")
+
+        segundos, executadas, _, _ = silencioso(rodar, tabelas, argumentos, raiz, somente=['MARA'])
+        print(f"  --somente MARA                    {segundos:8.2f}s  (executadas: {', '.join(executadas)})")
+        segundos, executadas, _, _ = silencioso(rodar, tabelas, argumentos, raiz, a_partir_de=['VBFA'])
+        print(f"  --a-partir-de VBFA                {segundos:8.2f}s  (executadas: {', '.join(executadas)})")
+        pd.testing.assert_frame_equal(referencia, pd.read_parquet(os.path.join(raiz, 'ONTIME.parquet')))
+        print("  ✔ tabela On-Time igual à da execução completa")
+    finally:
+        shutil.rmtree(os.path.dirname(raiz), ignore_errors=True)
+    sys.exit(0)
@@ -0,0 +1,87 @@
+"""
+Compara os dois backends de extração das tabelas SE16N (extratores.py): roda
+o processo do benchmark_sap.py com o SAP GUI falso e com o servidor RFC falso
+(RFC_READ_TABLE paginada) e confere que cada exportação tem as mesmas linhas,
+os mesmos cabeçalhos e os mesmos tipos, assim como a tabela On-Time.
+
+Uso: python benchmark_rfc.py [linhas ...] [--sessoes N]
+                             [--latencia-chamada S] [--latencia-consulta S]
+     (padrão: 10000 100000 linhas da ZPMMT_287)
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Paridade e tempos dos backends GUI e RFC")
+    parser.add_argument('linhas', nargs='*', type=int, default=[10_000, 100_000])
+    parser.add_argument('--sessoes', type=int, default=3)
+    parser.add_argument('--latencia-chamada', type=float, default=0.001)
+    parser.add_argument('--latencia-consulta', type=float, default=0.05)
+    argumentos = parser.parse_args()
+    argumentos.formato = 'txt'
+    argumentos.formato_ontime = 'parquet'
+    argumentos.backend = 'gui'
+    return argumentos
+
+
+def ordenar(df):
+    """Mesma ordem de linhas para os dois backends (a ordem da exportação não importa)."""
+    return df.sort_values(list(df.columns), na_position='first', kind='stable').reset_index(drop=True)
+
+
+def comparar(raiz, copias):
+    from leitor_sap import ler_exportacao
+    from sap_se16n import TABELAS
+
+    arquivos = sorted({spec.arquivo_saida for spec in TABELAS.values()}) + ['ONTIME.parquet']
+    for arquivo in arquivos:
+        ler = pd.read_parquet if arquivo.endswith('.parquet') else ler_exportacao
+        gui, rfc = (ordenar(ler(os.path.join(copias[backend], arquivo))) for backend in ('gui', 'rfc'))
+        pd.testing.assert_frame_equal(gui, rfc, check_dtype=True, obj=arquivo)
+        print(f"  ✔ {arquivo:<22} {len(gui):>10} linhas iguais nos dois backends")
+
+
+def executar_backends(linhas, argumentos, raiz):
+    from benchmark_sap import executar
+    from sap_se16n import TABELAS
+
+    copias, medicoes = {}, {}
+    for backend in ('gui', 'rfc'):
+        argumentos.backend = backend
+        with contextlib.redirect_stdout(io.StringIO()):
+            medicoes[backend] = executar(linhas, argumentos, raiz)
+        # executar() apaga a pasta no início: guarda as saídas deste backend
+        copias[backend] = os.path.join(os.path.dirname(raiz), backend)
+        shutil.rmtree(copias[backend], ignore_errors=True)
+        os.makedirs(copias[backend])
+        for arquivo in {spec.arquivo_saida for spec in TABELAS.values()} | {'ONTIME.parquet'}:
+            shutil.copy2(os.path.join(raiz, arquivo), copias[backend])
+
+    print(f"\n{linhas} linhas na ZPMMT_287")
+    etapas = [nome for nome in medicoes['gui'][1] if nome in medicoes['rfc'][1]]
+    print(f"  {'Etapa':<18} {'gui':>10} {'rfc':>10}")
+    for etapa in etapas:
+        print(f"  {etapa:<18} {medicoes['gui'][1][etapa]:9.2f}s {medicoes['rfc'][1][etapa]:9.2f}s")
+    print(f"  {'Ponta a ponta':<18} {medicoes['gui'][0]:9.2f}s {medicoes['rfc'][0]:9.2f}s")
+    comparar(raiz, copias)
+
+
+if __name__ == '__main__':
+    argumentos = ler_argumentos()
+    raiz = os.path.join(tempfile.mkdtemp(prefix='benchmark_rfc_'), 'ONTIME')
+    from benchmark_sap import preparar_ambiente
+    preparar_ambiente(argumentos, raiz)
+    try:
+        for linhas in argumentos.linhas:
+            executar_backends(linhas, argumentos, raiz)
+    finally:
+        shutil.rmtree(os.path.dirname(raiz), ignore_errors=True)
+    sys.exit(0)
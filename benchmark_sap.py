@@ -0,0 +1,133 @@
+"""
+Mede o processo On-Time de ponta a ponta sem SAP: as mesmas etapas do SAP.py
+(etapas_ontime.py, agendador, cache, lotes) rodam contra o SAP GUI falso de
+sap_fake.py, com tabelas sintéticas e latência simulada.
+
+Uso: python benchmark_sap.py [linhas ...] [--formato txt|xlsx] [--sessoes N]
+                             [--backend gui|rfc] [--formato-ontime xlsx|csv|parquet]
+                             [--latencia-chamada S] [--latencia-consulta S]
+     (padrão: 10000 100000 1000000 linhas da ZPMMT_287, formato txt)
+
+O formato xlsx fica lento (e limitado a ~1 milhão de linhas por planilha)
+nos tamanhos maiores; use-o para comparar os dois formatos em 10k/100k.
+Com --backend rfc as tabelas SE16N são lidas do servidor RFC falso
+(RFC_READ_TABLE paginada); a ZPMMT_287 continua no SAP GUI falso.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark do extrator On-Time com SAP falso")
+    parser.add_argument('linhas', nargs='*', type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--formato', choices=['txt', 'xlsx'], default='txt')
+    parser.add_argument('--sessoes', type=int, default=3)
+    parser.add_argument('--backend', choices=['gui', 'rfc'], default='gui',
+                        help="Backend das tabelas SE16N (extratores.py)")
+    parser.add_argument('--formato-ontime', choices=['xlsx', 'csv', 'parquet'], default='parquet',
+                        help="Formato da tabela On-Time (a planilha domina o tempo da etapa ONTIME)")
+    parser.add_argument('--latencia-chamada', type=float, default=0.001)
+    parser.add_argument('--latencia-consulta', type=float, default=0.05)
+    return parser.parse_args()
+
+
+def preparar_ambiente(argumentos, raiz):
+    """
+    As configurações são lidas do ambiente na importação de configuracao.py,
+    então precisam estar definidas antes de importar os módulos do processo.
+    """
+    os.environ['ONTIME_PASTA'] = raiz
+    os.environ['SAP_FORMATO_EXPORTACAO'] = argumentos.formato
+    os.environ['SAP_MAX_SESSOES'] = str(argumentos.sessoes)
+    os.environ['SAP_BACKEND_EXTRACAO'] = argumentos.backend
+    os.environ['ONTIME_FORMATO_SAIDA'] = argumentos.formato_ontime
+    os.environ['SAP_INTERVALO_VERIFICACAO'] = '0.005'
+    for variavel in ('ONTIME_PASTA_CACHE', 'ONTIME_PASTA_HISTORICO', 'ONTIME_PASTA_CHAVES', 'ONTIME_PASTA_RASTREAMENTO',
+                     'ONTIME_PASTA_CONCILIACAO', 'ONTIME_MANIFESTO', 'ONTIME_PASTA_SERVICO', 'ONTIME_AGENDA'):
+        os.environ.pop(variavel, None)
+
+
+def abrir_sap_falso(tabelas, argumentos, rastreador):
+    """Login no SAP GUI falso (medido como a etapa LOGIN) e o backend de extração. Retorna (sessões, extrator)."""
+    from extratores import ExtratorGUI
+    from sap_espera import aguardar_elemento
+    from sap_fake import LatenciaFalsa, MotorSapFalso, ServidorRfcFalso
+    from sap_rfc import ExtratorRFC
+
+    latencia = LatenciaFalsa(chamada=argumentos.latencia_chamada, consulta=argumentos.latencia_consulta)
+    motor = MotorSapFalso(tabelas, latencia)
+    if argumentos.backend == 'rfc':
+        extrator = ExtratorRFC(abrir_conexao=ServidorRfcFalso(tabelas, latencia).conectar)
+    else:
+        extrator = ExtratorGUI()
+    with rastreador.etapa('LOGIN') as registro:
+        conexao = registro.instrumentar(motor).OpenConnection('S/4HANA PS4', True)
+        session = conexao.Children(0)
+        aguardar_elemento(session, "wnd[0]/usr/txtRSYST-BNAME").Text = 'USUARIO'
+        aguardar_elemento(session, "wnd[0]/usr/pwdRSYST-BCODE").Text = 'SENHA'
+        session.findById("wnd[0]").sendVKey(0)
+        for _ in range(argumentos.sessoes - 1):
+            session.createSession()
+    return list(motor.Children[0].Children), extrator
+
+
+def executar(linhas, argumentos, raiz):
+    from agendador import executar_etapas
+    from etapas_ontime import montar_etapas
+    from historico_zpmmt import calcular_janela
+    from rastreamento import Rastreador
+    from sap_fake import gerar_tabelas, gravar_codigos_bases
+
+    # Cada tamanho começa do zero: sem histórico, sem cache colunar e sem cache de chaves
+    shutil.rmtree(raiz, ignore_errors=True)
+    os.makedirs(raiz)
+    gravar_codigos_bases(raiz)
+    inicio = time.perf_counter()
+    tabelas = gerar_tabelas(linhas)
+    print(f"\n{linhas} linhas na ZPMMT_287 ({sum(len(t) for t in tabelas.values())} linhas no total, "
+          f"geradas em {time.perf_counter() - inicio:.1f}s)")
+
+    rastreador = Rastreador(pasta=os.path.join(raiz, 'rastreamento'))
+    inicio_ponta_a_ponta = time.perf_counter()
+    sessoes, extrator = abrir_sap_falso(tabelas, argumentos, rastreador)
+    inicio_zpmmt, fim_zpmmt = calcular_janela()
+    resultados = []
+    try:
+        executar_etapas(montar_etapas(inicio_zpmmt, fim_zpmmt, False, resultados, extrator),
+                        lambda indice: sessoes[indice], len(sessoes), rastreador)
+    finally:
+        extrator.fechar()
+    total = time.perf_counter() - inicio_ponta_a_ponta
+
+    print(f"\n  {'Etapa':<18} {'tempo':>8} {'linhas':>10} {'chamadas COM':>13}")
+    for registro in sorted(rastreador.registros, key=lambda r: r.segundos, reverse=True):
+        linhas_saida = '' if registro.linhas_saida is None else registro.linhas_saida
+        print(f"  {registro.nome:<18} {registro.segundos:7.2f}s {linhas_saida:>10} "
+              f"{sum(registro.chamadas_com.values()):>13}")
+    print(f"  {'Ponta a ponta':<18} {total:7.2f}s")
+    return total, {r.nome: r.segundos for r in rastreador.registros}
+
+
+if __name__ == '__main__':
+    argumentos = ler_argumentos()
+    raiz = os.path.join(tempfile.mkdtemp(prefix='benchmark_sap_'), 'ONTIME')
+    preparar_ambiente(argumentos, raiz)
+    medicoes = {}
+    try:
+        for linhas in argumentos.linhas:
+            medicoes[linhas] = executar(linhas, argumentos, raiz)
+    finally:
+        shutil.rmtree(os.path.dirname(raiz), ignore_errors=True)
+
+    if len(medicoes) > 1:
+        print(f"\nResumo ({argumentos.formato}, {argumentos.sessoes} sessões, backend {argumentos.backend}):")
+        etapas = list(next(iter(medicoes.values()))[1])
+        print(f"  {'Etapa':<18}" + ''.join(f"{linhas:>12}" for linhas in medicoes))
+        for etapa in etapas:
+            print(f"  {etapa:<18}" + ''.join(f"{tempos.get(etapa, 0):11.2f}s" for _, tempos in medicoes.values()))
+        print(f"  {'Ponta a ponta':<18}" + ''.join(f"{total:11.2f}s" for total, _ in medicoes.values()))
+    sys.exit(0)
@@ -0,0 +1,235 @@
+"""
+Mede o serviço de extração (servico_extracao.py) no SAP GUI falso: muitos
+pedidos pequenos (algumas chaves de LIPS, VBFA, J_1BNFDOC, MARA e EBAN),
+enviados pela API HTTP por vários clientes ao mesmo tempo, contra rodar um
+script a cada pedido (importação, login ou sessão reaproveitada, extração).
+Confere que o resultado de cada pedido é o mesmo do script e que a agenda
+envia os pedidos recorrentes.
+
+O login completo é medido numa amostra dos pedidos (--amostra) e projetado
+para todos; a importação é medida num processo Python novo.
+
+Uso: python benchmark_servico.py [--pedidos N] [--clientes N] [--sessoes N] [--amostra N]
+                                 [--latencia-chamada S] [--latencia-consulta S] [--latencia-conexao S]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+TABELAS_PEDIDOS = ['LIPS', 'VBFA', 'J_1BNFDOC', 'MARA', 'EBAN']
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark do serviço de extração")
+    parser.add_argument('--linhas', type=int, default=20_000, help="Linhas da ZPMMT_287 sintética")
+    parser.add_argument('--pedidos', type=int, default=60)
+    parser.add_argument('--clientes', type=int, default=8, help="Clientes enviando pedidos ao mesmo tempo")
+    parser.add_argument('--sessoes', type=int, default=3)
+    parser.add_argument('--amostra', type=int, default=5, help="Pedidos medidos com login completo")
+    parser.add_argument('--latencia-chamada', type=float, default=0.001)
+    parser.add_argument('--latencia-consulta', type=float, default=0.05)
+    parser.add_argument('--latencia-conexao', type=float, default=2.0)
+    argumentos = parser.parse_args()
+    argumentos.formato = 'txt'
+    argumentos.formato_ontime = 'parquet'
+    argumentos.backend = 'gui'
+    return argumentos
+
+
+def gerar_pedidos(tabelas, quantidade, semente=7):
+    """Pedidos de 3 a 20 chaves, sorteadas de poucas centenas por tabela (há sobreposição entre eles)."""
+    from sap_fake import CAMPOS
+    from sap_se16n import TABELAS
+
+    sorteio = random.Random(semente)
+    universos = {}
+    for tabela in TABELAS_PEDIDOS:
+        coluna = CAMPOS[tabela][TABELAS[tabela].campo_chave]
+        universos[tabela] = sorted(tabelas[tabela][coluna].dropna().astype(str).unique())[:300]
+    pedidos = []
+    for _ in range(quantidade):
+        tabela = sorteio.choice(TABELAS_PEDIDOS)
+        pedidos.append((tabela, sorteio.sample(universos[tabela], sorteio.randint(3, 20))))
+    return pedidos
+
+
+def medir_importacao(repeticoes=3):
+    """Segundos para um processo Python novo importar os módulos do SAP.py."""
+    comando = [sys.executable, '-c', 'import pandas, agendador, etapas_ontime, extratores, retomada, '
+                                     'sessoes_sap, rastreamento, cache_chaves']
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        subprocess.run(comando, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def ordenar(df):
+    return df.sort_values(list(df.columns), na_position='first', kind='stable').reset_index(drop=True)
+
+
+def pedido_por_script(motor, pedido, argumentos, pasta, pasta_cache, rastreador):
+    """
+    Um pedido como um script faria: login completo (motor None) ou sessões
+    reaproveitadas, arquivo de chaves e extração com cache. Retorna o DataFrame.
+    """
+    from benchmark_sessoes import login_completo
+    from cache_chaves import extrair_com_cache
+    from extratores import ExtratorGUI
+    from gravador_tabelas import gravar_chaves
+    from leitor_sap import ler_exportacao
+    from sap_fake import LatenciaFalsa, MotorSapFalso
+    from sap_se16n import TABELAS
+    from sessoes_sap import reaproveitar_sessoes
+
+    tabela, chaves = pedido
+    with rastreador.etapa('LOGIN') as registro:
+        if motor is None:
+            motor = MotorSapFalso(argumentos.tabelas, LatenciaFalsa(argumentos.latencia_chamada,
+                                                                    argumentos.latencia_consulta,
+                                                                    conexao=argumentos.latencia_conexao))
+            ids = login_completo(motor, argumentos.sessoes, registro)
+        else:
+            ids = reaproveitar_sessoes(registro.instrumentar(motor), 'usuario', argumentos.sessoes)
+    sessoes = [lambda sessao=motor.findById(i): sessao for i in ids]
+    spec = TABELAS[tabela]
+    gravar_chaves(pd.Series(chaves), os.path.join(pasta, spec.arquivo_chaves))
+    extrair_com_cache(sessoes, spec, pasta, pasta_cache, ExtratorGUI())
+    return ler_exportacao(os.path.join(pasta, spec.arquivo_saida))
+
+
+def rodar_scripts(pedidos, argumentos, raiz, rastreador):
+    """Pedidos em sequência, um script por pedido: (segundos login completo por pedido, segundos totais reaproveitando, resultados)."""
+    from benchmark_sessoes import login_completo
+    from sap_fake import LatenciaFalsa, MotorSapFalso
+
+    pasta = os.path.join(raiz, 'script')
+    os.makedirs(pasta)
+    inicio = time.perf_counter()
+    for pedido in pedidos[:argumentos.amostra]:
+        pedido_por_script(None, pedido, argumentos, pasta, os.path.join(raiz, 'cache_frio'), rastreador)
+    por_pedido_frio = (time.perf_counter() - inicio) / max(1, min(argumentos.amostra, len(pedidos)))
+
+    motor = MotorSapFalso(argumentos.tabelas, LatenciaFalsa(argumentos.latencia_chamada, argumentos.latencia_consulta))
+    with rastreador.etapa('LOGIN') as registro:
+        login_completo(motor, argumentos.sessoes, registro)
+    resultados = []
+    inicio = time.perf_counter()
+    for pedido in pedidos:
+        resultados.append(pedido_por_script(motor, pedido, argumentos, pasta, os.path.join(raiz, 'cache_quente'),
+                                            rastreador))
+    return por_pedido_frio, time.perf_counter() - inicio, resultados
+
+
+def rodar_servico(pedidos, argumentos, raiz, rastreador):
+    """Serviço com as sessões logadas e pedidos pela API HTTP: (segundos, estado, resultados, servico)."""
+    from benchmark_sessoes import login_completo
+    from extratores import ExtratorGUI
+    from leitor_sap import ler_exportacao
+    from sap_fake import LatenciaFalsa, MotorSapFalso
+    from servico_extracao import ServicoExtracao, chamar_api, criar_servidor_http
+
+    motor = MotorSapFalso(argumentos.tabelas, LatenciaFalsa(argumentos.latencia_chamada, argumentos.latencia_consulta))
+    with rastreador.etapa('LOGIN') as registro:
+        ids = login_completo(motor, argumentos.sessoes, registro)
+    servico = ServicoExtracao([lambda sessao=motor.findById(i): sessao for i in ids], ExtratorGUI(),
+                              pasta=os.path.join(raiz, 'servico'), pasta_cache=os.path.join(raiz, 'cache_servico'))
+    servidor = criar_servidor_http(servico.fila, '127.0.0.1', 0)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    porta = servidor.server_address[1]
+    servico.iniciar()
+
+    def enviar(pedido):
+        status, resposta = chamar_api('POST', '/trabalhos?esperar=600', {'tabela': pedido[0], 'chaves': pedido[1]},
+                                      '127.0.0.1', porta)
+        if status != 200 or resposta['estado'] != 'concluido':
+            raise AssertionError(f"Pedido {pedido[0]} terminou com {status}: {resposta}")
+        return resposta
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=argumentos.clientes) as executor:
+        respostas = list(executor.map(enviar, pedidos))
+    segundos = time.perf_counter() - inicio
+    _, estado = chamar_api('GET', '/estado', host='127.0.0.1', porta=porta)
+    resultados = [ler_exportacao(resposta['arquivo']) for resposta in respostas]
+    servidor.shutdown()
+    return segundos, estado, resultados, servico
+
+
+def conferir_agenda(servico, raiz, chaves):
+    """Um item da agenda vira um pedido com origem 'agenda', atendido pelos trabalhadores."""
+    from servico_extracao import AgendaExtracao
+
+    caminho = os.path.join(raiz, 'agenda_servico.json')
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump([{'tabela': 'MARA', 'chaves': chaves, 'a_cada_minutos': 60}], arquivo)
+    agenda = AgendaExtracao(servico.fila, caminho)
+    enviados = agenda.verificar()
+    assert len(enviados) == 1 and not agenda.verificar(), "A agenda deveria enviar o item uma vez por intervalo."
+    trabalho = servico.fila.esperar(enviados[0].id, 60)
+    assert trabalho.estado == 'concluido' and trabalho.origem == 'agenda', trabalho
+
+
+if __name__ == '__main__':
+    argumentos = ler_argumentos()
+    raiz = os.path.join(tempfile.mkdtemp(prefix='benchmark_servico_'), 'ONTIME')
+    from benchmark_sap import preparar_ambiente
+    preparar_ambiente(argumentos, raiz)
+    os.environ['SAP_MANDANTE'] = '100'
+    os.makedirs(raiz)
+    try:
+        from rastreamento import Rastreador
+        from sap_fake import gerar_tabelas
+
+        argumentos.tabelas = gerar_tabelas(argumentos.linhas)
+        pedidos = gerar_pedidos(argumentos.tabelas, argumentos.pedidos)
+        rastreador = Rastreador(pasta=os.path.join(raiz, 'rastreamento'))
+        n = len(pedidos)
+        print(f"{n} pedidos de {min(len(c) for _, c in pedidos)} a {max(len(c) for _, c in pedidos)} chaves "
+              f"({sum(len(c) for _, c in pedidos)} no total), {argumentos.sessoes} sessões, "
+              f"{argumentos.clientes} clientes")
+
+        importacao = medir_importacao()
+        with contextlib.redirect_stdout(io.StringIO()):
+            por_pedido_frio, total_quente, esperados = rodar_scripts(pedidos, argumentos, raiz, rastreador)
+            segundos, estado, obtidos, servico = rodar_servico(pedidos, argumentos, raiz, rastreador)
+
+        frio = n * (importacao + por_pedido_frio)
+        quente = n * importacao + total_quente
+        print(f"  {'':<44} {'total':>9} {'pedidos/s':>10}")
+        print(f"  {'script a cada pedido, login completo*':<44} {frio:8.2f}s {n / frio:10.2f}")
+        print(f"  {'script a cada pedido, sessão reaproveitada':<44} {quente:8.2f}s {n / quente:10.2f}")
+        print(f"  {'serviço (API HTTP, sessões logadas)':<44} {segundos:8.2f}s {n / segundos:10.2f}")
+        print(f"  * projetado de {min(argumentos.amostra, n)} pedido(s); importação num processo novo: "
+              f"{importacao:.2f}s por script")
+        print(f"  serviço: {estado['lotes']} lotes para {n} pedidos ({estado['pedidos_por_lote']} por lote, "
+              f"{estado['caronas']} carona(s)), {estado['consultas_sap']} consultas ao SAP, "
+              f"{estado['chaves_consultadas']} de {estado['chaves_pedidas']} chaves pedidas enviadas")
+        print(f"  latência no serviço: p50 {estado['latencia_s']['p50']:.2f}s, p95 {estado['latencia_s']['p95']:.2f}s "
+              f"(espera na fila p50 {estado['espera_s']['p50']:.2f}s)")
+
+        for (tabela, _), esperado, obtido in zip(pedidos, esperados, obtidos):
+            pd.testing.assert_frame_equal(ordenar(esperado), ordenar(obtido), obj=tabela)
+        print(f"  ✔ resultado de cada um dos {n} pedidos igual ao do script")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            conferir_agenda(servico, raiz, next(chaves for tabela, chaves in pedidos if tabela == 'MARA'))
+            servico.parar()
+        print("  ✔ agenda enviou o pedido recorrente e o serviço o atendeu")
+    finally:
+        shutil.rmtree(os.path.dirname(raiz), ignore_errors=True)
+    sys.exit(0)
@@ -0,0 +1,144 @@
+"""
+Mede o início de uma execução com login completo e com a conexão já logada
+reaproveitada (sessoes_sap.py), no SAP GUI falso, e confere que sessões
+ocupadas, com diálogo aberto, em outra transação, na SE16N sem terem sido
+abertas pelo processo ou de outro usuário/mandante não são usadas. Sem sessão
+livre, as sessões novas são abertas na mesma conexão e nada é fechado.
+
+O falso não abre o saplogon.exe: o login completo mede a conexão, o login e
+as sessões novas (com --latencia-conexao simulando a tela de logon); numa
+máquina real o SAP Logon ainda soma seus segundos de inicialização.
+
+Uso: python benchmark_sessoes.py [--sessoes N] [--latencia-chamada S] [--latencia-conexao S]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark do reaproveitamento de sessões SAP")
+    parser.add_argument('--sessoes', type=int, default=3)
+    parser.add_argument('--latencia-chamada', type=float, default=0.001)
+    parser.add_argument('--latencia-conexao', type=float, default=2.0)
+    return parser.parse_args()
+
+
+def login_completo(motor, quantidade, registro):
+    """O login do SAP.py (fazer_login) sem o SAP Logon: conexão nova, usuário, senha e sessões paralelas."""
+    from sap_espera import aguardar_elemento
+    from sessoes_sap import abrir_sessoes_paralelas
+
+    connection = registro.instrumentar(motor).OpenConnection('S/4HANA PS4', True)
+    session = connection.Children(0)
+    aguardar_elemento(session, "wnd[0]/usr/txtRSYST-BNAME").Text = 'USUARIO'
+    aguardar_elemento(session, "wnd[0]/usr/pwdRSYST-BCODE").Text = 'SENHA'
+    session.findById("wnd[0]").sendVKey(0)
+    return abrir_sessoes_paralelas(connection, session, quantidade)
+
+
+def iniciar(motor, quantidade, rastreador, nome):
+    """Como o SAP.py: reaproveita a conexão logada ou faz o login completo. Retorna (ids, reaproveitou, registro)."""
+    from sessoes_sap import reaproveitar_sessoes
+
+    with contextlib.redirect_stdout(io.StringIO()), rastreador.etapa(nome) as registro:
+        ids = reaproveitar_sessoes(registro.instrumentar(motor), 'usuario', quantidade)
+        reaproveitou = bool(ids)
+        if not ids:
+            ids = login_completo(motor, quantidade, registro)
+    return ids, reaproveitou, registro
+
+
+def transacao(motor, id_sessao, codigo):
+    sessao = motor.findById(id_sessao)
+    sessao.findById("wnd[0]/tbar[0]/okcd").text = codigo
+    sessao.findById("wnd[0]").sendVKey(0)
+
+
+def imprimir(descricao, registro, ids, reaproveitou):
+    origem = 'reaproveitadas' if reaproveitou else 'login completo'
+    print(f"  {descricao:<36} {registro.segundos:7.3f}s {sum(registro.chamadas_com.values()):>4} chamadas COM  "
+          f"{origem}: {', '.join(i.replace('/app/', '') for i in ids)}")
+
+
+if __name__ == '__main__':
+    argumentos = ler_argumentos()
+    os.environ['ONTIME_PASTA'] = tempfile.mkdtemp(prefix='benchmark_sessoes_')
+    os.environ['SAP_INTERVALO_VERIFICACAO'] = '0.005'
+    os.environ['SAP_MANDANTE'] = '100'
+    import configuracao
+    from rastreamento import Rastreador
+    from sap_fake import LatenciaFalsa, MotorSapFalso
+    from sessoes_sap import reaproveitar_sessoes
+
+    latencia = LatenciaFalsa(chamada=argumentos.latencia_chamada, conexao=argumentos.latencia_conexao)
+    motor = MotorSapFalso({}, latencia)
+    rastreador = Rastreador(pasta=os.path.join(os.environ['ONTIME_PASTA'], 'rastreamento'))
+    n = argumentos.sessoes
+    print(f"{n} sessões por execução")
+
+    ids, reaproveitou, registro = iniciar(motor, n, rastreador, 'primeira')
+    assert not reaproveitou and len(ids) == n
+    imprimir("primeira execução (SAP fechado)", registro, ids, reaproveitou)
+
+    # A execução anterior deixa as sessões na SE16N e na ZPMMT_287
+    for id_sessao, codigo in zip(ids, ['ZPMMT_287', 'SE16N', 'SE16N']):
+        transacao(motor, id_sessao, codigo)
+    ids_quentes, reaproveitou, registro = iniciar(motor, n, rastreador, 'segunda')
+    assert reaproveitou and sorted(ids_quentes) == sorted(ids)
+    imprimir("execução seguinte (conexão logada)", registro, ids_quentes, reaproveitou)
+
+    # Sessões que não podem ser usadas: ocupada, com diálogo aberto, em outra transação e
+    # uma sessão que o usuário abriu e deixou na SE16N (não registrada pelo processo)
+    conexao = motor.Children[0]
+    conexao.nova_sessao()
+    manual = conexao.Children[-1]
+    transacao(motor, manual.Id, 'SE16N')
+    conexao.Children[0].ocupar(60)
+    if n > 1:
+        conexao.Children[1].dialogos.append('selecao_multipla')
+    if n > 2:
+        transacao(motor, conexao.Children[2].Id, 'VA01')
+    conexao.nova_sessao()
+    livre = conexao.Children[-1].Id
+    ids_parciais, reaproveitou, registro = iniciar(motor, n, rastreador, 'terceira')
+    assert reaproveitou and ids_parciais[0] == livre
+    assert not set(ids_parciais) & {conexao.Children[i].Id for i in range(min(n, 3))}
+    assert manual.Id not in ids_parciais and manual.transacao == 'SE16N'
+    imprimir("com sessões ocupadas ou em uso", registro, ids_parciais, reaproveitou)
+
+    # Nenhuma sessão livre (todas em transações do usuário): sessões novas na mesma conexão,
+    # sem mexer nas do usuário; todas ocupadas: para com uma mensagem, sem fechar nada
+    motor_cheio = MotorSapFalso({}, LatenciaFalsa(chamada=argumentos.latencia_chamada))
+    iniciar(motor_cheio, n, rastreador, 'login')
+    cheia = motor_cheio.Children[0]
+    do_usuario = list(cheia.Children)
+    for sessao in do_usuario:
+        transacao(motor_cheio, sessao.Id, 'VA01')
+    do_usuario[-1].dialogos.append('selecao_multipla')
+    ids_novas, reaproveitou, registro = iniciar(motor_cheio, n, rastreador, 'quarta')
+    assert reaproveitou and len(ids_novas) == n and not set(ids_novas) & {s.Id for s in do_usuario}
+    assert all(sessao.transacao == 'VA01' for sessao in do_usuario) and do_usuario[-1].dialogos
+    assert len(motor_cheio.Children) == 1
+    imprimir("sem sessão livre (todas em uso)", registro, ids_novas, reaproveitou)
+    for sessao in cheia.Children:
+        sessao.ocupar(60)
+    configuracao.TIMEOUT_PADRAO = 0.05
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            reaproveitar_sessoes(motor_cheio, 'usuario', n)
+        raise AssertionError("Conexão com todas as sessões ocupadas deveria parar com uma mensagem.")
+    except RuntimeError:
+        pass
+    assert len(cheia.Children) == 2 * n and len(motor_cheio.Children) == 1
+    print("  ✔ sessões do usuário em uso ficam como estão; todas ocupadas param sem fechar nada")
+
+    # Outro mandante ou outro usuário: login completo
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert reaproveitar_sessoes(motor, 'usuario', n, mandante='200') is None
+        assert reaproveitar_sessoes(motor, 'outro', n) is None
+    print("  ✔ outro mandante e outro usuário não reaproveitam a conexão")
+    sys.exit(0)
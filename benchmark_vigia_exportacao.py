@@ -0,0 +1,123 @@
+"""
+Mede a espera pelas exportações (vigia_exportacao.py) no SAP GUI falso com
+gravação em segundo plano: o arquivo vai aparecendo aos poucos depois que a
+sessão fica livre, como no SAP GUI. Para cada formato compara:
+
+  versão anterior  lê o arquivo assim que a sessão fica livre
+  espera fixa      versão anterior + um tempo fixo antes de ler
+  vigia            aguardar_exportacao (arquivo completo e desbloqueado)
+
+e conta as leituras erradas (arquivo inexistente, incompleto ou com menos
+linhas). O fechamento do Excel e o bloqueio de arquivos só existem no
+Windows e não são medidos aqui.
+
+Uso: python benchmark_vigia_exportacao.py [--exportacoes N] [--linhas N]
+                                          [--escrita S] [--espera-fixa S]
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Benchmark da espera pelas exportações do SAP GUI")
+    parser.add_argument('--exportacoes', type=int, default=10, help="Exportações por formato e modo")
+    parser.add_argument('--linhas', type=int, default=20_000, help="Linhas da ZPMMT_287 sintética")
+    parser.add_argument('--escrita', type=float, default=0.3,
+                        help="Segundos que o SAP falso leva gravando o arquivo depois de liberar a sessão")
+    parser.add_argument('--espera-fixa', type=float, default=1.0)
+    argumentos = parser.parse_args()
+    argumentos.formato = 'txt'
+    argumentos.formato_ontime = 'parquet'
+    argumentos.backend = 'gui'
+    argumentos.sessoes = 1
+    return argumentos
+
+
+@contextlib.contextmanager
+def versao_anterior():
+    """Exportação como antes do vigia: sem apagar o arquivo anterior e sem esperar a gravação."""
+    import sap_se16n
+    originais = sap_se16n.preparar_destino, sap_se16n.aguardar_exportacao
+    sap_se16n.preparar_destino = lambda caminho: None
+    sap_se16n.aguardar_exportacao = lambda caminho, *args, **kwargs: caminho
+    try:
+        yield
+    finally:
+        sap_se16n.preparar_destino, sap_se16n.aguardar_exportacao = originais
+
+
+def exportar(session, motor, formato, modo, numero, pasta, espera_fixa):
+    """Uma exportação da grade aberta e a leitura do arquivo. Retorna (segundos, linhas lidas ou None, atraso)."""
+    from leitor_sap import arquivo_exportado, ler_exportacao
+    from sap_se16n import exportar_texto, exportar_xxl
+
+    nome = f"LIPS_{modo.replace(' ', '_')}_{numero}"
+    caminho = os.path.join(pasta, arquivo_exportado(nome, formato))
+    exportar_arquivo = exportar_texto if formato == 'txt' else exportar_xxl
+    inicio = time.monotonic()
+    with versao_anterior() if modo != 'vigia' else contextlib.nullcontext():
+        exportar_arquivo(session, nome, pasta)
+    if modo == 'espera fixa':
+        time.sleep(espera_fixa)
+    pronto = time.monotonic()
+    try:
+        linhas = len(ler_exportacao(caminho))
+    except Exception:
+        linhas = None
+    segundos = time.monotonic() - inicio
+    # A próxima exportação só começa depois que o falso terminou de gravar esta (fora da medição)
+    while motor.gravacoes.get(caminho, 0) < inicio:
+        time.sleep(0.01)
+    return segundos, linhas, pronto - motor.gravacoes[caminho]
+
+
+if __name__ == '__main__':
+    argumentos = ler_argumentos()
+    raiz = os.path.join(tempfile.mkdtemp(prefix='benchmark_vigia_'), 'ONTIME')
+    from benchmark_sap import preparar_ambiente
+    preparar_ambiente(argumentos, raiz)
+    os.makedirs(raiz)
+    try:
+        from benchmark_sessoes import login_completo
+        from gravador_tabelas import gravar_chaves
+        from rastreamento import Rastreador
+        from sap_fake import LatenciaFalsa, MotorSapFalso, gerar_tabelas
+        from sap_se16n import extrair_se16n
+
+        tabelas = gerar_tabelas(argumentos.linhas)
+        motor = MotorSapFalso(tabelas, LatenciaFalsa(escrita=argumentos.escrita))
+        with Rastreador(pasta=os.path.join(raiz, 'rastreamento')).etapa('LOGIN') as registro:
+            session = motor.findById(login_completo(motor, 1, registro)[0])
+        gravar_chaves(tabelas['LIPS']['Documento de referência'].drop_duplicates(),
+                      os.path.join(raiz, 'PEDIDOS_CONSOLIDADO.txt'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Deixa a grade da LIPS aberta na sessão para as exportações
+            extrair_se16n(session, 'LIPS', 'VGBEL', 'PEDIDOS_CONSOLIDADO.txt', pasta=raiz)
+        esperadas = len(session.resultado)
+        print(f"{argumentos.exportacoes} exportações de {esperadas} linhas por formato e modo; "
+              f"o SAP falso grava cada arquivo em {argumentos.escrita:.2f}s depois de liberar a sessão")
+
+        print(f"  {'formato':<8} {'modo':<16} {'média':>8} {'erradas':>8} {'atraso após a gravação':>24}")
+        for formato in ('txt', 'xlsx'):
+            for modo in ('versão anterior', 'espera fixa', 'vigia'):
+                medicoes = [exportar(session, motor, formato, modo, numero, raiz, argumentos.espera_fixa)
+                            for numero in range(argumentos.exportacoes)]
+                erradas = sum(linhas != esperadas for _, linhas, _ in medicoes)
+                atrasos = [atraso for _, linhas, atraso in medicoes if linhas == esperadas]
+                atraso = f"{pd.Series(atrasos).mean() * 1000:7.0f} ms" if atrasos else '-'
+                print(f"  {formato:<8} {modo:<16} {pd.Series([s for s, _, _ in medicoes]).mean():7.2f}s "
+                      f"{erradas:>8} {atraso:>24}")
+                if modo == 'vigia' and erradas:
+                    raise AssertionError(f"{erradas} leitura(s) erradas com o vigia ({formato}).")
+        print("  ✔ com o vigia todas as leituras têm o arquivo completo")
+    finally:
+        shutil.rmtree(os.path.dirname(raiz), ignore_errors=True)
+    sys.exit(0)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, replace
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from configuracao import PASTA_ONTIME, PASTA_CHAVES
+from cache_colunar import ler_tabela, preparar_para_parquet
+from leitor_sap import arquivo_exportado, gravar_exportacao
+from gravador_tabelas import gravar_chaves
+from sap_se16n import ResultadoExtracao
+from lotes_chaves import normalizar_chaves
+from extratores import criar_extrator
+
+# Colunas internas do cache de chaves
+COLUNA_CHAVE = '_chave'
+COLUNA_GRAVADO_EM = '_gravado_em'
+# Chave dos metadados do Parquet com a assinatura da consulta que gerou as linhas
+METADADO_ASSINATURA = b'ontime_assinatura'
+
+
+def ler_arquivo_chaves(caminho):
+    """Chaves (uma por linha) de um arquivo enviado à SE16N, já normalizadas e sem repetição."""
+    chaves = pd.read_csv(caminho, header=None, dtype=str, skip_blank_lines=True).iloc[:, 0].dropna()
+    return pd.Index(normalizar_chaves(chaves)).unique()
+
+
+def caminho_cache(tabela, pasta=None):
+    return os.path.join(pasta or PASTA_CHAVES, f"{tabela}.parquet")
+
+
+def assinatura_consulta(spec):
+    """
+    Resumo do que define as colunas exportadas (campos, variante, filtros e tabela de
+    textos): linhas guardadas com outra assinatura não servem para a consulta atual.
+    """
+    consulta = {'campos': spec.campos, 'variante': spec.variante, 'filtros': spec.filtros,
+                'textos': asdict(spec.textos) if spec.textos is not None else None}
+    return hashlib.sha256(json.dumps(consulta, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def apagar_cache(tabela, pasta=None):
+    caminho = caminho_cache(tabela, pasta)
+    if os.path.exists(caminho):
+        os.remove(caminho)
+
+
+def carregar_cache(tabela, validade_dias, pasta=None, assinatura=None):
+    """
+    Linhas guardadas da tabela, sem as que passaram da validade. Com `assinatura`,
+    um cache gravado para outra consulta (ou sem assinatura) conta como inexistente.
+    """
+    caminho = caminho_cache(tabela, pasta)
+    if not os.path.exists(caminho):
+        return None
+    if assinatura is not None:
+        metadados = pq.read_schema(caminho).metadata or {}
+        if metadados.get(METADADO_ASSINATURA, b'').decode('utf-8') != assinatura:
+            print(f"⚠ Cache de chaves {tabela} gravado com outros campos ou outra variante; "
+                  f"todas as chaves serão consultadas de novo.")
+            return None
+    guardado = pd.read_parquet(caminho)
+    if validade_dias is not None:
+        limite = time.time() - validade_dias * 86400
+        guardado = guardado[guardado[COLUNA_GRAVADO_EM] >= limite]
+    return guardado
+
+
+def salvar_cache(tabela, guardado, pasta=None, assinatura=None):
+    """Grava as linhas guardadas, com a `assinatura` da consulta nos metadados do Parquet."""
+    caminho = caminho_cache(tabela, pasta)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    arrow = pa.Table.from_pandas(preparar_para_parquet(guardado), preserve_index=False)
+    if assinatura is not None:
+        arrow = arrow.replace_schema_metadata({**(arrow.schema.metadata or {}),
+                                               METADADO_ASSINATURA: assinatura.encode('utf-8')})
+    pq.write_table(arrow, caminho + '.tmp')
+    os.replace(caminho + '.tmp', caminho)
+
+
+def extrair_com_cache(sessoes, spec, pasta=PASTA_ONTIME, pasta_cache=None, extrator=None, forcar=False):
+    """
+    Extrai uma tabela do registro consultando no SAP só as chaves que ainda
+    não estão no cache (ou cujas linhas venceram) e junta as linhas guardadas
+    às novas no arquivo de saída de sempre. Tabelas sem `coluna_chave` no
+    registro seguem pela extração normal. `sessoes` é a lista de funções que
+    abrem as sessões da etapa (ver lotes_chaves.extrair_em_lotes) e `extrator`
+    o backend de extração (padrão: SAP_BACKEND_EXTRACAO, ver extratores.py).
+    Com `forcar`, todas as chaves são consultadas de novo e atualizam o cache.
+    As linhas guardadas só valem para a mesma consulta (assinatura_consulta) e
+    com as mesmas colunas da exportação nova; senão o cache é refeito.
+    """
+    extrator = extrator or criar_extrator()
+    if spec.coluna_chave is None:
+        return extrator.extrair(sessoes, spec, pasta)
+
+    chaves = ler_arquivo_chaves(os.path.join(pasta, spec.arquivo_chaves))
+    assinatura = assinatura_consulta(spec)
+    guardado = carregar_cache(spec.tabela, spec.validade_dias, pasta_cache, assinatura)
+    if guardado is None and not len(chaves):
+        return extrator.extrair(sessoes, spec, pasta)
+    conhecidas = guardado[COLUNA_CHAVE].unique() if guardado is not None else []
+    novas = chaves if forcar else chaves.difference(conhecidas)
+    print(f"Cache de chaves {spec.tabela}: {len(chaves) - len(novas)} de {len(chaves)} chaves já guardadas, "
+          f"{len(novas)} serão consultadas.")
+
+    if len(novas):
+        # Consulta só o delta, em arquivos próprios para não sobrescrever os completos
+        nome_delta = f"{spec.tabela}_DELTA"
+        gravar_chaves(pd.Series(novas), os.path.join(pasta, f"{nome_delta}.txt"))
+        resultado = extrator.extrair(sessoes, replace(spec, arquivo_chaves=f"{nome_delta}.txt", saida=nome_delta),
+                                     pasta)
+        delta = ler_tabela(os.path.join(pasta, arquivo_exportado(nome_delta)))
+        if spec.coluna_chave not in delta.columns:
+            # Sem a coluna-chave não há como guardar: devolve só o que veio do SAP
+            print(f"⚠ Coluna '{spec.coluna_chave}' não encontrada na exportação da {spec.tabela}; cache ignorado.")
+            gravar_exportacao(delta, os.path.join(pasta, spec.arquivo_saida))
+            return resultado
+        delta[COLUNA_CHAVE] = normalizar_chaves(delta[spec.coluna_chave])
+        delta[COLUNA_GRAVADO_EM] = time.time()
+        if guardado is not None and list(guardado.columns) != list(delta.columns):
+            # A variante mudou no SAP sem mudar o registro: as linhas guardadas não têm as mesmas colunas
+            print(f"⚠ Colunas da exportação da {spec.tabela} mudaram; o cache de chaves será refeito.")
+            apagar_cache(spec.tabela, pasta_cache)
+            return extrair_com_cache(sessoes, spec, pasta, pasta_cache, extrator, forcar)
+        if guardado is not None:
+            # Linhas novas substituem as antigas da mesma chave
+            guardado = guardado[~guardado[COLUNA_CHAVE].isin(delta[COLUNA_CHAVE])]
+            guardado = pd.concat([guardado, delta], ignore_index=True)
+        else:
+            guardado = delta
+        salvar_cache(spec.tabela, guardado, pasta_cache, assinatura)
+    else:
+        resultado = ResultadoExtracao(spec.tabela, 0, 0, 0.0, 0.0)
+
+    # Arquivo completo (guardadas + novas) com o nome que as próximas etapas esperam
+    completo = guardado[guardado[COLUNA_CHAVE].isin(chaves)].drop(columns=[COLUNA_CHAVE, COLUNA_GRAVADO_EM])
+    gravar_exportacao(completo, os.path.join(pasta, spec.arquivo_saida))
+    print(f"Tabela {spec.tabela}: {len(completo)} linhas gravadas em {spec.arquivo_saida} "
+          f"({resultado.linhas} vindas do SAP).")
+    return resultado
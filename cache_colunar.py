@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from configuracao import PASTA_CACHE, CACHE_TAMANHO_MAXIMO_MB
+from esquemas_sap import tipos_do_arquivo
+from leitor_sap import compactar_chaves, ler_blocos_texto, ler_exportacao
+
+ARQUIVO_INDICE = 'indice.json'
+
+# Um lock por arquivo de origem (duas etapas lendo a ZPMMT ao mesmo tempo
+# convertem o arquivo uma vez só) e um para o índice do cache
+_locks_origem = {}
+_lock_indice = threading.Lock()
+
+
+def calcular_hash(caminho, tamanho_bloco=1024 * 1024):
+    """SHA-256 do conteúdo do arquivo."""
+    resumo = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+def carregar_indice(pasta):
+    """
+    Lê o índice do cache: {'origens': {caminho: {tamanho, mtime, hash}},
+    'entradas': {hash[-tipos]: {arquivo, bytes, ultimo_uso, hash}}}.
+    """
+    try:
+        with open(os.path.join(pasta, ARQUIVO_INDICE), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'origens': {}, 'entradas': {}}
+
+
+def salvar_indice(pasta, indice):
+    """Grava o índice de forma atômica (arquivo temporário + rename)."""
+    caminho = os.path.join(pasta, ARQUIVO_INDICE)
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(indice, arquivo, indent=1)
+    os.replace(temporario, caminho)
+
+
+def preparar_para_parquet(df):
+    """Colunas de texto com tipos misturados (ex.: números e textos vindos do Excel) viram texto."""
+    df = df.copy()
+    df.columns = [str(coluna) for coluna in df.columns]
+    for coluna in df.columns:
+        if df[coluna].dtype == object:
+            valores = df[coluna].dropna()
+            if not valores.map(type).eq(str).all():
+                df[coluna] = df[coluna].map(lambda v: v if v is None or pd.isna(v) else str(v))
+    return df
+
+
+def remover_excedente(pasta, indice, limite_bytes):
+    """Apaga as entradas usadas há mais tempo até o cache caber no limite (LRU)."""
+    entradas = indice['entradas']
+    total = sum(e['bytes'] for e in entradas.values())
+    for hash_conteudo, entrada in sorted(entradas.items(), key=lambda item: item[1]['ultimo_uso']):
+        if total <= limite_bytes:
+            break
+        try:
+            os.remove(os.path.join(pasta, entrada['arquivo']))
+        except FileNotFoundError:
+            pass
+        total -= entrada['bytes']
+        del entradas[hash_conteudo]
+        print(f"Cache: removida a entrada {entrada['arquivo']} (limite de {limite_bytes / 1024 ** 2:.0f} MB)")
+    # Origens que apontavam para entradas removidas deixam de valer
+    vivos = {entrada.get('hash', chave) for chave, entrada in entradas.items()}
+    indice['origens'] = {c: o for c, o in indice['origens'].items() if o['hash'] in vivos}
+
+
+def assinatura_tipos(tipos):
+    """Resumo dos tipos do esquema: o mesmo conteúdo lido com outro esquema é outra entrada do cache."""
+    return hashlib.sha256(json.dumps(sorted(tipos.items())).encode('utf-8')).hexdigest()[:12]
+
+
+def esquema_arrow(bloco):
+    """
+    Esquema Parquet fixado pelo primeiro bloco: inteiros como int64 (com
+    vazios), textos como string e category como dicionário, para que os
+    blocos seguintes (com outros vazios e outras categorias) caibam nele.
+    """
+    esquema = pa.Schema.from_pandas(bloco, preserve_index=False)
+    for indice, campo in enumerate(esquema):
+        dtype = bloco[campo.name].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            tipo = pa.dictionary(pa.int32(), pa.string())
+        elif dtype == object:
+            tipo = pa.string()
+        elif pd.api.types.is_integer_dtype(dtype):
+            tipo = pa.int64()
+        else:
+            continue
+        esquema = esquema.set(indice, pa.field(campo.name, tipo))
+    return esquema
+
+
+def converter_para_parquet(origem, destino, tipos):
+    """
+    Converte a exportação para Parquet. O texto é gravado bloco a bloco
+    (ler_texto_sap), sem juntar o arquivo inteiro na memória; a planilha .xlsx
+    é lida inteira pelo pandas.
+    """
+    temporario = destino + '.tmp'
+
+    def gravar_blocos(blocos):
+        # Chamada de novo do início se ler_blocos_texto precisar reler o arquivo
+        escritor = None
+        try:
+            for bloco in blocos:
+                bloco = preparar_para_parquet(bloco)
+                if escritor is None:
+                    esquema = esquema_arrow(bloco)
+                    escritor = pq.ParquetWriter(temporario, esquema)
+                escritor.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+        finally:
+            if escritor is not None:
+                escritor.close()
+
+    if origem.lower().endswith('.xlsx'):
+        preparar_para_parquet(ler_exportacao(origem, tipos=tipos)).to_parquet(temporario, index=False)
+    else:
+        ler_blocos_texto(origem, gravar_blocos, tipos=tipos)
+    os.replace(temporario, destino)
+
+
+def ler_tabela(caminho, colunas=None, tipos=None, pasta_cache=None, limite_mb=None):
+    """
+    Lê uma exportação do SAP passando por um cache colunar (Parquet).
+
+    Na primeira leitura o arquivo é convertido inteiro, com os tipos do
+    esquema da tabela (esquemas_sap.py, ou `tipos`), e gravado no cache,
+    identificado pelo hash do conteúdo e do esquema. Toda leitura (inclusive
+    em outra execução) carrega do Parquet só as `colunas` pedidas. Se o
+    tamanho e a data de modificação do arquivo não mudaram, nem o hash é
+    recalculado.
+    """
+    if caminho.lower().endswith('.parquet'):
+        # Já está em formato colunar (ex.: histórico da ZPMMT)
+        return pd.read_parquet(caminho, columns=colunas)
+
+    pasta_cache = pasta_cache or PASTA_CACHE
+    limite_bytes = (limite_mb or CACHE_TAMANHO_MAXIMO_MB) * 1024 ** 2
+    os.makedirs(pasta_cache, exist_ok=True)
+    origem = os.path.abspath(caminho)
+    tipos = tipos_do_arquivo(origem) if tipos is None else tipos
+
+    with _lock_indice:
+        lock = _locks_origem.setdefault(origem, threading.Lock())
+
+    with lock:
+        estado = os.stat(origem)
+        with _lock_indice:
+            indice = carregar_indice(pasta_cache)
+        conhecido = indice['origens'].get(origem)
+        if conhecido and conhecido['tamanho'] == estado.st_size and conhecido['mtime'] == estado.st_mtime_ns:
+            hash_conteudo = conhecido['hash']
+        else:
+            hash_conteudo = calcular_hash(origem)
+
+        chave_entrada = f"{hash_conteudo}-{assinatura_tipos(tipos)}" if tipos else hash_conteudo
+        entrada = indice['entradas'].get(chave_entrada)
+        arquivo_cache = os.path.join(pasta_cache, f"{chave_entrada}.parquet")
+        if entrada and os.path.exists(arquivo_cache):
+            print(f"Cache: {os.path.basename(origem)} lido do cache colunar.")
+        else:
+            converter_para_parquet(origem, arquivo_cache, tipos)
+            print(f"Cache: {os.path.basename(origem)} convertido para o cache colunar.")
+        if colunas is not None:
+            faltando = set(colunas) - set(pq.read_schema(arquivo_cache).names)
+            if faltando:
+                raise KeyError(f"Colunas não encontradas em {origem}: {sorted(faltando)}")
+        df = compactar_chaves(pd.read_parquet(arquivo_cache, columns=colunas), tipos)
+
+        with _lock_indice:
+            # Recarrega o índice: outra thread pode ter gravado nele nesse meio tempo
+            indice = carregar_indice(pasta_cache)
+            indice['entradas'][chave_entrada] = {
+                'arquivo': os.path.basename(arquivo_cache),
+                'bytes': os.path.getsize(arquivo_cache),
+                'ultimo_uso': time.time(),
+                'hash': hash_conteudo,
+            }
+            indice['origens'][origem] = {
+                'tamanho': estado.st_size, 'mtime': estado.st_mtime_ns, 'hash': hash_conteudo,
+            }
+            remover_excedente(pasta_cache, indice, limite_bytes)
+            salvar_indice(pasta_cache, indice)
+    return df
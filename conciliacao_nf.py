@@ -0,0 +1,320 @@
+"""
+Conciliação das notas fiscais entregues pela transportadora (relatórios
+tratados pelo JWM.py: 'Nft', 'CNPJ ORIGEM', 'Data chegada') com as notas do
+SAP (J_1BNFDOC), para levar a data de chegada a cada documento do SAP.
+
+Os dois lados viram um índice com a mesma chave normalizada: CNPJ do
+emissor e número da nota como inteiros (sem pontuação e sem zeros à
+esquerda) e a série, quando informada ('12345-1', '000012345/001').
+A busca é feita em níveis, do mais para o menos específico:
+
+  1. CNPJ + NF + série
+  2. CNPJ + NF (só quando o par é único nos dois lados)
+  3. NF, para notas da transportadora sem CNPJ (só quando o número é único)
+
+As entregas ficam guardadas em PASTA_CONCILIACAO (entregas.parquet), com o
+hash de cada relatório já incluído: um relatório novo só acrescenta ou
+substitui as notas dele, e os já incluídos não são lidos de novo.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from configuracao import PASTA_ONTIME, PASTA_CONCILIACAO, FORMATO_ONTIME
+from cache_colunar import calcular_hash
+from consolidacao_ontime import juntar, ler_campos
+from gravador_tabelas import (FORMATOS_SAIDA, formato_que_cabe, formatos_possiveis, gravar_tabela,
+                              remover_outros_formatos)
+from leitor_sap import arquivo_exportado
+from rastreamento import registrar, registrar_linhas
+
+# Colunas da J_1BNFDOC usadas na conciliação (cabeçalhos da exportação SE16N)
+COLUNAS_SAP = {'docnum': 'Nº documento', 'nf': 'Nº NF-e', 'serie': 'Série', 'cnpj': 'CNPJ emissor',
+               'data_documento': 'Data do documento'}
+# Colunas do relatório tratado pelo JWM.py
+COLUNAS_JWM = {'cte': 'N° OC', 'nf': 'Nft', 'cnpj': 'CNPJ ORIGEM', 'data_expedida': 'Data expedida',
+               'data_chegada': 'Data chegada'}
+
+ARQUIVO_ENTREGAS = 'entregas.parquet'
+ARQUIVO_RELATORIOS = 'relatorios_incluidos.json'
+ARQUIVO_CONCILIADAS = 'NF_CONCILIADAS'
+ARQUIVO_SEM_SAP = 'NF_TRANSPORTADORA_SEM_SAP.csv'
+ARQUIVO_SEM_ENTREGA = 'NF_SAP_SEM_TRANSPORTADORA.csv'
+CHAVE_ENTREGA = ['cnpj', 'nf', 'serie']
+# Níveis de busca: (critério, chaves, filtro das entregas candidatas)
+NIVEIS = [
+    ('CNPJ + NF + série', ['cnpj', 'nf', 'serie'], lambda e: e['cnpj'].notna() & e['serie'].notna()),
+    ('CNPJ + NF', ['cnpj', 'nf'], lambda e: e['cnpj'].notna()),
+    ('NF (sem CNPJ)', ['nf'], lambda e: e['cnpj'].isna()),
+]
+
+
+def arquivo_conciliadas(formato=None):
+    return ARQUIVO_CONCILIADAS + FORMATOS_SAIDA[formato or FORMATO_ONTIME]
+
+
+def arquivos_conciliadas(formato=None):
+    """Saídas da etapa CONCILIACAO_NF: o arquivo no formato pedido e, no xlsx, o csv usado quando não cabe."""
+    return [arquivo_conciliadas(possivel) for possivel in formatos_possiveis(formato or FORMATO_ONTIME)]
+
+
+def so_digitos(serie):
+    """Só os dígitos, como inteiro (Int64): tira pontuação, '.0' de float e zeros à esquerda."""
+    if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        return serie.round().astype('Int64')
+    # A maioria já vem só com dígitos ('000012345', '61064838000180'); as expressões
+    # regulares só rodam nos valores com pontuação
+    texto = serie.astype('string').str.strip()
+    so_numeros = texto.str.isdigit().fillna(False).to_numpy(dtype=bool)
+    numeros = pd.Series(pd.NA, index=serie.index, dtype='Int64')
+    numeros[so_numeros] = pd.to_numeric(texto[so_numeros]).astype('Int64')
+    resto = ~so_numeros & texto.notna().to_numpy(dtype=bool)
+    if resto.any():
+        digitos = texto[resto].str.replace(r'\.0$', '', regex=True).str.replace(r'\D', '', regex=True)
+        numeros[resto] = pd.to_numeric(digitos.replace('', None), errors='coerce').astype('Int64')
+    return numeros
+
+
+def separar_nf(serie):
+    """
+    Número e série da nota: '12345-1' e '000012345/001' trazem a série depois
+    do separador; sem separador, a série fica vazia.
+    """
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        return so_digitos(serie), pd.Series(pd.NA, index=serie.index, dtype='Int64')
+    texto = serie.astype('string').str.strip()
+    com_serie = texto.str.contains(r'\d\s*[-/]\s*\d', regex=True).fillna(False).to_numpy(dtype=bool)
+    partes = texto[com_serie].str.extract(r'^\D*(\d+)\s*[-/]\s*(\d{1,3})\D*$')
+    numero = texto.copy()
+    numero[com_serie] = partes[0].fillna(texto[com_serie])
+    serie_nf = pd.Series(pd.NA, index=serie.index, dtype='string')
+    serie_nf[com_serie] = partes[1]
+    return so_digitos(numero), so_digitos(serie_nf)
+
+
+def normalizar_documentos(j1bnfdoc):
+    """Índice do lado do SAP: um documento (DOCNUM) por linha, com a chave normalizada."""
+    return pd.DataFrame({
+        'docnum': so_digitos(j1bnfdoc['docnum']),
+        'nf': so_digitos(j1bnfdoc['nf']),
+        'serie': so_digitos(j1bnfdoc['serie']),
+        'cnpj': so_digitos(j1bnfdoc['cnpj']),
+        'data_documento': pd.to_datetime(j1bnfdoc['data_documento'], dayfirst=True, errors='coerce'),
+    }).dropna(subset=['docnum', 'nf']).drop_duplicates('docnum', ignore_index=True)
+
+
+def normalizar_entregas(tratado, relatorio):
+    """Índice do lado da transportadora: uma linha por nota, com a chegada mais recente."""
+    df = tratado.rename(columns={coluna: campo for campo, coluna in COLUNAS_JWM.items()})
+    numero, serie = separar_nf(df['nf'])
+    entregas = pd.DataFrame({
+        'cnpj': so_digitos(df['cnpj']),
+        'nf': numero,
+        'serie': serie,
+        'cte': so_digitos(df['cte']),
+        'data_expedida': pd.to_datetime(df['data_expedida'], dayfirst=True, errors='coerce'),
+        'data_chegada': pd.to_datetime(df['data_chegada'], dayfirst=True, errors='coerce'),
+        'relatorio': relatorio,
+    }).dropna(subset=['nf'])
+    entregas = entregas.sort_values('data_chegada', na_position='first', kind='stable')
+    return entregas.drop_duplicates(CHAVE_ENTREGA, keep='last', ignore_index=True)
+
+
+def ler_relatorio_tratado(caminho):
+    """Relatório tratado pelo JWM.py em planilha, CSV (';') ou Parquet, só com as colunas usadas."""
+    colunas = list(COLUNAS_JWM.values())
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao == '.parquet':
+        return pd.read_parquet(caminho, columns=colunas)
+    if extensao == '.csv':
+        return pd.read_csv(caminho, sep=';', usecols=colunas, dtype=str, encoding='utf-8-sig')
+    return pd.read_excel(caminho, usecols=colunas, dtype={'Nft': str, 'CNPJ ORIGEM': str})
+
+
+def listar_relatorios_tratados(origens):
+    """
+    Arquivos tratados de cada origem: arquivo, padrão glob ou pasta. Numa pasta
+    de saída do modo lote do JWM.py são usados os resultados em tratados/.
+    """
+    arquivos = []
+    for origem in origens:
+        if os.path.isdir(origem):
+            tratados = os.path.join(origem, 'tratados')
+            padrao = os.path.join(tratados, '*.parquet') if os.path.isdir(tratados) else os.path.join(origem, '*Tratado*')
+            arquivos += glob.glob(padrao)
+        else:
+            arquivos += glob.glob(origem)
+    arquivos = [a for a in dict.fromkeys(arquivos)
+                if os.path.splitext(a)[1].lower() in FORMATOS_SAIDA.values() and not os.path.basename(a).startswith('~$')]
+    return sorted(arquivos, key=os.path.getmtime)
+
+
+def ler_relatorios_incluidos(pasta):
+    try:
+        with open(os.path.join(pasta, ARQUIVO_RELATORIOS), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def caminho_entregas(pasta=None):
+    return os.path.join(pasta or PASTA_CONCILIACAO, ARQUIVO_ENTREGAS)
+
+
+def ler_entregas(pasta=None):
+    """Índice de entregas guardado (None se nenhum relatório foi incluído ainda)."""
+    caminho = caminho_entregas(pasta)
+    return pd.read_parquet(caminho) if os.path.exists(caminho) else None
+
+
+def incluir_relatorios(arquivos, pasta=None):
+    """
+    Acrescenta ao índice de entregas as notas dos relatórios ainda não
+    incluídos (pelo hash do conteúdo). Cada nota nova substitui só a nota
+    com a mesma chave; as demais entregas guardadas não são tocadas.
+    Retorna a quantidade de relatórios incluídos.
+    """
+    pasta = pasta or PASTA_CONCILIACAO
+    os.makedirs(pasta, exist_ok=True)
+    incluidos = ler_relatorios_incluidos(pasta)
+    novas = []
+    for arquivo in arquivos:
+        hash_arquivo = calcular_hash(arquivo)
+        if hash_arquivo in incluidos:
+            continue
+        entregas = normalizar_entregas(ler_relatorio_tratado(arquivo), os.path.basename(arquivo))
+        novas.append(entregas)
+        incluidos[hash_arquivo] = {'arquivo': os.path.abspath(arquivo), 'notas': len(entregas),
+                                   'incluido_em': datetime.now().isoformat(timespec='seconds')}
+        print(f"  + {os.path.basename(arquivo)}: {len(entregas)} nota(s)")
+    if not novas:
+        print("Nenhum relatório novo para incluir na conciliação.")
+        return 0
+
+    guardadas = ler_entregas(pasta)
+    # A ordem (guardadas, depois os relatórios do mais antigo ao mais novo) decide qual entrega vale
+    entregas = pd.concat(([guardadas] if guardadas is not None else []) + novas, ignore_index=True)
+    entregas = entregas.drop_duplicates(CHAVE_ENTREGA, keep='last', ignore_index=True)
+    entregas['relatorio'] = entregas['relatorio'].astype('category')
+
+    caminho = caminho_entregas(pasta)
+    entregas.to_parquet(caminho + '.tmp', index=False)
+    os.replace(caminho + '.tmp', caminho)
+    caminho_relatorios = os.path.join(pasta, ARQUIVO_RELATORIOS)
+    with open(caminho_relatorios + '.tmp', 'w', encoding='utf-8') as arquivo:
+        json.dump(incluidos, arquivo, indent=1, ensure_ascii=False)
+    os.replace(caminho_relatorios + '.tmp', caminho_relatorios)
+    print(f"{len(novas)} relatório(s) incluído(s); {len(entregas)} nota(s) no índice de entregas.")
+    return len(novas)
+
+
+def conciliar(documentos, entregas):
+    """
+    Leva a entrega da transportadora a cada documento do SAP, nível a nível
+    (NIVEIS). Retorna (documentos com as colunas da entrega e o critério,
+    entregas sem documento no SAP).
+    """
+    entregas = entregas.reset_index(drop=True).assign(id_entrega=np.arange(len(entregas)))
+    resultado = documentos.assign(id_entrega=pd.array([pd.NA] * len(documentos), dtype='Int64'), criterio=None)
+    usadas = np.zeros(len(entregas), dtype=bool)
+
+    for criterio, chaves, filtro in NIVEIS:
+        pendentes = resultado[resultado['id_entrega'].isna()].dropna(subset=chaves)
+        # Chave repetida em qualquer lado seria um palpite: fica para o nível seguinte (ou sem par)
+        pendentes = pendentes[~pendentes.duplicated(chaves, keep=False)]
+        candidatas = entregas[filtro(entregas) & ~usadas].dropna(subset=chaves)
+        candidatas = candidatas[~candidatas.duplicated(chaves, keep=False)]
+        if pendentes.empty or candidatas.empty:
+            continue
+        achados = juntar(pendentes[chaves], candidatas, chaves, ['id_entrega'])['id_entrega'].dropna()
+        resultado.loc[achados.index, 'id_entrega'] = achados.astype('Int64')
+        resultado.loc[achados.index, 'criterio'] = criterio
+        usadas[achados.to_numpy(dtype=np.int64)] = True
+
+    resultado = juntar(resultado, entregas, 'id_entrega', ['cte', 'data_expedida', 'data_chegada', 'relatorio'])
+    resultado['criterio'] = resultado['criterio'].astype('category')
+    return resultado.drop(columns=['id_entrega']), entregas[~usadas].drop(columns=['id_entrega'])
+
+
+def tabela_conciliada(resultado):
+    """Colunas da saída, um documento do SAP por linha."""
+    return pd.DataFrame({
+        'Nº documento': resultado['docnum'],
+        'Nº NF-e': resultado['nf'],
+        'Série': resultado['serie'],
+        'CNPJ emissor': resultado['cnpj'],
+        'Data do documento': resultado['data_documento'],
+        'CT-e': resultado['cte'],
+        'Data expedida': resultado['data_expedida'],
+        'Data chegada': resultado['data_chegada'],
+        'Dias em trânsito': (resultado['data_chegada'] - resultado['data_expedida']).dt.days.astype('Int64'),
+        'Critério': resultado['criterio'],
+        'Relatório': resultado['relatorio'],
+    })
+
+
+def conciliar_nf(pasta=PASTA_ONTIME, pasta_conciliacao=None, formato=None):
+    """
+    Etapa do SAP.py: concilia a J_1BNFDOC extraída com o índice de entregas
+    e grava NF_CONCILIADAS.<formato> e as listas das notas sem par de cada lado.
+    """
+    pasta_conciliacao = pasta_conciliacao or PASTA_CONCILIACAO
+    formato = formato or FORMATO_ONTIME
+    entregas = ler_entregas(pasta_conciliacao)
+    if entregas is None:
+        print("Conciliação de NF: nenhum relatório da transportadora incluído ainda "
+              "(python conciliacao_nf.py <relatórios tratados>); etapa ignorada.")
+        return None
+
+    inicio = time.perf_counter()
+    documentos = normalizar_documentos(
+        ler_campos('J_1BNFDOC', os.path.join(pasta, arquivo_exportado('J_1BNFDOC')), campos=COLUNAS_SAP))
+    resultado, sem_sap = conciliar(documentos, entregas)
+    tempo_conciliacao = time.perf_counter() - inicio
+
+    conciliadas = tabela_conciliada(resultado)
+    gravado = formato_que_cabe(formato, len(conciliadas))
+    caminho = os.path.join(pasta, arquivo_conciliadas(gravado))
+    gravar_tabela(conciliadas, caminho, gravado, formato_data='dd/mm/yyyy',
+                  larguras={coluna: 14 for coluna in conciliadas.columns})
+    remover_outros_formatos(caminho, formato)
+    sem_entrega = conciliadas[conciliadas['CT-e'].isna() & conciliadas['Data chegada'].isna()]
+    gravar_tabela(sem_entrega.drop(columns=['CT-e', 'Data expedida', 'Data chegada', 'Dias em trânsito',
+                                            'Critério', 'Relatório']),
+                  os.path.join(pasta_conciliacao, ARQUIVO_SEM_ENTREGA), 'csv')
+    gravar_tabela(sem_sap.rename(columns={'cnpj': 'CNPJ', 'nf': 'NF', 'serie': 'Série', 'cte': 'CT-e',
+                                          'data_expedida': 'Data expedida', 'data_chegada': 'Data chegada',
+                                          'relatorio': 'Relatório'}),
+                  os.path.join(pasta_conciliacao, ARQUIVO_SEM_SAP), 'csv')
+
+    conciliados = int(resultado['criterio'].notna().sum())
+    registrar_linhas(entrada=len(documentos) + len(entregas), saida=len(conciliadas))
+    registrar(tempo_conciliacao=tempo_conciliacao, conciliadas=conciliados,
+              sap_sem_transportadora=len(sem_entrega), transportadora_sem_sap=len(sem_sap))
+    por_criterio = resultado['criterio'].value_counts(sort=False)
+    print(f"Conciliação de NF gravada em {caminho}: {conciliados} de {len(documentos)} documentos com entrega "
+          f"({', '.join(f'{criterio}: {n}' for criterio, n in por_criterio.items() if n)}); "
+          f"{len(sem_sap)} nota(s) da transportadora sem documento no SAP ({ARQUIVO_SEM_SAP}).")
+    return conciliadas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inclui relatórios tratados pelo JWM.py e concilia com a J_1BNFDOC")
+    parser.add_argument('relatorios', nargs='*',
+                        help="Relatórios tratados (arquivos, padrões glob ou a pasta de saída do JWM.py --lote)")
+    parser.add_argument('--so-incluir', action='store_true', help="Só atualiza o índice de entregas")
+    argumentos = parser.parse_args()
+
+    if argumentos.relatorios:
+        incluir_relatorios(listar_relatorios_tratados(argumentos.relatorios))
+    if not argumentos.so_incluir:
+        if os.path.exists(os.path.join(PASTA_ONTIME, arquivo_exportado('J_1BNFDOC'))):
+            conciliar_nf()
+        else:
+            print(f"{arquivo_exportado('J_1BNFDOC')} não encontrado em {PASTA_ONTIME}; rode o SAP.py antes.")
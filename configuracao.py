@@ -0,0 +1,148 @@
+import os
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+# --- Tempos de espera do SAP GUI (em segundos) ---
+# Podem ser ajustados no arquivo .env sem alterar o código.
+
+# Espera padrão para uma tela, campo ou diálogo aparecer
+TIMEOUT_PADRAO = float(os.getenv('SAP_TIMEOUT_PADRAO', '60'))
+# Espera para o SAP Logon abrir e a tela de login ficar disponível
+TIMEOUT_LOGON = float(os.getenv('SAP_TIMEOUT_LOGON', '120'))
+# Espera para uma consulta (ZPMMT_287 / SE16N) terminar e exibir o resultado
+TIMEOUT_CONSULTA = float(os.getenv('SAP_TIMEOUT_CONSULTA', '1800'))
+# Intervalo entre duas verificações de session.Busy / existência do elemento
+INTERVALO_VERIFICACAO = float(os.getenv('SAP_INTERVALO_VERIFICACAO', '0.1'))
+# Espera para o arquivo exportado ficar completo e desbloqueado depois do "Substituir" (btn[11])
+TIMEOUT_EXPORTACAO = float(os.getenv('SAP_TIMEOUT_EXPORTACAO', '600'))
+# Segundos sem mudar de tamanho para uma exportação em texto ser considerada completa
+# (a planilha tem um fim reconhecível e não precisa dessa espera)
+EXPORTACAO_ESTAVEL = float(os.getenv('SAP_EXPORTACAO_ESTAVEL', '0.25'))
+
+# --- Extração ---
+
+# Pasta onde os arquivos de entrada e as exportações do SAP ficam
+PASTA_ONTIME = os.getenv('ONTIME_PASTA', r"C:\Users\3976339\Desktop\ONTIME")
+# Quantas sessões SAP (na mesma conexão) podem extrair tabelas ao mesmo tempo
+MAX_SESSOES = int(os.getenv('SAP_MAX_SESSOES', '3'))
+# Formato das exportações do SAP: 'xlsx' (planilha &XXL) ou 'txt' (texto com tabulações,
+# lido em blocos pelo leitor_sap.py, bem mais rápido e econômico para VBFA e LIPS)
+FORMATO_EXPORTACAO = os.getenv('SAP_FORMATO_EXPORTACAO', 'xlsx')
+
+# Fecha a planilha que o SAP GUI abre no Excel a cada exportação &XXL (e o Excel, se não
+# sobrar outra pasta de trabalho aberta); as planilhas do usuário ficam como estão
+FECHAR_EXCEL_EXPORTACAO = os.getenv('SAP_FECHAR_EXCEL_EXPORTACAO', 'true').strip().lower() in ('1', 'true', 'sim')
+# Por quantos segundos depois da exportação o Excel aberto pelo SAP GUI é esperado para ser fechado
+ESPERA_EXCEL_EXPORTACAO = float(os.getenv('SAP_ESPERA_EXCEL_EXPORTACAO', '30'))
+
+# --- Conexão com o SAP GUI ---
+
+# Conexão do SAP Logon aberta no login
+CONEXAO_SAP = os.getenv('SAP_CONEXAO', 'S/4HANA PS4')
+# Reaproveita uma conexão já logada (mesmo sistema, mandante e usuário) em vez de fechar
+# o SAP e logar de novo a cada execução
+REUTILIZAR_SESSOES = os.getenv('SAP_REUTILIZAR_SESSOES', 'true').strip().lower() in ('1', 'true', 'sim')
+# Sistema (Info.SystemName) e mandante (Info.Client) da conexão reaproveitada; mandante
+# vazio aceita qualquer um
+SISTEMA_SAP = os.getenv('SAP_SISTEMA', 'PS4')
+MANDANTE_SAP = os.getenv('SAP_MANDANTE', '')
+
+# --- Backend de extração das tabelas SE16N ---
+
+# 'gui' (SE16N no SAP GUI e exportação do ALV) ou 'rfc' (RFC_READ_TABLE pelo pyrfc, sem tela
+# nem arquivo exportado); a ZPMMT_287 continua no SAP GUI
+BACKEND_EXTRACAO = os.getenv('SAP_BACKEND_EXTRACAO', 'gui').strip().lower()
+# Conexão RFC: servidor de aplicação, número da instância, mandante e SAProuter (opcional);
+# usuário e senha são os mesmos do login (SAP_USER / SAP_PASSWORD)
+RFC_PARAMETROS = {
+    'ashost': os.getenv('SAP_RFC_ASHOST', ''),
+    'sysnr': os.getenv('SAP_RFC_SYSNR', '00'),
+    'client': os.getenv('SAP_RFC_MANDANTE', '100'),
+    'saprouter': os.getenv('SAP_RFC_SAPROUTER', ''),
+}
+# Função de leitura (RFC_READ_TABLE ou uma cópia Z com a mesma interface)
+RFC_FUNCAO_LEITURA = os.getenv('SAP_RFC_FUNCAO', 'RFC_READ_TABLE')
+# Conexões RFC abertas ao mesmo tempo (compartilhadas por todas as tabelas)
+RFC_CONEXOES = int(os.getenv('SAP_RFC_CONEXOES', '4'))
+# Chaves (ou intervalos) por cláusula WHERE e linhas por chamada (ROWCOUNT; acima disso o lote é dividido)
+RFC_LOTE_CHAVES = int(os.getenv('SAP_RFC_LOTE_CHAVES', '500'))
+RFC_LINHAS_PAGINA = int(os.getenv('SAP_RFC_LINHAS_PAGINA', '50000'))
+
+# --- Cache colunar das exportações ---
+
+# Pasta dos arquivos Parquet gerados a partir das exportações do SAP
+PASTA_CACHE = os.getenv('ONTIME_PASTA_CACHE', os.path.join(PASTA_ONTIME, 'cache'))
+# Tamanho máximo do cache; acima disso as entradas usadas há mais tempo são apagadas
+CACHE_TAMANHO_MAXIMO_MB = float(os.getenv('ONTIME_CACHE_MAXIMO_MB', '2048'))
+
+# --- Extração incremental da ZPMMT_287 ---
+
+# Pasta do histórico local da ZPMMT (requisições acumuladas e última janela extraída)
+PASTA_HISTORICO = os.getenv('ONTIME_PASTA_HISTORICO', os.path.join(PASTA_ONTIME, 'historico'))
+# Data inicial da extração completa (reconstrução do histórico)
+ZPMMT_DATA_INICIAL = os.getenv('ZPMMT_DATA_INICIAL', '01.01.2026')
+# Dias da janela anterior extraídos de novo, para pegar requisições alteradas
+ZPMMT_SOBREPOSICAO_DIAS = int(os.getenv('ZPMMT_SOBREPOSICAO_DIAS', '3'))
+
+# --- Cache de chaves das tabelas SE16N ---
+
+# Pasta das linhas já extraídas por chave (notas fiscais, fluxo de documentos, materiais)
+PASTA_CHAVES = os.getenv('ONTIME_PASTA_CHAVES', os.path.join(PASTA_ONTIME, 'chaves'))
+
+# --- Envio das chaves à SE16N em lotes ---
+
+# Máximo de entradas (chaves ou intervalos) por consulta; arquivos maiores viram várias consultas
+LOTE_CHAVES = int(os.getenv('SAP_LOTE_CHAVES', '5000'))
+# Junta chaves numéricas consecutivas em intervalos (de/até) antes de enviar à SE16N.
+# Desligado por padrão: o upload de/até só foi conferido contra o SAP falso (sap_fake.py)
+COMPACTAR_INTERVALOS = os.getenv('SAP_COMPACTAR_INTERVALOS', 'false').strip().lower() in ('1', 'true', 'sim')
+
+# --- Rastreamento das execuções ---
+
+# Pasta do rastreamento de cada execução (JSON) e do histórico das execuções
+PASTA_RASTREAMENTO = os.getenv('ONTIME_PASTA_RASTREAMENTO', os.path.join(PASTA_ONTIME, 'rastreamento'))
+# Quantas execuções o histórico guarda (as mais antigas são descartadas)
+RASTREAMENTO_HISTORICO_MAXIMO = int(os.getenv('ONTIME_RASTREAMENTO_HISTORICO', '200'))
+
+# --- Retomada de execuções ---
+
+# Manifesto das etapas concluídas (parâmetros e hash dos arquivos), usado por --retomar,
+# --a-partir-de e --somente
+ARQUIVO_MANIFESTO = os.getenv('ONTIME_MANIFESTO', os.path.join(PASTA_ONTIME, 'manifesto_execucao.json'))
+
+# --- Serviço de extração ---
+
+# Endereço local do serviço residente (servico_extracao.py) que recebe os pedidos de extração
+SERVICO_HOST = os.getenv('ONTIME_SERVICO_HOST', '127.0.0.1')
+SERVICO_PORTA = int(os.getenv('ONTIME_SERVICO_PORTA', '8765'))
+# Arquivos de trabalho do serviço e resultado de cada pedido
+PASTA_SERVICO = os.getenv('ONTIME_PASTA_SERVICO', os.path.join(PASTA_ONTIME, 'servico'))
+# Extrações recorrentes: [{"tabela", "arquivo_chaves" ou "chaves", "a_cada_minutos", ...}]
+ARQUIVO_AGENDA = os.getenv('ONTIME_AGENDA', os.path.join(PASTA_ONTIME, 'agenda_servico.json'))
+# Segundos que um pedido espera na fila por outros da mesma tabela, para irem na mesma consulta
+SERVICO_ESPERA_AGRUPAMENTO = float(os.getenv('ONTIME_SERVICO_ESPERA_AGRUPAMENTO', '0.2'))
+
+# --- Consolidação On-Time ---
+
+# Formato da tabela consolidada (ONTIME.xlsx/.csv/.parquet); acima do limite de linhas
+# de uma planilha, 'xlsx' vira 'csv'
+FORMATO_ONTIME = os.getenv('ONTIME_FORMATO_SAIDA', 'xlsx').strip().lower()
+
+# --- Conciliação das notas fiscais da transportadora ---
+
+# Índice das entregas dos relatórios tratados pelo JWM.py e as listas de notas sem par
+PASTA_CONCILIACAO = os.getenv('ONTIME_PASTA_CONCILIACAO', os.path.join(PASTA_ONTIME, 'conciliacao'))
+
+# --- DE-PARA de locais do JWM.py ---
+
+# Tabela de CNPJs e cidades -> código do local (compilada num índice guardado em PASTA_CACHE)
+ARQUIVO_MAPEAMENTO_LOCAIS = os.getenv('JWM_MAPEAMENTO_LOCAIS',
+                                      os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mapeamento_locais.csv'))
+
+# --- Saída do JWM.py ---
+
+# Formato do relatório tratado: 'xlsx' (planilha com os formatos de coluna), 'csv' (separado por
+# ponto e vírgula) ou 'parquet'; pode ser trocado a cada execução com --formato
+FORMATO_SAIDA_JWM = os.getenv('JWM_FORMATO_SAIDA', 'xlsx').strip().lower()
@@ -0,0 +1,323 @@
+"""
+Consolidação On-Time: junta o histórico da ZPMMT_287 às tabelas extraídas da
+SE16N e gera uma linha por item de requisição com a data prometida, a data
+efetiva de entrada e se a entrega foi no prazo.
+
+Cadeia: item de requisição (ZPMMT) -> item do pedido (EBAN / EKET, EBELN +
+EBELP) -> remessa (LIPS.VGBEL + VGPOS) -> movimento de mercadoria (VBFA.VBELV, BWART 101/862) -> item da nota
+fiscal (J_1BNFLIN.REFKEY) -> cabeçalho da nota (J_1BNFDOC.DOCNUM), com a
+descrição e o grupo do material da MARA.
+
+Cada tabela é lida só com as colunas usadas (pelo cache colunar), já nos
+tipos do esquema (esquemas_sap.py): chaves como inteiros, códigos repetidos
+como category e datas como datas. Cada tabela é reduzida a uma linha por
+chave antes de entrar na base: as junções com a base são muitos-para-um,
+por índice (hash) sobre as chaves únicas, e a base nunca multiplica de
+tamanho.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from configuracao import PASTA_ONTIME, FORMATO_ONTIME
+from cache_colunar import ler_tabela
+from gravador_tabelas import (FORMATOS_SAIDA, formato_que_cabe, formatos_possiveis, gravar_tabela,
+                              remover_outros_formatos)
+from historico_zpmmt import caminho_historico
+from leitor_sap import arquivo_exportado
+from esquemas_sap import chave_composta, contem_codigos
+from lotes_chaves import normalizar_chaves
+from rastreamento import registrar, registrar_linhas
+
+# Coluna da exportação (cabeçalho da SE16N / ZPMMT_287) usada para cada campo.
+# Se a variante /LOG_ONTIME mudar um cabeçalho, basta ajustar aqui.
+COLUNAS = {
+    'ZPMMT': {'requisicao': 'Requisição de Compras', 'item': 'Item', 'material': 'Material',
+              'centro': 'Centro', 'data': 'Data'},
+    'EBAN': {'requisicao': 'Requisição de compras', 'item': 'Item', 'pedido': 'Pedido',
+             'item_pedido': 'Item do pedido'},
+    'EKET': {'requisicao': 'Requisição de compras', 'item': 'Item', 'pedido': 'Documento de compras',
+             'item_pedido': 'Item do pedido', 'data_prometida': 'Data de remessa'},
+    'LIPS': {'pedido': 'Documento de referência', 'item_pedido': 'Item de referência', 'remessa': 'Remessa'},
+    'VBFA': {'remessa': 'Doc.SD precedente', 'documento': 'Doc.subsequente', 'ano': 'Ano doc.material',
+             'movimento': 'Tipo de movimento', 'data': 'Criado em'},
+    'J_1BNFLIN': {'referencia': 'Referência', 'docnum': 'Nº documento'},
+    'J_1BNFDOC': {'docnum': 'Nº documento', 'nfe': 'Nº NF-e', 'data': 'Data do documento'},
+    'MARA': {'material': 'Material', 'descricao': 'Descrição', 'grupo': 'Grupo de mercadorias'},
+}
+# Movimentos que contam como entrada da mercadoria
+MOVIMENTOS_ENTRADA = (101, 862)
+# Nome do arquivo consolidado (sem extensão)
+ARQUIVO_ONTIME = 'ONTIME'
+# Situações de um item, na ordem em que aparecem nos resumos
+SITUACOES = ['No prazo', 'Atrasado', 'Em aberto', 'Em aberto atrasado', 'Sem data prometida', 'Sem pedido']
+# Formato das datas na planilha consolidada
+FORMATO_DATA_ONTIME = 'dd/mm/yyyy'
+
+
+def arquivo_ontime(formato=None):
+    return ARQUIVO_ONTIME + FORMATOS_SAIDA[formato or FORMATO_ONTIME]
+
+
+def arquivos_ontime(formato=None):
+    """Saídas da etapa ONTIME: o arquivo no formato pedido e, no xlsx, o csv usado quando a tabela não cabe."""
+    return [arquivo_ontime(possivel) for possivel in formatos_possiveis(formato or FORMATO_ONTIME)]
+
+
+def chave(serie):
+    """
+    Chave compacta para junção: inteiro quando todos os valores são numéricos
+    (int64, ou Int64 se houver vazios), senão texto normalizado como em
+    normalizar_chaves.
+    """
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        return serie
+    numeros = pd.to_numeric(serie, errors='coerce')
+    preenchidos = numeros.notna()
+    if preenchidos.sum() == serie.notna().sum() and (numeros[preenchidos] % 1 == 0).all():
+        return numeros.astype('int64' if preenchidos.all() else 'Int64')
+    return normalizar_chaves(serie).where(serie.notna())
+
+
+def data(serie):
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return serie
+    return pd.to_datetime(serie, dayfirst=True, errors='coerce')
+
+
+def ler_campos(tabela, caminho, pasta_cache=None, campos=None):
+    """Lê da exportação só as colunas de `campos` (padrão: COLUNAS[tabela]), já com os nomes dos campos."""
+    campos = campos or COLUNAS[tabela]
+    try:
+        df = ler_tabela(caminho, colunas=list(campos.values()), pasta_cache=pasta_cache)
+    except (KeyError, ValueError) as e:
+        existentes = list(ler_tabela(caminho, pasta_cache=pasta_cache).columns)
+        faltando = [coluna for coluna in campos.values() if coluna not in existentes]
+        if not faltando:
+            raise
+        raise ValueError(f"Coluna(s) {faltando} não encontrada(s) em {os.path.basename(caminho)} "
+                         f"(colunas: {existentes}); ajuste o mapeamento de colunas da {tabela} "
+                         f"(COLUNAS em consolidacao_ontime.py, COLUNAS_SAP em conciliacao_nf.py)") from e
+    return df.rename(columns={coluna: campo for campo, coluna in campos.items()})
+
+
+def carregar_tabelas(pasta=PASTA_ONTIME, caminho_zpmmt=None, pasta_cache=None):
+    """As oito tabelas da consolidação ({nome: DataFrame com os nomes dos campos})."""
+    tabelas = {'ZPMMT': ler_campos('ZPMMT', caminho_zpmmt or caminho_historico(), pasta_cache)}
+    for tabela in COLUNAS:
+        if tabela != 'ZPMMT':
+            tabelas[tabela] = ler_campos(tabela, os.path.join(pasta, arquivo_exportado(tabela)), pasta_cache)
+    return tabelas
+
+
+def alinhar_chaves(esquerda, direita):
+    """As duas chaves como inteiros, ou as duas como texto quando uma delas não é numérica."""
+    if pd.api.types.is_integer_dtype(esquerda.dtype) and pd.api.types.is_integer_dtype(direita.dtype):
+        return esquerda, direita
+    return tuple(normalizar_chaves(s.astype(object)).where(s.notna()) for s in (esquerda, direita))
+
+
+def juntar(base, tabela, chaves, colunas):
+    """
+    Junção muitos-para-um por índice: traz `colunas` da `tabela` para cada
+    linha da base, na ordem da base. Vale a primeira linha da tabela de cada
+    valor de `chaves`; chaves sem correspondência ficam vazias.
+    """
+    chaves = [chaves] if isinstance(chaves, str) else list(chaves)
+    tabela = tabela.dropna(subset=chaves).drop_duplicates(chaves)
+    pares = [alinhar_chaves(base[c], tabela[c]) for c in chaves]
+    if len(chaves) == 1:
+        indice, procurado = pd.Index(pares[0][1]), pd.Index(pares[0][0])
+    else:
+        indice = pd.MultiIndex.from_arrays([direita for _, direita in pares])
+        procurado = pd.MultiIndex.from_arrays([esquerda for esquerda, _ in pares])
+    posicoes = indice.get_indexer(procurado)
+    encontrados = posicoes >= 0
+
+    novas = {}
+    for coluna in colunas:
+        if len(tabela):
+            valores = tabela[coluna].take(np.where(encontrados, posicoes, 0)).set_axis(base.index)
+            if pd.api.types.is_integer_dtype(valores.dtype):
+                # Inteiros continuam inteiros com os vazios (Int64), em vez de virar float
+                valores = valores.astype('Int64')
+            novas[coluna] = valores.where(encontrados)
+        else:
+            novas[coluna] = pd.Series(None, index=base.index, dtype=tabela[coluna].dtype)
+    return base.assign(**novas)
+
+
+def itens_requisicao(zpmmt):
+    """Base: uma linha por item de requisição do histórico da ZPMMT."""
+    base = pd.DataFrame({
+        'requisicao': chave(zpmmt['requisicao']),
+        'item': chave(zpmmt['item']),
+        'material': chave(zpmmt['material']),
+        'centro': zpmmt['centro'].astype('category'),
+        'data_requisicao': data(zpmmt['data']),
+    })
+    return base.dropna(subset=['requisicao']).drop_duplicates(['requisicao', 'item'], keep='last', ignore_index=True)
+
+
+def pedidos_por_item(eban, eket):
+    """Pedido, item do pedido e data prometida (última data de remessa das divisões) por item de requisição."""
+    eban = pd.DataFrame({'requisicao': chave(eban['requisicao']), 'item': chave(eban['item']),
+                         'pedido': chave(eban['pedido']), 'item_pedido': chave(eban['item_pedido'])})
+    eket = pd.DataFrame({'requisicao': chave(eket['requisicao']), 'item': chave(eket['item']),
+                         'pedido_eket': chave(eket['pedido']), 'item_pedido_eket': chave(eket['item_pedido']),
+                         'data_prometida': data(eket['data_prometida'])})
+    pedido_eban = eban.dropna(subset=['pedido'])
+    divisoes = (eket.groupby(['requisicao', 'item'], sort=False)
+                .agg(pedido_eket=('pedido_eket', 'first'), item_pedido_eket=('item_pedido_eket', 'first'),
+                     data_prometida=('data_prometida', 'max'))
+                .reset_index())
+    return divisoes, pedido_eban
+
+
+def entradas_por_item_pedido(lips, vbfa, j1bnflin, j1bnfdoc):
+    """
+    Uma linha por item do pedido: remessas, primeira e última entrada
+    (movimentos 101/862 das remessas com o item, LIPS.VGPOS) e a nota fiscal
+    da última entrada. Um item sem remessa própria fica sem entrada, mesmo que
+    outro item do mesmo pedido já tenha sido entregue.
+    """
+    remessas = pd.DataFrame({'pedido': chave(lips['pedido']), 'item_pedido': chave(lips['item_pedido']),
+                             'remessa': chave(lips['remessa'])})
+    remessas = remessas.dropna().drop_duplicates()
+
+    vbfa = vbfa[contem_codigos(vbfa['movimento'], MOVIMENTOS_ENTRADA)]
+    movimentos = pd.DataFrame({
+        'remessa': chave(vbfa['remessa']),
+        # REFKEY da J_1BNFLIN = documento de material (10 dígitos) + ano
+        'referencia': chave_composta(vbfa['documento'], vbfa['ano'], 4),
+        'data_entrada': data(vbfa['data']),
+    }).dropna(subset=['remessa'])
+
+    notas = pd.DataFrame({'referencia': chave(j1bnflin['referencia']), 'docnum': chave(j1bnflin['docnum'])})
+    cabecalhos = pd.DataFrame({'docnum': chave(j1bnfdoc['docnum']), 'nfe': chave(j1bnfdoc['nfe']),
+                               'data_nf': data(j1bnfdoc['data'])})
+    movimentos = juntar(movimentos, notas, 'referencia', ['docnum'])
+    movimentos = juntar(movimentos, cabecalhos, 'docnum', ['nfe', 'data_nf'])
+
+    # Uma remessa pode atender mais de um item de pedido: aqui a junção é muitos-para-muitos
+    remessas['remessa'], movimentos['remessa'] = alinhar_chaves(remessas['remessa'], movimentos['remessa'])
+    por_item = remessas.merge(movimentos, on='remessa', how='left')
+    por_item = por_item.sort_values(['pedido', 'item_pedido', 'data_entrada'], na_position='first', kind='stable')
+    return (por_item.groupby(['pedido', 'item_pedido'], sort=False)
+            .agg(remessas=('remessa', 'nunique'),
+                 primeira_entrada=('data_entrada', 'min'),
+                 data_entrada=('data_entrada', 'max'),
+                 nfe=('nfe', 'last'),
+                 data_nf=('data_nf', 'last'))
+            .reset_index())
+
+
+def classificar(base, hoje):
+    """Dias de atraso, 'No prazo' (Sim/Não) e a situação de cada item."""
+    entregue = base['data_entrada'].notna()
+    referencia = base['data_entrada'].fillna(hoje)
+    atraso = (referencia.dt.normalize() - base['data_prometida'].dt.normalize()).dt.days.astype('Int64')
+    sem_pedido = base['pedido'].isna()
+    sem_prazo = base['data_prometida'].isna()
+    atrasado = (atraso > 0).fillna(False).to_numpy(dtype=bool)
+
+    # Códigos das SITUACOES (a primeira condição verdadeira vale)
+    codigos = np.select(
+        [sem_pedido.to_numpy(), sem_prazo.to_numpy(), entregue.to_numpy() & ~atrasado,
+         entregue.to_numpy(), atrasado],
+        [SITUACOES.index(s) for s in ('Sem pedido', 'Sem data prometida', 'No prazo', 'Atrasado',
+                                      'Em aberto atrasado')],
+        SITUACOES.index('Em aberto'))
+    no_prazo = np.select([codigos == SITUACOES.index('No prazo'),
+                          np.isin(codigos, [SITUACOES.index('Atrasado'), SITUACOES.index('Em aberto atrasado')])],
+                         [0, 1], -1)
+    return base.assign(
+        dias_atraso=atraso.where(~sem_prazo),
+        no_prazo=pd.Categorical.from_codes(no_prazo, categories=['Sim', 'Não']),
+        situacao=pd.Categorical.from_codes(codigos, categories=SITUACOES),
+    )
+
+
+def montar_ontime(tabelas, hoje=None):
+    """
+    Monta a tabela On-Time a partir das tabelas de carregar_tabelas (ou do
+    SAP falso). Retorna uma linha por item de requisição.
+    """
+    hoje = pd.Timestamp(hoje) if hoje is not None else pd.Timestamp.today().normalize()
+    base = itens_requisicao(tabelas['ZPMMT'])
+
+    divisoes, pedido_eban = pedidos_por_item(tabelas['EBAN'], tabelas['EKET'])
+    base = juntar(base, pedido_eban, ['requisicao', 'item'], ['pedido', 'item_pedido'])
+    base = juntar(base, divisoes, ['requisicao', 'item'], ['pedido_eket', 'item_pedido_eket', 'data_prometida'])
+    # Pedido e item da EBAN; sem eles, os da divisão da EKET
+    sem_pedido = base['pedido'].isna()
+    base['pedido'] = base['pedido'].fillna(base.pop('pedido_eket'))
+    base['item_pedido'] = base['item_pedido'].mask(sem_pedido, base.pop('item_pedido_eket'))
+
+    entradas = entradas_por_item_pedido(tabelas['LIPS'], tabelas['VBFA'], tabelas['J_1BNFLIN'],
+                                        tabelas['J_1BNFDOC'])
+    base = juntar(base, entradas, ['pedido', 'item_pedido'],
+                  ['remessas', 'primeira_entrada', 'data_entrada', 'nfe', 'data_nf'])
+
+    mara = tabelas['MARA']
+    materiais = pd.DataFrame({'material': chave(mara['material']),
+                              'descricao': mara['descricao'].astype('category'),
+                              'grupo': mara['grupo'].astype('category')})
+    base = juntar(base, materiais, 'material', ['descricao', 'grupo'])
+    base = classificar(base, hoje)
+
+    return pd.DataFrame({
+        'Requisição': base['requisicao'],
+        'Item': base['item'],
+        'Material': base['material'],
+        'Descrição': base['descricao'],
+        'Grupo de mercadorias': base['grupo'],
+        'Centro': base['centro'],
+        'Data requisição': base['data_requisicao'],
+        'Pedido': base['pedido'],
+        'Item do pedido': base['item_pedido'],
+        'Data prometida': base['data_prometida'],
+        'Remessas': base['remessas'].astype('Int64'),
+        'Primeira entrada': base['primeira_entrada'],
+        'Data entrada': base['data_entrada'],
+        'Nº NF-e': base['nfe'],
+        'Data NF': base['data_nf'],
+        'Dias de atraso': base['dias_atraso'],
+        'No prazo': base['no_prazo'],
+        'Situação': base['situacao'],
+    })
+
+
+def consolidar_ontime(pasta=PASTA_ONTIME, formato=None):
+    """
+    Etapa do SAP.py: lê as tabelas extraídas, monta a tabela On-Time e grava
+    ONTIME.<formato> (um dos arquivos_ontime; o outro, de uma execução
+    anterior, é apagado).
+    """
+    formato = formato or FORMATO_ONTIME
+    print("Consolidando a tabela On-Time...")
+    inicio = time.perf_counter()
+    tabelas = carregar_tabelas(pasta)
+    lidas = time.perf_counter()
+    ontime = montar_ontime(tabelas)
+    montada = time.perf_counter()
+
+    gravado = formato_que_cabe(formato, len(ontime))
+    if gravado != formato:
+        print(f"⚠ {len(ontime)} linhas não cabem numa planilha; a tabela On-Time será gravada em {gravado}.")
+    caminho = os.path.join(pasta, arquivo_ontime(gravado))
+    gravar_tabela(ontime, caminho, gravado, formato_data=FORMATO_DATA_ONTIME,
+                  larguras={coluna: 14 for coluna in ontime.columns})
+    remover_outros_formatos(caminho, formato)
+
+    contagem = ontime['Situação'].value_counts(sort=False)
+    contagem = contagem[contagem > 0]
+    registrar_linhas(entrada=len(tabelas['ZPMMT']), saida=len(ontime))
+    registrar(tempo_leitura=lidas - inicio, tempo_juncao=montada - lidas,
+              tempo_gravacao=time.perf_counter() - montada,
+              **{f"itens_{situacao.lower().replace(' ', '_')}": int(n) for situacao, n in contagem.items()})
+    print(f"Tabela On-Time gravada em {caminho}: {len(ontime)} itens "
+          f"({', '.join(f'{situacao}: {n}' for situacao, n in contagem.items())}).")
+    return ontime
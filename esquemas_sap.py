@@ -0,0 +1,110 @@
+"""
+Esquema de cada tabela exportada do SAP: o tipo de cada coluna que o
+processo usa e as colunas-chave.
+
+A leitura das exportações (leitor_sap.py, cache_colunar.py) converte cada
+coluna direto para o tipo do esquema, sem deduzi-lo pelos valores:
+
+  chave      número de documento, só dígitos (pedido, remessa, DOCNUM, REFKEY):
+             int64, ou Int64 quando há vazios
+  inteiro    número no padrão brasileiro (1.234, 12-): Int64
+  decimal    número com vírgula (1.234,56): float64
+  data       31.12.2025: datetime64
+  categoria  código com poucos valores distintos (centro, série, tipo de
+             movimento, grupo de mercadorias): category, com o texto como veio
+  texto      texto livre
+
+Colunas fora do esquema (ou de tabelas sem esquema) continuam com o tipo
+deduzido pelos valores. Se a variante /LOG_ONTIME mudar um cabeçalho, ajuste
+aqui e em COLUNAS (consolidacao_ontime.py).
+"""
+import os
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+TIPOS = ('chave', 'inteiro', 'decimal', 'data', 'categoria', 'texto')
+
+
+@dataclass
+class EsquemaTabela:
+    """Tipos das colunas de uma exportação ({cabeçalho: tipo}) e as colunas que identificam a linha."""
+    tabela: str
+    colunas: dict
+    chaves: list = field(default_factory=list)
+
+    def __post_init__(self):
+        invalidos = {coluna: tipo for coluna, tipo in self.colunas.items() if tipo not in TIPOS}
+        if invalidos:
+            raise ValueError(f"Tipo(s) inválido(s) no esquema da {self.tabela}: {invalidos} (válidos: {TIPOS})")
+
+
+# Material fica fora dos esquemas: pode ser numérico ou alfanumérico conforme o cadastro
+ESQUEMAS = {
+    'ZPMMT': EsquemaTabela('ZPMMT', {'Requisição de Compras': 'chave', 'Item': 'chave', 'Centro': 'categoria',
+                                     'Data': 'data', 'Quantidade': 'decimal'},
+                           chaves=['Requisição de Compras', 'Item']),
+    'EBAN': EsquemaTabela('EBAN', {'Requisição de compras': 'chave', 'Item': 'chave', 'Pedido': 'chave',
+                                   'Item do pedido': 'chave'},
+                          chaves=['Requisição de compras', 'Item']),
+    'EKET': EsquemaTabela('EKET', {'Requisição de compras': 'chave', 'Item': 'chave',
+                                   'Documento de compras': 'chave', 'Item do pedido': 'chave',
+                                   'Data de remessa': 'data'},
+                          chaves=['Requisição de compras', 'Item']),
+    'LIPS': EsquemaTabela('LIPS', {'Documento de referência': 'chave', 'Item de referência': 'chave',
+                                   'Remessa': 'chave', 'Quantidade': 'decimal'},
+                          chaves=['Remessa']),
+    'VBFA': EsquemaTabela('VBFA', {'Doc.SD precedente': 'chave', 'Doc.subsequente': 'chave',
+                                   'Ano doc.material': 'chave', 'Tipo de movimento': 'categoria',
+                                   'Quantidade': 'decimal', 'Criado em': 'data'},
+                          chaves=['Doc.SD precedente', 'Doc.subsequente', 'Ano doc.material']),
+    'J_1BNFLIN': EsquemaTabela('J_1BNFLIN', {'Referência': 'chave', 'Nº documento': 'chave', 'Item': 'chave',
+                                             'Valor': 'decimal'},
+                               chaves=['Nº documento', 'Item']),
+    'J_1BNFDOC': EsquemaTabela('J_1BNFDOC', {'Nº documento': 'chave', 'Nº NF-e': 'chave', 'Série': 'categoria',
+                                             'Data do documento': 'data', 'CNPJ emissor': 'categoria'},
+                               chaves=['Nº documento']),
+    'MARA': EsquemaTabela('MARA', {'Descrição': 'texto', 'Grupo de mercadorias': 'categoria'},
+                          chaves=['Material']),
+}
+
+
+def esquema_do_arquivo(caminho):
+    """
+    Esquema da exportação pelo nome do arquivo: VBFA.tsv, e também as
+    exportações parciais da mesma tabela (VBFA_DELTA.tsv, VBFA_LOTE_2.tsv).
+    None se o arquivo não é de uma tabela do registro.
+    """
+    nome = os.path.splitext(os.path.basename(caminho))[0]
+    for tabela, esquema in ESQUEMAS.items():
+        if nome == tabela or nome.startswith(tabela + '_'):
+            return esquema
+    return None
+
+
+def tipos_do_arquivo(caminho):
+    """{cabeçalho: tipo} do esquema da exportação, ou {} (todos os tipos deduzidos)."""
+    esquema = esquema_do_arquivo(caminho)
+    return dict(esquema.colunas) if esquema else {}
+
+
+def chave_composta(esquerda, direita, digitos):
+    """
+    Chave de duas colunas numéricas cujos dígitos são concatenados, calculada
+    sem passar por texto: esquerda * 10**digitos + direita (ex.: documento de
+    material + ano = REFKEY da J_1BNFLIN). Vazia (Int64) se uma das partes é vazia.
+    """
+    esquerda = pd.to_numeric(esquerda, errors='coerce').astype('Int64')
+    direita = pd.to_numeric(direita, errors='coerce').astype('Int64')
+    return esquerda * 10 ** digitos + direita
+
+
+def contem_codigos(serie, codigos):
+    """
+    serie.isin(codigos) comparando como texto: códigos como o tipo de movimento
+    chegam como category de texto pelo esquema, mas como número do Excel ou do SAP falso.
+    """
+    textos = [str(codigo) for codigo in codigos]
+    if pd.api.types.is_float_dtype(serie.dtype):
+        serie = serie.astype('Int64')
+    return serie.astype(str).isin(textos)
@@ -0,0 +1,182 @@
+"""
+Etapas do processo On-Time: extração da ZPMMT_287, tabelas da SE16N e etapas
+de pandas que geram os arquivos de chaves. Não depende do SAP GUI instalado:
+as funções de SAP recebem a sessão pronta, o que permite rodar as mesmas
+etapas no SAP falso (sap_fake.py) do benchmark.
+"""
+import os
+from functools import partial
+
+import pandas as pd
+
+from configuracao import PASTA_ONTIME
+from sap_espera import aguardar_elemento, preencher
+from agendador import Etapa
+from sap_se16n import TABELAS, exportar_resultado
+from cache_chaves import extrair_com_cache
+from extratores import criar_extrator
+from leitor_sap import arquivo_exportado
+from gravador_tabelas import gravar_chaves
+from cache_colunar import ler_tabela
+from rastreamento import registrar, registrar_linhas
+from historico_zpmmt import ARQUIVO_HISTORICO, caminho_historico, mesclar_historico
+from consolidacao_ontime import MOVIMENTOS_ENTRADA, arquivos_ontime, consolidar_ontime
+from esquemas_sap import chave_composta, contem_codigos
+from conciliacao_nf import ARQUIVO_ENTREGAS, arquivos_conciliadas, conciliar_nf
+
+
+def extrair_zpmmt(session, inicio, fim):
+    """
+    Executa a ZPMMT_287 para as bases de CODIGO BASES.txt no período
+    [inicio, fim] e exporta o resultado (ZPMMT.xlsx).
+    """
+    print("Acessando a transação ZPMMT_287...")
+    session.findById("wnd[0]").maximize()
+    aguardar_elemento(session, "wnd[0]/tbar[0]/okcd").text = "ZPMMT_287"
+    session.findById("wnd[0]").sendVKey(0)
+    preencher(session, {"wnd[0]/usr/ctxtS_DATA-LOW": inicio.strftime('%d.%m.%Y'),
+                        "wnd[0]/usr/ctxtS_DATA-HIGH": fim.strftime('%d.%m.%Y')})
+    aguardar_elemento(session, "wnd[0]/usr/btn%_S_CENT1_%_APP_%-VALU_PUSH").press()
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[23]").press()
+    preencher(session, {"wnd[2]/usr/ctxtDY_PATH": PASTA_ONTIME, "wnd[2]/usr/ctxtDY_FILENAME": "CODIGO BASES.txt"})
+    aguardar_elemento(session, "wnd[2]/tbar[0]/btn[0]").press()
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[8]").press()
+    aguardar_elemento(session, "wnd[0]/usr/btn%_S_CENT2_%_APP_%-VALU_PUSH").press()
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[23]").press()
+    preencher(session, {"wnd[2]/usr/ctxtDY_PATH": PASTA_ONTIME, "wnd[2]/usr/ctxtDY_FILENAME": "CODIGO BASES.txt"})
+    aguardar_elemento(session, "wnd[2]/tbar[0]/btn[0]").press()
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[8]").press()
+    aguardar_elemento(session, "wnd[0]/tbar[1]/btn[8]").press()
+
+    exportar_resultado(session, "ZPMMT")
+    print(f"Dados exportados para {arquivo_exportado('ZPMMT')}")
+
+
+def atualizar_historico_zpmmt(inicio, fim, reconstruir):
+    """Junta a extração da janela ao histórico local da ZPMMT."""
+    novo = ler_tabela(os.path.join(PASTA_ONTIME, arquivo_exportado('ZPMMT')))
+    historico = mesclar_historico(novo, inicio, fim, reconstruir)
+    registrar_linhas(entrada=len(novo), saida=len(historico))
+
+
+def gerar_chaves_requisicao():
+    """Gera ZPMMT_REQ.txt com as requisições de compras do histórico da ZPMMT."""
+    print("Processando histórico da ZPMMT...")
+    Requisicao = ler_tabela(caminho_historico(), colunas=['Requisição de Compras'])
+    Requisicao_zp = Requisicao['Requisição de Compras']
+
+    caminho_pasta_req = PASTA_ONTIME
+    # Corrigido: Usando os.path.join para construir o caminho do arquivo
+    Nome_Arquivo_zpmmt = os.path.join(caminho_pasta_req, 'ZPMMT_REQ.txt')
+    # Sem cabeçalho: o arquivo é carregado direto na seleção múltipla da SE16N
+    gravar_chaves(Requisicao_zp, Nome_Arquivo_zpmmt)
+    registrar_linhas(entrada=len(Requisicao), saida=len(Requisicao_zp))
+    print("Arquivo ZPMMT_REQ.txt criado com sucesso.")
+
+
+def consolidar_pedidos():
+    """Junta os pedidos da EKET e da EBAN em PEDIDOS_CONSOLIDADO.txt."""
+    print("Lendo e consolidando dados...")
+    base_eket = ler_tabela(os.path.join(PASTA_ONTIME, arquivo_exportado('EKET')), colunas=['Documento de compras'])
+    base_eban = ler_tabela(os.path.join(PASTA_ONTIME, arquivo_exportado('EBAN')), colunas=['Pedido'])
+
+    coluna_pedido_eket = base_eket['Documento de compras']
+    coluna_pedido_eban = base_eban['Pedido']
+
+    # Pedidos já chegam como inteiros pelo esquema (esquemas_sap.py); a EBAN tem vazios (Int64)
+    df_pedido_consolidado = pd.concat([coluna_pedido_eket, coluna_pedido_eban], axis=0).drop_duplicates().reset_index(drop=True)
+    df_pedido_consolidado = df_pedido_consolidado.dropna().astype('int64')
+
+    gravar_chaves(df_pedido_consolidado, os.path.join(PASTA_ONTIME, 'PEDIDOS_CONSOLIDADO.txt'))
+    registrar_linhas(entrada=len(base_eket) + len(base_eban), saida=len(df_pedido_consolidado))
+    print("Arquivo PEDIDOS_CONSOLIDADO.txt criado com sucesso.")
+
+
+def gerar_chaves_remessa():
+    """Gera REMESSA.txt com as remessas da LIPS."""
+    remessa = ler_tabela(os.path.join(PASTA_ONTIME, arquivo_exportado('LIPS')), colunas=['Remessa'])
+    remessa_zp = remessa['Remessa']
+    gravar_chaves(remessa_zp, os.path.join(PASTA_ONTIME, 'REMESSA.txt'))
+    registrar_linhas(entrada=len(remessa), saida=len(remessa_zp))
+    print("Arquivo REMESSA.txt criado com sucesso.")
+
+
+def gerar_chaves_vbfa():
+    """Gera VBFA_CONSOLIDADO.txt com os documentos de material da VBFA."""
+    base_vbfa = ler_tabela(os.path.join(PASTA_ONTIME, arquivo_exportado('VBFA')),
+                           colunas=['Tipo de movimento', 'Doc.subsequente', 'Ano doc.material'])
+
+    # Corrigido: O filtro deve ser aplicado diretamente em base_vbfa
+    base_filtrada = base_vbfa[contem_codigos(base_vbfa['Tipo de movimento'], MOVIMENTOS_ENTRADA)]
+    # REFKEY da J_1BNFLIN = documento de material + ano, montada como número
+    concatenado = chave_composta(base_filtrada['Doc.subsequente'], base_filtrada['Ano doc.material'], 4).dropna()
+    gravar_chaves(concatenado, os.path.join(PASTA_ONTIME, 'VBFA_CONSOLIDADO.txt'))
+    registrar_linhas(entrada=len(base_vbfa), saida=len(base_filtrada))
+    print("Arquivo VBFA_CONSOLIDADO.txt criado com sucesso.")
+
+
+def gerar_chaves_jlin():
+    """Gera JLIN.txt com os números de documento da J_1BNFLIN."""
+    jlin = ler_tabela(os.path.join(PASTA_ONTIME, arquivo_exportado('J_1BNFLIN')), colunas=['Nº documento'])
+    jlin_zp = jlin['Nº documento']
+    gravar_chaves(jlin_zp, os.path.join(PASTA_ONTIME, 'JLIN.txt'))
+    registrar_linhas(entrada=len(jlin), saida=len(jlin_zp))
+    print("Arquivo JLIN.txt criado com sucesso.")
+
+
+def gerar_chaves_material():
+    """Gera MARA.txt com os materiais do histórico da ZPMMT."""
+    print("Processando histórico da ZPMMT para tabela MARA...")
+    # O histórico já está em Parquet: lê só a coluna Material
+    mara = ler_tabela(caminho_historico(), colunas=['Material'])
+    mara_zp = mara['Material']
+    gravar_chaves(mara_zp, os.path.join(PASTA_ONTIME, 'MARA.txt'))
+    registrar_linhas(entrada=len(mara), saida=len(mara_zp))
+    print("Arquivo MARA.txt criado com sucesso.")
+
+
+def extrair_e_registrar(sessoes=None, *, spec, resultados, extrator):
+    """
+    Extrai uma tabela do registro e guarda o resultado em `resultados` para o
+    resumo final. Backends sem sessão (RFC) são chamados sem `sessoes`.
+    """
+    resultado = extrair_com_cache(sessoes, spec, extrator=extrator)
+    resultados.append(resultado)
+    registrar_linhas(entrada=resultado.chaves, saida=resultado.linhas)
+    registrar(tempo_consulta=resultado.tempo_consulta, tempo_exportacao=resultado.tempo_exportacao)
+
+
+def montar_etapas(inicio_zpmmt, fim_zpmmt, reconstruir_zpmmt, resultados, extrator=None):
+    """
+    Etapas da extração: cada uma declara os arquivos que lê e os que gera.
+    O agendador deduz a ordem e roda em paralelo as que não dependem entre si.
+    Os resultados das tabelas SE16N são acrescentados a `resultados`.
+    As tabelas do registro são extraídas pelo `extrator` (padrão:
+    SAP_BACKEND_EXTRACAO); com o RFC elas não ocupam sessões do SAP GUI.
+    """
+    extrator = extrator or criar_extrator()
+    return [
+        Etapa('ZPMMT_287', partial(extrair_zpmmt, inicio=inicio_zpmmt, fim=fim_zpmmt),
+              ['CODIGO BASES.txt'], [arquivo_exportado('ZPMMT')]),
+        Etapa('HISTORICO_ZPMMT', partial(atualizar_historico_zpmmt, inicio_zpmmt, fim_zpmmt, reconstruir_zpmmt),
+              [arquivo_exportado('ZPMMT')], [ARQUIVO_HISTORICO], usa_sessao=False),
+        Etapa('CHAVES_REQUISICAO', gerar_chaves_requisicao, [ARQUIVO_HISTORICO], ['ZPMMT_REQ.txt'], usa_sessao=False),
+        Etapa('PEDIDOS', consolidar_pedidos, [arquivo_exportado('EKET'), arquivo_exportado('EBAN')], ['PEDIDOS_CONSOLIDADO.txt'], usa_sessao=False),
+        Etapa('CHAVES_REMESSA', gerar_chaves_remessa, [arquivo_exportado('LIPS')], ['REMESSA.txt'], usa_sessao=False),
+        Etapa('CHAVES_VBFA', gerar_chaves_vbfa, [arquivo_exportado('VBFA')], ['VBFA_CONSOLIDADO.txt'], usa_sessao=False),
+        Etapa('CHAVES_JLIN', gerar_chaves_jlin, [arquivo_exportado('J_1BNFLIN')], ['JLIN.txt'], usa_sessao=False),
+        Etapa('CHAVES_MATERIAL', gerar_chaves_material, [ARQUIVO_HISTORICO], ['MARA.txt'], usa_sessao=False),
+        # Junta tudo numa linha por item de requisição (consolidacao_ontime.py). As saídas
+        # incluem o csv gravado quando a tabela não cabe no xlsx, para o manifesto ver o arquivo gravado
+        Etapa('ONTIME', consolidar_ontime, [ARQUIVO_HISTORICO] + [arquivo_exportado(t) for t in TABELAS],
+              arquivos_ontime(), usa_sessao=False),
+        # Data de chegada da transportadora em cada nota do SAP (conciliacao_nf.py); o índice de
+        # entregas muda quando relatórios novos são incluídos, e a retomada refaz a etapa
+        Etapa('CONCILIACAO_NF', conciliar_nf, [arquivo_exportado('J_1BNFDOC'), ARQUIVO_ENTREGAS],
+              arquivos_conciliadas(), usa_sessao=False),
+    ] + [
+        # Uma etapa por tabela do registro da SE16N
+        Etapa(spec.tabela, partial(extrair_e_registrar, spec=spec, resultados=resultados, extrator=extrator),
+              [spec.arquivo_chaves], [spec.arquivo_saida], usa_sessao=extrator.usa_sessao, sessoes=spec.sessoes)
+        for spec in TABELAS.values()
+    ]
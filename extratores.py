@@ -0,0 +1,53 @@
+"""
+Backends de extração das tabelas do registro TABELAS (sap_se16n.py).
+
+Um backend é um objeto com:
+
+  nome        'gui' ou 'rfc'
+  usa_sessao  se as etapas da tabela precisam de sessões do SAP GUI
+  extrair(sessoes, spec, pasta)
+              consulta a tabela `spec` pelas chaves de spec.arquivo_chaves,
+              grava spec.arquivo_saida no formato das exportações (lido pelo
+              ler_tabela como sempre) e devolve um ResultadoExtracao.
+              `sessoes` é a lista de funções que abrem as sessões da etapa
+              (None quando o backend não usa sessão).
+  fechar()    libera o que o backend mantém aberto (conexões RFC).
+
+Os dois backends gravam o mesmo arquivo, com os mesmos cabeçalhos e tipos,
+então o cache de chaves e as etapas seguintes não sabem de onde veio a tabela.
+"""
+from functools import lru_cache
+
+from configuracao import PASTA_ONTIME, BACKEND_EXTRACAO
+from lotes_chaves import extrair_em_lotes
+
+BACKENDS = ('gui', 'rfc')
+
+
+class ExtratorGUI:
+    """SE16N no SAP GUI: seleção múltipla, exportação do ALV e leitura do arquivo exportado."""
+    nome = 'gui'
+    usa_sessao = True
+
+    def extrair(self, sessoes, spec, pasta=PASTA_ONTIME):
+        return extrair_em_lotes(sessoes, spec, pasta)
+
+    def fechar(self):
+        # As sessões pertencem ao SAP.py, que as fecha com o SAP GUI
+        pass
+
+
+@lru_cache(maxsize=None)
+def criar_extrator(nome=None):
+    """
+    Backend de extração configurado (SAP_BACKEND_EXTRACAO). Cada backend é
+    criado uma vez: o RFC mantém o pool de conexões entre as etapas.
+    """
+    nome = (nome or BACKEND_EXTRACAO).strip().lower()
+    if nome == 'gui':
+        return ExtratorGUI()
+    if nome == 'rfc':
+        # Importado aqui: o pyrfc só é necessário com o backend RFC
+        from sap_rfc import ExtratorRFC
+        return ExtratorRFC()
+    raise ValueError(f"Backend de extração desconhecido: '{nome}' (use {', '.join(BACKENDS)})")
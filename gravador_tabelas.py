@@ -0,0 +1,236 @@
+import math
+import os
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+# Formatos de saída e a extensão de cada um
+FORMATOS_SAIDA = {'xlsx': '.xlsx', 'csv': '.csv', 'parquet': '.parquet'}
+# Formato de data/hora das planilhas (o mesmo do pd.ExcelWriter usado antes)
+FORMATO_DATA_EXCEL = 'd/m/yy h:mm'
+# Formato de data/hora do CSV (o mesmo dos relatórios de entrada)
+FORMATO_DATA_CSV = '%d/%m/%Y %H:%M'
+# Linhas convertidas e gravadas de cada vez
+TAMANHO_BLOCO = 50_000
+# Limite de linhas de uma planilha do Excel (incluindo o cabeçalho)
+LINHAS_MAXIMAS_EXCEL = 1_048_576
+
+
+def caminho_com_formato(caminho, formato):
+    """Troca a extensão do arquivo pela do formato ('Relatório.xlsx' -> 'Relatório.csv')."""
+    return os.path.splitext(caminho)[0] + FORMATOS_SAIDA[formato]
+
+
+def formatos_possiveis(formato):
+    """Formatos em que uma tabela pedida em `formato` pode sair: xlsx vira csv quando não cabe numa planilha."""
+    return [formato, 'csv'] if formato == 'xlsx' else [formato]
+
+
+def formato_que_cabe(formato, linhas):
+    """O formato pedido, ou csv se as `linhas` não cabem numa planilha xlsx."""
+    return 'csv' if formato == 'xlsx' and linhas >= LINHAS_MAXIMAS_EXCEL else formato
+
+
+def remover_outros_formatos(caminho, formato):
+    """
+    Apaga a versão anterior da tabela nos outros formatos possíveis do
+    `formato` pedido (ex.: ONTIME.xlsx de ontem ao gravar ONTIME.csv), para
+    não ficar um arquivo desatualizado ao lado do novo.
+    """
+    for possivel in formatos_possiveis(formato):
+        outro = caminho_com_formato(caminho, possivel)
+        if outro != caminho and os.path.exists(outro):
+            os.remove(outro)
+            print(f"Removida a versão anterior {os.path.basename(outro)}.")
+
+
+def dividir_blocos(df, tamanho=TAMANHO_BLOCO):
+    for inicio in range(0, len(df), tamanho):
+        yield df.iloc[inicio:inicio + tamanho]
+
+
+class GravadorTabela:
+    """
+    Grava uma tabela em blocos de linhas sem montar o arquivo inteiro na
+    memória: planilha no modo constant_memory do xlsxwriter (cada linha vai
+    para o disco assim que é escrita), CSV ou Parquet (um row group por bloco).
+
+    `formatos_colunas` ({coluna: formato numérico do Excel}) e `larguras`
+    ({coluna: largura}) só valem para a planilha, assim como `formato_data`
+    (formato das células de data/hora). O arquivo é gravado com a
+    extensão .tmp e renomeado no fechar(), então uma falha no meio não deixa
+    um arquivo pela metade no lugar do anterior.
+    """
+
+    def __init__(self, caminho, formato=None, formatos_colunas=None, larguras=None, formato_data=FORMATO_DATA_EXCEL,
+                 cabecalho=True, separador=';', decimal=',', codificacao='utf-8-sig'):
+        self.caminho = caminho
+        self.formato = formato or os.path.splitext(caminho)[1].lstrip('.').lower()
+        if self.formato not in FORMATOS_SAIDA:
+            raise ValueError(f"Formato de saída desconhecido: '{self.formato}' (use {', '.join(FORMATOS_SAIDA)})")
+        self.formatos_colunas = formatos_colunas or {}
+        self.larguras = larguras or {}
+        self.formato_data = formato_data
+        self.cabecalho = cabecalho
+        self.separador = separador
+        self.decimal = decimal
+        self.codificacao = codificacao
+        self.colunas = None
+        self.linhas = 0
+        self._temporario = caminho + '.tmp'
+        self._arquivo = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, erro, rastro):
+        if erro is None:
+            self.fechar()
+        else:
+            self.descartar()
+
+    def escrever(self, bloco):
+        """Acrescenta as linhas do DataFrame (sempre com as mesmas colunas)."""
+        if self.colunas is None:
+            self.colunas = [str(coluna) for coluna in bloco.columns]
+            self._abrir(bloco)
+        for parte in dividir_blocos(bloco):
+            getattr(self, f'_escrever_{self.formato}')(parte)
+            self.linhas += len(parte)
+
+    def fechar(self):
+        if self._arquivo is None:
+            # Tabela sem nenhum bloco: arquivo só com o cabeçalho (ou vazio)
+            self.colunas = self.colunas or []
+            self._abrir(pd.DataFrame(columns=self.colunas))
+        self._arquivo.close()
+        self._arquivo = None
+        os.replace(self._temporario, self.caminho)
+
+    def descartar(self):
+        if self._arquivo is not None:
+            try:
+                self._arquivo.close()
+            except Exception:
+                pass
+            self._arquivo = None
+        if os.path.exists(self._temporario):
+            os.remove(self._temporario)
+
+    def _abrir(self, bloco):
+        if self.formato == 'xlsx':
+            self._abrir_xlsx()
+        elif self.formato == 'csv':
+            self._arquivo = open(self._temporario, 'w', encoding=self.codificacao, newline='')
+            if self.cabecalho:
+                bloco.iloc[:0].to_csv(self._arquivo, sep=self.separador, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            # Importados aqui: cache_colunar -> leitor_sap -> gravador_tabelas
+            from cache_colunar import preparar_para_parquet
+            self._esquema = pa.Schema.from_pandas(preparar_para_parquet(bloco), preserve_index=False)
+            self._arquivo = pq.ParquetWriter(self._temporario, self._esquema)
+
+    # --- Planilha ---
+
+    def _abrir_xlsx(self):
+        self._arquivo = xlsxwriter.Workbook(self._temporario, {'constant_memory': True})
+        self._planilha = self._arquivo.add_worksheet('Sheet1')
+        self._formato_data = self._arquivo.add_format({'num_format': self.formato_data})
+        # Em constant_memory as colunas precisam ser formatadas antes da primeira linha
+        for posicao, coluna in enumerate(self.colunas):
+            formato = self.formatos_colunas.get(coluna)
+            if formato is not None or coluna in self.larguras:
+                self._planilha.set_column(posicao, posicao, self.larguras.get(coluna),
+                                          self._arquivo.add_format({'num_format': formato}) if formato else None)
+        if self.cabecalho:
+            # Mesmo estilo de cabeçalho do pandas.to_excel
+            estilo = self._arquivo.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+            for posicao, coluna in enumerate(self.colunas):
+                self._planilha.write_string(0, posicao, coluna, estilo)
+        self._proxima_linha = 1 if self.cabecalho else 0
+
+    def _escrever_xlsx(self, bloco):
+        if self._proxima_linha + len(bloco) > LINHAS_MAXIMAS_EXCEL:
+            self.descartar()
+            raise ValueError(f"Mais de {LINHAS_MAXIMAS_EXCEL} linhas não cabem numa planilha; "
+                             f"grave '{os.path.basename(self.caminho)}' em csv ou parquet")
+        valores = [self._valores_coluna(bloco.iloc[:, posicao]) for posicao in range(bloco.shape[1])]
+        linha = self._proxima_linha
+        for celulas in zip(*valores):
+            for posicao, (escrever, valor) in enumerate(celulas):
+                if escrever is not None:
+                    escrever(linha, posicao, valor)
+            linha += 1
+        self._proxima_linha = linha
+
+    def _valores_coluna(self, serie):
+        """(função de escrita, valor) de cada célula; (None, None) para células vazias."""
+        planilha = self._planilha
+        if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+            escrever = lambda l, c, v: planilha.write_datetime(l, c, v, self._formato_data)
+            return [(escrever, v) if v is not pd.NaT else (None, None)
+                    for v in serie.astype(object).tolist()]
+        if pd.api.types.is_bool_dtype(serie.dtype) and not isinstance(serie.dtype, pd.BooleanDtype):
+            return [(planilha.write_boolean, v) for v in serie.tolist()]
+        if pd.api.types.is_numeric_dtype(serie.dtype):
+            numeros = serie.to_numpy(dtype='float64', na_value=np.nan)
+            return [(planilha.write_number, v) if not math.isnan(v) else (None, None)
+                    for v in numeros.tolist()]
+        return [self._celula(v) for v in serie.tolist()]
+
+    def _celula(self, valor):
+        planilha = self._planilha
+        if valor is None or valor is pd.NaT or valor is pd.NA or valor == '':
+            return None, None
+        if isinstance(valor, str):
+            return planilha.write_string, valor
+        if isinstance(valor, bool):
+            return planilha.write_boolean, valor
+        if isinstance(valor, (int, float, np.integer, np.floating)):
+            return (None, None) if math.isnan(valor) else (planilha.write_number, float(valor))
+        if isinstance(valor, (datetime, date)):
+            return lambda l, c, v: planilha.write_datetime(l, c, v, self._formato_data), valor
+        return planilha.write_string, str(valor)
+
+    # --- CSV e Parquet ---
+
+    def _escrever_csv(self, bloco):
+        # Números inteiros guardados como float (por causa de vazios) saem sem ',0'
+        inteiros = {coluna: bloco[coluna].astype('Int64') for coluna in bloco.columns
+                    if pd.api.types.is_float_dtype(bloco[coluna].dtype)
+                    and (bloco[coluna].dropna() % 1 == 0).all()}
+        if inteiros:
+            bloco = bloco.assign(**inteiros)
+        bloco.to_csv(self._arquivo, sep=self.separador, decimal=self.decimal, header=False,
+                     index=False, date_format=FORMATO_DATA_CSV)
+
+    def _escrever_parquet(self, bloco):
+        import pyarrow as pa
+        from cache_colunar import preparar_para_parquet
+        tabela = pa.Table.from_pandas(preparar_para_parquet(bloco), schema=self._esquema, preserve_index=False)
+        self._arquivo.write_table(tabela)
+
+
+def gravar_tabela(df, caminho, formato=None, **opcoes):
+    """
+    Grava o DataFrame (ou uma sequência de DataFrames com as mesmas colunas)
+    com o GravadorTabela. Retorna o caminho gravado.
+    """
+    blocos = [df] if isinstance(df, pd.DataFrame) else df
+    with GravadorTabela(caminho, formato, **opcoes) as gravador:
+        for bloco in blocos:
+            gravador.escrever(bloco)
+    return caminho
+
+
+def gravar_chaves(valores, caminho):
+    """
+    Arquivo de chaves para a seleção múltipla da SE16N: um valor por linha,
+    sem cabeçalho, em UTF-8 sem BOM.
+    """
+    df = valores.to_frame() if isinstance(valores, pd.Series) else valores
+    return gravar_tabela(df, caminho, 'csv', cabecalho=False, separador=',', decimal='.', codificacao='utf-8')
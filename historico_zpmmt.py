@@ -0,0 +1,110 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from configuracao import PASTA_HISTORICO, ZPMMT_DATA_INICIAL, ZPMMT_SOBREPOSICAO_DIAS
+from cache_colunar import preparar_para_parquet
+from esquemas_sap import ESQUEMAS
+
+ARQUIVO_ESTADO = 'estado_zpmmt.json'
+ARQUIVO_HISTORICO = 'ZPMMT_HISTORICO.parquet'
+# Colunas que identificam a linha (requisição + item): cada item tem a sua
+# Data, então a janela traz só os itens datados nela e um item extraído de
+# novo substitui só a sua própria linha no histórico
+CHAVES_HISTORICO = ESQUEMAS['ZPMMT'].chaves
+FORMATO_DATA = '%d.%m.%Y'
+
+
+def caminho_historico(pasta=None):
+    return os.path.join(pasta or PASTA_HISTORICO, ARQUIVO_HISTORICO)
+
+
+def ler_estado(pasta=None):
+    """Última janela extraída com sucesso, ou None se o histórico ainda não existe."""
+    try:
+        with open(os.path.join(pasta or PASTA_HISTORICO, ARQUIVO_ESTADO), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+
+
+def salvar_estado(inicio, fim, linhas, pasta=None):
+    pasta = pasta or PASTA_HISTORICO
+    os.makedirs(pasta, exist_ok=True)
+    estado = {
+        'inicio': inicio.strftime(FORMATO_DATA),
+        'fim': fim.strftime(FORMATO_DATA),
+        'linhas_historico': linhas,
+        'gravado_em': datetime.now().isoformat(timespec='seconds'),
+    }
+    caminho = os.path.join(pasta, ARQUIVO_ESTADO)
+    with open(caminho + '.tmp', 'w', encoding='utf-8') as arquivo:
+        json.dump(estado, arquivo, indent=1)
+    os.replace(caminho + '.tmp', caminho)
+
+
+def normalizar_chave(serie):
+    """
+    Chave (requisição, item) como inteiro (Int64) quando todos os valores são numéricos.
+    O Excel às vezes traz o número como float, o que gravaria '123.0' no
+    arquivo de chaves enviado à SE16N.
+    """
+    numeros = pd.to_numeric(serie, errors='coerce')
+    if numeros.notna().sum() == serie.notna().sum():
+        return numeros.astype('Int64')
+    return serie.astype(str)
+
+
+def calcular_janela(hoje=None, reconstruir=False, sobreposicao_dias=None, pasta=None):
+    """
+    Retorna (data_inicial, data_final) da próxima extração da ZPMMT_287.
+
+    No modo incremental começa `sobreposicao_dias` antes do fim da última janela
+    gravada, para pegar alterações de dias recentes. Sem histórico, ou com
+    `reconstruir=True`, extrai desde ZPMMT_DATA_INICIAL.
+    """
+    hoje = hoje or datetime.now()
+    sobreposicao_dias = ZPMMT_SOBREPOSICAO_DIAS if sobreposicao_dias is None else sobreposicao_dias
+    inicio_completo = datetime.strptime(ZPMMT_DATA_INICIAL, FORMATO_DATA)
+    estado = None if reconstruir else ler_estado(pasta)
+    if estado is None or not os.path.exists(caminho_historico(pasta)):
+        return inicio_completo, hoje
+    ultimo_fim = datetime.strptime(estado['fim'], FORMATO_DATA)
+    return max(inicio_completo, ultimo_fim - timedelta(days=sobreposicao_dias)), hoje
+
+
+def mesclar_historico(df_novo, inicio, fim, reconstruir=False, pasta=None):
+    """
+    Junta a extração da janela ao histórico local: itens de requisição
+    (CHAVES_HISTORICO) que vieram de novo substituem os antigos; os demais,
+    inclusive os outros itens das mesmas requisições datados fora da janela,
+    são mantidos. Grava o histórico e a janela. Retorna o histórico completo.
+    """
+    pasta = pasta or PASTA_HISTORICO
+    os.makedirs(pasta, exist_ok=True)
+    caminho = caminho_historico(pasta)
+    df_novo = preparar_para_parquet(df_novo)
+    for coluna in CHAVES_HISTORICO:
+        df_novo[coluna] = normalizar_chave(df_novo[coluna])
+
+    if reconstruir or not os.path.exists(caminho):
+        historico = df_novo
+    else:
+        antigo = pd.read_parquet(caminho)
+        for coluna in CHAVES_HISTORICO:
+            antigo[coluna] = normalizar_chave(antigo[coluna])
+        extraidos = pd.MultiIndex.from_frame(df_novo[CHAVES_HISTORICO].dropna())
+        mantidas = antigo[~pd.MultiIndex.from_frame(antigo[CHAVES_HISTORICO]).isin(extraidos)]
+        # Tipos podem diferir entre execuções (ex.: Material só numérico num dia)
+        historico = preparar_para_parquet(pd.concat([mantidas, df_novo], ignore_index=True))
+        for coluna in CHAVES_HISTORICO:
+            historico[coluna] = normalizar_chave(historico[coluna])
+
+    historico.to_parquet(caminho + '.tmp', index=False)
+    os.replace(caminho + '.tmp', caminho)
+    salvar_estado(inicio, fim, len(historico), pasta)
+    print(f"Histórico ZPMMT: {len(df_novo)} linhas na janela {inicio:%d.%m.%Y}–{fim:%d.%m.%Y}, "
+          f"{len(historico)} linhas no total.")
+    return historico
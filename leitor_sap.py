@@ -0,0 +1,384 @@
+import csv
+import io
+import re
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from configuracao import FORMATO_EXPORTACAO
+from esquemas_sap import tipos_do_arquivo
+from gravador_tabelas import gravar_tabela
+from rastreamento import acumular
+
+# Extensão de cada formato de exportação do SAP.
+# 'txt' é o "Texto com tabulações" (.tsv para não colidir com os arquivos de chaves .txt).
+EXTENSOES = {'xlsx': '.xlsx', 'txt': '.tsv'}
+
+TAMANHO_BLOCO = 100_000
+# Maior inteiro que o float64 guarda sem perder dígitos
+LIMITE_INTEIRO_EXATO = 2 ** 53
+# Dígitos que cabem sem perda num Int64 e num float64: números mais longos são lidos como texto
+DIGITOS_INTEIRO = 18
+DIGITOS_DECIMAL = 15
+# Data vazia como o SAP exporta
+DATA_VAZIA = '00.00.0000'
+
+RE_SEPARADOR = re.compile(r'^[\s|+\-]*-[\s|+\-]*$')
+RE_NUMERO = re.compile(r'^-?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?-?$')
+RE_DATA = re.compile(r'^\d{2}[./]\d{2}[./]\d{4}$')
+# Caracteres que quebrariam a linha ou a coluna do texto com tabulações
+RE_QUEBRA_TEXTO = re.compile(r'[\t\r\n]')
+
+
+def arquivo_exportado(nome, formato=None):
+    """Nome do arquivo gerado pela exportação `nome` no formato configurado."""
+    return nome + EXTENSOES[formato or FORMATO_EXPORTACAO]
+
+
+def detectar_codificacao(caminho):
+    """Identifica a codificação do arquivo exportado pelo SAP (BOM, UTF-8 ou ANSI)."""
+    with open(caminho, 'rb') as arquivo:
+        inicio = arquivo.read(65536)
+    if inicio.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    if inicio.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'
+    try:
+        inicio.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # Um caractere multibyte cortado no fim do trecho lido não conta como erro
+        if e.start >= len(inicio) - 3:
+            return 'utf-8'
+        return 'cp1252'
+
+
+def limpar_linha(linha, separador):
+    """Tira a quebra de linha e, no formato não convertido, as bordas '|' da linha."""
+    linha = linha.rstrip('\r\n')
+    if separador == '|':
+        linha = linha.strip()
+        if linha.startswith('|'):
+            linha = linha[1:]
+        if linha.endswith('|'):
+            linha = linha[:-1]
+    return linha
+
+
+def nomes_unicos(nomes):
+    """Repete a regra do pandas para cabeçalhos duplicados: 'Coluna', 'Coluna.1', ..."""
+    vistos = {}
+    resultado = []
+    for nome in nomes:
+        if nome in vistos:
+            vistos[nome] += 1
+            resultado.append(f"{nome}.{vistos[nome]}")
+        else:
+            vistos[nome] = 0
+            resultado.append(nome)
+    return resultado
+
+
+class TipoDeduzidoInvalido(ValueError):
+    """Um bloco seguinte tem valores que não cabem no tipo deduzido da coluna no primeiro bloco."""
+
+    def __init__(self, coluna, mensagem):
+        super().__init__(mensagem)
+        self.coluna = coluna
+
+
+def inferir_tipo(serie):
+    """
+    Deduz o tipo de uma coluna ('data', 'inteiro', 'decimal' ou 'texto') pelos
+    seus valores. Números com mais dígitos do que o Int64/float64 guardam
+    exatamente (chaves longas) ficam como texto.
+    """
+    preenchidos = serie[serie != '']
+    if preenchidos.empty:
+        return 'texto'
+    if preenchidos.str.fullmatch(RE_DATA).all():
+        return 'data'
+    if preenchidos.str.fullmatch(RE_NUMERO).all():
+        decimal = preenchidos.str.contains(',', regex=False).any()
+        digitos = preenchidos.str.replace(r'\D', '', regex=True).str.lstrip('0').str.len().max()
+        if digitos > (DIGITOS_DECIMAL if decimal else DIGITOS_INTEIRO):
+            return 'texto'
+        return 'decimal' if decimal else 'inteiro'
+    return 'texto'
+
+
+def converter_coluna(serie, tipo):
+    """
+    Converte os textos de uma coluna para o tipo informado (esquemas_sap.py),
+    no padrão brasileiro: 1.234,56 -> 1234.56, 1.234,56- -> -1234.56 e
+    31.12.2025 -> data. Nenhum valor vira vazio às escondidas: gera
+    ValueError se um valor preenchido não é do tipo (ou, inteiro, não cabe
+    exato no Int64).
+    """
+    if tipo == 'texto':
+        return serie.where(serie != '', None)
+    if tipo == 'categoria':
+        return serie.where(serie != '', None).astype('category')
+    if tipo == 'chave':
+        # Só dígitos: sem a troca de separadores dos números no padrão brasileiro
+        preenchidos = serie != ''
+        invalidos = serie[preenchidos & ~serie.str.isdigit()]
+        if len(invalidos):
+            raise ValueError(f"{len(invalidos)} valor(es) não numérico(s) numa coluna 'chave' "
+                             f"(ex.: {invalidos.head(3).tolist()})")
+        return pd.to_numeric(serie.where(preenchidos), dtype_backend='numpy_nullable').astype('Int64')
+    if tipo == 'data':
+        preenchidos = (serie != '') & (serie != DATA_VAZIA)
+        datas = pd.to_datetime(serie.str.replace('/', '.', regex=False).where(preenchidos),
+                               format='%d.%m.%Y', errors='coerce')
+        validar_conversao(serie, preenchidos & datas.isna(), tipo)
+        return datas
+
+    preenchidos = serie != ''
+    negativo = serie.str.endswith('-')
+    texto = (serie.str.rstrip('-')
+             .str.replace('.', '', regex=False)
+             .str.replace(',', '.', regex=False))
+    if tipo == 'inteiro':
+        # Sem passar por float: os dígitos voltam exatos
+        validos = texto.str.fullmatch(rf'-?\d{{1,{DIGITOS_INTEIRO}}}')
+        validar_conversao(serie, preenchidos & ~validos, tipo)
+        numeros = pd.to_numeric(texto.where(preenchidos), dtype_backend='numpy_nullable').astype('Int64')
+    else:
+        numeros = pd.to_numeric(texto.where(preenchidos), errors='coerce').astype('float64')
+        validar_conversao(serie, preenchidos & numeros.isna(), tipo)
+    return numeros.where(~negativo, -numeros)
+
+
+def validar_conversao(serie, invalidos, tipo):
+    """ValueError com exemplos se algum valor preenchido não converteu para o tipo."""
+    if invalidos.any():
+        exemplos = serie[invalidos].head(3).tolist()
+        raise ValueError(f"{int(invalidos.sum())} valor(es) que não são '{tipo}' (ex.: {exemplos})")
+
+
+def converter_deduzido(serie):
+    """Deduz o tipo da coluna e converte; se algum valor não converte (ex.: 31.02.2025), fica texto."""
+    tipo = inferir_tipo(serie)
+    try:
+        return tipo, converter_coluna(serie, tipo)
+    except ValueError:
+        return 'texto', converter_coluna(serie, 'texto')
+
+
+def ler_texto_sap(caminho, colunas=None, tipos=None, tamanho_bloco=TAMANHO_BLOCO, codificacao=None):
+    """
+    Lê em blocos um arquivo exportado pelo SAP como "Texto com tabulações" ou
+    "Não convertido" (colunas separadas por '|'), sem carregar o arquivo inteiro.
+
+    Ignora as linhas de título, as linhas separadoras '----' e os cabeçalhos
+    repetidos a cada página. Cada bloco é um DataFrame já tipado; os tipos
+    não informados em `tipos` são deduzidos no primeiro bloco e mantidos nos
+    seguintes. Se um bloco seguinte não cabe no tipo deduzido, gera
+    TipoDeduzidoInvalido (ler_blocos_texto recomeça com a coluna como texto).
+    `colunas` limita as colunas lidas.
+    """
+    codificacao = codificacao or detectar_codificacao(caminho)
+    tipos = dict(tipos or {})
+    deduzidos = set()
+    emitidos = 0
+    separador = cabecalho = linha_cabecalho = None
+    indices = nomes = []
+    linhas = []
+
+    def ler_bloco(texto, chaves):
+        """As colunas do bloco como texto, menos as `chaves`, lidas como número pelo próprio leitor em C."""
+        return pd.read_csv(io.StringIO(texto), sep=separador, header=None, names=range(len(cabecalho)),
+                           usecols=indices,
+                           dtype={indice: 'float64' if indice in chaves else str for indice in indices},
+                           keep_default_na=False, na_values={indice: [''] for indice in chaves},
+                           quoting=csv.QUOTE_NONE, engine='c')
+
+    def montar_bloco():
+        # As linhas já limpas são quebradas em colunas pelo leitor em C do pandas
+        if linhas:
+            texto = '\n'.join(linhas)
+            # Colunas 'chave' do esquema vão direto para número, sem criar um texto por célula
+            chaves = {indice for indice, nome in zip(indices, nomes) if tipos.get(nome) == 'chave'}
+            try:
+                bruto = ler_bloco(texto, chaves)
+                # float64 só guarda inteiros exatos até 2**53: com decimais ou números maiores, lê como texto
+                for indice in chaves:
+                    numeros = bruto[indice].dropna()
+                    if not ((numeros % 1 == 0) & (numeros.abs() < LIMITE_INTEIRO_EXATO)).all():
+                        raise ValueError
+            except ValueError:
+                # Algum valor não é número: converter_coluna aponta qual
+                bruto = ler_bloco(texto, set())
+        else:
+            bruto = pd.DataFrame({indice: pd.Series(dtype=object) for indice in indices})
+        bloco = {}
+        for indice, nome in zip(indices, nomes):
+            if bruto[indice].dtype == 'float64':
+                bloco[nome] = bruto[indice].astype('Int64')
+                continue
+            # Linhas com menos colunas que o cabeçalho completam com vazio
+            serie = bruto[indice].fillna('').str.strip()
+            if nome not in tipos:
+                tipos[nome], bloco[nome] = converter_deduzido(serie)
+                deduzidos.add(nome)
+                continue
+            try:
+                bloco[nome] = converter_coluna(serie, tipos[nome])
+            except ValueError as e:
+                if nome in deduzidos:
+                    # Os blocos anteriores já saíram com o tipo deduzido: quem lê recomeça com a coluna como texto
+                    raise TipoDeduzidoInvalido(nome, f"Coluna '{nome}' de {caminho}, deduzida como "
+                                                     f"'{tipos[nome]}': {e}") from e
+                raise ValueError(f"Coluna '{nome}' de {caminho}: {e}; ajuste o tipo em esquemas_sap.py") from e
+        return pd.DataFrame(bloco, columns=nomes)
+
+    with open(caminho, encoding=codificacao, newline='') as arquivo:
+        for linha in arquivo:
+            if not linha.strip() or RE_SEPARADOR.match(linha):
+                continue
+            if separador is None:
+                # Linhas de título antes do cabeçalho não têm separador de colunas
+                if '\t' in linha:
+                    separador = '\t'
+                elif '|' in linha:
+                    separador = '|'
+                else:
+                    continue
+            linha = limpar_linha(linha, separador)
+            if cabecalho is None:
+                celulas = [celula.strip() for celula in linha.split(separador)]
+                todos = nomes_unicos(celulas)
+                # Colunas sem nome (ex.: tabulação no início da linha) são descartadas
+                indices = [i for i, nome in enumerate(celulas)
+                           if nome and (colunas is None or todos[i] in colunas)]
+                nomes = [todos[i] for i in indices]
+                cabecalho = celulas
+                linha_cabecalho = linha
+                if colunas is not None:
+                    faltando = set(colunas) - set(nomes)
+                    if faltando:
+                        raise KeyError(f"Colunas não encontradas em {caminho}: {sorted(faltando)}")
+                continue
+            if linha == linha_cabecalho:
+                continue
+            linhas.append(linha)
+            if len(linhas) >= tamanho_bloco:
+                yield montar_bloco()
+                emitidos += 1
+                linhas = []
+
+    if cabecalho is None:
+        raise ValueError(f"Cabeçalho não encontrado no arquivo exportado {caminho}")
+    if linhas or not emitidos:
+        yield montar_bloco()
+
+
+def ler_blocos_texto(caminho, consumir, colunas=None, tipos=None):
+    """
+    Passa os blocos de ler_texto_sap para `consumir(blocos)` e devolve o
+    resultado. Se uma coluna de tipo deduzido não converte num bloco seguinte
+    (ex.: Material só com dígitos no primeiro bloco e 'ABC-001' depois), a
+    leitura recomeça do início com essa coluna como texto em todos os blocos,
+    em vez de perder os valores; a troca fica no log e no rastreamento.
+    """
+    tipos = dict(tipos or {})
+    while True:
+        try:
+            return consumir(ler_texto_sap(caminho, colunas, tipos))
+        except TipoDeduzidoInvalido as e:
+            print(f"⚠ {e}. Relendo o arquivo com a coluna como texto.")
+            acumular(colunas_relidas_como_texto=1)
+            tipos[e.coluna] = 'texto'
+
+
+def aplicar_tipos(df, tipos):
+    """
+    Converte para os tipos do esquema as colunas de um DataFrame lido já com
+    tipos próprios (planilha .xlsx): números e datas do Excel são mantidos,
+    textos passam por converter_coluna.
+    """
+    for nome, tipo in tipos.items():
+        if nome not in df.columns or tipo == 'texto':
+            continue
+        serie = df[nome]
+        if tipo == 'data' and pd.api.types.is_datetime64_any_dtype(serie.dtype):
+            continue
+        if pd.api.types.is_numeric_dtype(serie.dtype) and tipo in ('chave', 'inteiro', 'decimal', 'categoria'):
+            if tipo == 'decimal':
+                df[nome] = serie.astype('float64')
+                continue
+            serie = serie.round().astype('Int64')
+            df[nome] = serie.astype('string').astype('category') if tipo == 'categoria' else serie
+            continue
+        texto = serie.map(lambda v: '' if v is None or pd.isna(v) else str(v)).str.strip()
+        df[nome] = converter_coluna(texto, tipo)
+    return df
+
+
+def compactar_chaves(df, tipos):
+    """Colunas 'chave' sem vazios viram int64 (o Int64 dos blocos guarda uma máscara de vazios à toa)."""
+    for nome, tipo in tipos.items():
+        if tipo == 'chave' and nome in df.columns and df[nome].dtype == 'Int64' and not df[nome].hasnans:
+            df[nome] = df[nome].astype('int64')
+    return df
+
+
+def juntar_blocos(blocos):
+    """Junta os blocos de ler_texto_sap; as colunas category continuam category, com as categorias de todos."""
+    if len(blocos) == 1:
+        return blocos[0]
+    for nome in blocos[0].columns:
+        if isinstance(blocos[0][nome].dtype, pd.CategoricalDtype):
+            categorias = union_categoricals([bloco[nome] for bloco in blocos]).categories
+            for bloco in blocos:
+                bloco[nome] = bloco[nome].cat.set_categories(categorias)
+    return pd.concat(blocos, ignore_index=True)
+
+
+def ler_exportacao(caminho, colunas=None, tipos=None):
+    """
+    Lê uma exportação do SAP (.xlsx ou texto) e devolve um único DataFrame.
+    Sem `tipos`, usa os do esquema da tabela (esquemas_sap.py); {} deduz todos.
+    """
+    if tipos is None:
+        tipos = tipos_do_arquivo(caminho)
+    if caminho.lower().endswith('.xlsx'):
+        return compactar_chaves(aplicar_tipos(pd.read_excel(caminho, usecols=colunas), tipos), tipos)
+    return compactar_chaves(ler_blocos_texto(caminho, lambda blocos: juntar_blocos(list(blocos)), colunas, tipos),
+                            tipos)
+
+
+def limpar_textos(df):
+    """
+    Tabulações e quebras de linha dentro dos textos viram espaço, como no
+    texto exportado pelo SAP; sem elas, o arquivo não precisa de aspas nem de
+    escape. Só copia o DataFrame se alguma coluna muda.
+    """
+    trocas = {}
+    for nome, serie in df.items():
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            serie = serie.astype(object)
+        elif serie.dtype != object and not isinstance(serie.dtype, pd.StringDtype):
+            continue
+        com_quebra = serie.str.contains(RE_QUEBRA_TEXTO, na=False)
+        if com_quebra.any():
+            serie = serie.copy()
+            serie[com_quebra] = serie[com_quebra].str.replace(RE_QUEBRA_TEXTO, ' ', regex=True)
+            trocas[nome] = serie
+    return df.assign(**trocas) if trocas else df
+
+
+def gravar_exportacao(df, caminho):
+    """
+    Grava um DataFrame no mesmo formato de uma exportação do SAP (.xlsx ou
+    texto com tabulações no padrão brasileiro), para ser lido por ler_exportacao.
+    O texto sai sem aspas (ler_texto_sap lê com QUOTE_NONE): um '"' no meio de
+    uma descrição volta igual.
+    """
+    if caminho.lower().endswith('.xlsx'):
+        # Planilha gravada em fluxo (constant_memory), sem montar o arquivo inteiro na memória
+        gravar_tabela(df, caminho, 'xlsx')
+    else:
+        limpar_textos(df).to_csv(caminho, sep='\t', index=False, decimal=',', date_format='%d.%m.%Y',
+                                 encoding='utf-8', quoting=csv.QUOTE_NONE)
@@ -0,0 +1,215 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+import pandas as pd
+
+from configuracao import PASTA_ONTIME, LOTE_CHAVES, COMPACTAR_INTERVALOS
+from leitor_sap import ler_exportacao, gravar_exportacao
+from rastreamento import acumular
+from sap_se16n import ResultadoExtracao, extrair_tabela
+
+
+def normalizar_chaves(serie):
+    """
+    Chave como texto comparável entre o arquivo de chaves e a exportação:
+    sem espaços, sem '.0' de números lidos como float e sem zeros à esquerda.
+    """
+    texto = serie.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+    numerico = texto.str.fullmatch(r'\d+')
+    return texto.where(~numerico, texto.str.lstrip('0').replace('', '0'))
+
+
+def ler_chaves(caminho):
+    """Chaves do arquivo (uma por linha), sem espaços, sem '.0' e sem repetição, na ordem do arquivo."""
+    chaves = pd.read_csv(caminho, header=None, dtype=str, skip_blank_lines=True).iloc[:, 0].dropna()
+    chaves = chaves.str.strip().str.replace(r'\.0$', '', regex=True)
+    return list(dict.fromkeys(chaves[chaves != '']))
+
+
+def compactar_intervalos(chaves):
+    """
+    Ordena as chaves e junta as numéricas consecutivas (com o mesmo número de
+    dígitos) em intervalos. Retorna uma lista de (de, ate); `ate` é None para
+    chave avulsa. Chaves não numéricas seguem avulsas, depois das numéricas.
+    """
+    numericas = sorted((c for c in chaves if c.isdigit()), key=lambda c: (len(c), int(c)))
+    textos = sorted(c for c in chaves if not c.isdigit())
+    entradas = []
+    inicio = anterior = None
+    for chave in numericas:
+        if anterior is not None and len(chave) == len(anterior) and int(chave) == int(anterior) + 1:
+            anterior = chave
+            continue
+        if inicio is not None:
+            entradas.append((inicio, anterior if anterior != inicio else None))
+        inicio = anterior = chave
+    if inicio is not None:
+        entradas.append((inicio, anterior if anterior != inicio else None))
+    return entradas + [(c, None) for c in textos]
+
+
+def dividir_lotes(entradas, tamanho):
+    """Divide as entradas em lotes de no máximo `tamanho` entradas."""
+    tamanho = max(1, int(tamanho))
+    return [entradas[i:i + tamanho] for i in range(0, len(entradas), tamanho)]
+
+
+def chaves_das_entradas(entradas):
+    """Chaves pedidas pelas entradas: as avulsas e todas as de cada intervalo, com o mesmo número de dígitos."""
+    chaves = []
+    for de, ate in entradas:
+        if ate is None:
+            chaves.append(de)
+        else:
+            chaves.extend(str(numero).zfill(len(de)) for numero in range(int(de), int(ate) + 1))
+    return chaves
+
+
+def gravar_lote(entradas, caminho):
+    """
+    Grava um lote no formato do upload da seleção múltipla da SE16N: uma
+    entrada por linha, com o limite superior do intervalo (se houver) na
+    segunda coluna, separado por tabulação.
+    """
+    with open(caminho, 'w', encoding='utf-8', newline='') as arquivo:
+        for de, ate in entradas:
+            arquivo.write(f"{de}\t{ate}\r\n" if ate is not None else f"{de}\r\n")
+
+
+def conferir_lote(session, spec_lote, entradas, parte, pasta, tamanho_lote):
+    """
+    Confere se cada chave pedida pelo lote voltou na exportação. As que
+    faltam dentro de intervalos são consultadas de novo como chaves avulsas
+    (em lotes de até `tamanho_lote`): se a SE16N ignorasse o limite superior
+    (ate), cada intervalo traria só a primeira chave e as outras se perderiam
+    sem erro. Retorna a parte (com as linhas das consultas avulsas), as chaves
+    que seguem sem linhas (ex.: remessa ainda sem movimento) e os resultados
+    das consultas avulsas.
+    """
+    coluna = spec_lote.coluna_campo_chave
+    if coluna is None:
+        return parte, [], []
+    if coluna not in parte.columns:
+        raise KeyError(f"Coluna '{coluna}' (campo {spec_lote.campo_chave}) não veio na exportação "
+                       f"{spec_lote.arquivo_saida}; confira a variante {spec_lote.variante}.")
+    pedidas = pd.Series(chaves_das_entradas(entradas), dtype=str)
+    faltando = pedidas[~normalizar_chaves(pedidas).isin(normalizar_chaves(parte[coluna]))]
+    avulsas = [de for de, ate in entradas if ate is None]
+    reconsultar = faltando[~faltando.isin(avulsas)]
+
+    resultados = []
+    extras = []
+    for numero, lote in enumerate(dividir_lotes([(chave, None) for chave in reconsultar], tamanho_lote), 1):
+        nome = f"{spec_lote.saida}_CONFERENCIA{numero}"
+        spec_conferencia = replace(spec_lote, arquivo_chaves=f"{nome}.txt", saida=nome)
+        gravar_lote(lote, os.path.join(pasta, spec_conferencia.arquivo_chaves))
+        resultados.append(extrair_tabela(session, spec_conferencia, pasta))
+        caminho = os.path.join(pasta, spec_conferencia.arquivo_saida)
+        extras.append(ler_exportacao(caminho))
+        os.remove(caminho)
+        os.remove(os.path.join(pasta, spec_conferencia.arquivo_chaves))
+    recuperadas = sum(len(extra) for extra in extras)
+    if recuperadas:
+        print(f"⚠ Tabela {spec_lote.tabela}: {recuperadas} linha(s) de chaves dentro de intervalos só vieram "
+              f"na consulta avulsa. A SE16N pode estar ignorando o limite superior dos intervalos; "
+              f"SAP_COMPACTAR_INTERVALOS=false envia as chaves avulsas.")
+        acumular(linhas_recuperadas_de_intervalos=recuperadas)
+        parte = pd.concat([parte] + extras, ignore_index=True)
+        faltando = faltando[~normalizar_chaves(faltando).isin(normalizar_chaves(parte[coluna]))]
+    return parte, faltando.tolist(), resultados
+
+
+def extrair_em_lotes(sessoes, spec, pasta=PASTA_ONTIME, tamanho_lote=None, compactar=None):
+    """
+    Extrai uma tabela do registro dividindo o arquivo de chaves em lotes de até
+    `tamanho_lote` entradas (SAP_LOTE_CHAVES), cada um numa consulta própria.
+
+    `sessoes` é a lista de funções que abrem, na thread atual, as sessões SAP
+    disponíveis para a etapa: com mais de uma, os lotes são distribuídos entre
+    elas. Cada exportação parcial é lida assim que termina e conferida
+    (conferir_lote); as chaves sem linhas são informadas no fim. O resultado
+    final, sem linhas repetidas, é gravado em spec.arquivo_saida.
+    Intervalos só são enviados se a exportação traz a coluna do campo-chave,
+    para tirar as chaves não pedidas que caem dentro deles.
+    """
+    tamanho_lote = tamanho_lote or LOTE_CHAVES
+    compactar = COMPACTAR_INTERVALOS if compactar is None else compactar
+    if compactar and spec.coluna_campo_chave is None:
+        print(f"⚠ Tabela {spec.tabela}: sem a coluna do campo {spec.campo_chave} no registro, "
+              f"as chaves vão avulsas, sem intervalos.")
+        compactar = False
+    chaves = ler_chaves(os.path.join(pasta, spec.arquivo_chaves))
+    entradas = compactar_intervalos(chaves) if compactar else [(c, None) for c in chaves]
+    lotes = dividir_lotes(entradas, tamanho_lote)
+    if len(lotes) <= 1 and len(entradas) == len(chaves):
+        # Cabe numa consulta e não houve intervalos: envia o arquivo original
+        return extrair_tabela(sessoes[0](), spec, pasta)
+
+    nome_base = spec.saida or spec.tabela
+    print(f"Tabela {spec.tabela}: {len(chaves)} chaves em {len(entradas)} entradas, "
+          f"{len(lotes)} lote(s) de até {tamanho_lote}.")
+    fila = queue.Queue()
+    for numero, lote in enumerate(lotes, 1):
+        arquivo_lote = f"{nome_base}_LOTE{numero}.txt"
+        gravar_lote(lote, os.path.join(pasta, arquivo_lote))
+        fila.put((numero, lote, replace(spec, arquivo_chaves=arquivo_lote, saida=f"{nome_base}_LOTE{numero}")))
+
+    partes = []
+    resultados = []
+    sem_linhas = []
+    lock = threading.Lock()
+    falhou = threading.Event()
+
+    def trabalhar(abrir_sessao):
+        session = abrir_sessao()
+        while not falhou.is_set():
+            try:
+                numero, lote, spec_lote = fila.get_nowait()
+            except queue.Empty:
+                return
+            print(f"Lote {numero}/{len(lotes)} da tabela {spec.tabela}...")
+            try:
+                resultado = extrair_tabela(session, spec_lote, pasta)
+                caminho_parte = os.path.join(pasta, spec_lote.arquivo_saida)
+                parte = ler_exportacao(caminho_parte)
+                parte, faltando, conferencias = conferir_lote(session, spec_lote, lote, parte, pasta, tamanho_lote)
+            except Exception:
+                # Os outros trabalhadores param ao terminar o lote atual
+                falhou.set()
+                raise
+            with lock:
+                partes.append((numero, parte))
+                resultados.extend([resultado] + conferencias)
+                sem_linhas.extend(faltando)
+            os.remove(caminho_parte)
+            os.remove(os.path.join(pasta, spec_lote.arquivo_chaves))
+
+    trabalhadores = sessoes[:len(lotes)]
+    if len(trabalhadores) == 1:
+        trabalhar(trabalhadores[0])
+    else:
+        with ThreadPoolExecutor(max_workers=len(trabalhadores)) as executor:
+            for futuro in [executor.submit(trabalhar, abrir) for abrir in trabalhadores]:
+                futuro.result()
+
+    df = pd.concat([parte for _, parte in sorted(partes, key=lambda p: p[0])], ignore_index=True)
+    df = df.drop_duplicates(ignore_index=True)
+    if len(entradas) < len(chaves):
+        # Num campo texto sem conversão o intervalo '100'–'105' também traz '1000';
+        # fica só o que foi pedido
+        pedidas = normalizar_chaves(pd.Series(chaves))
+        df = df[normalizar_chaves(df[spec.coluna_campo_chave]).isin(pedidas)].reset_index(drop=True)
+    if sem_linhas:
+        print(f"Tabela {spec.tabela}: {len(sem_linhas)} chave(s) sem linhas na SE16N "
+              f"(ex.: {', '.join(sem_linhas[:5])}).")
+        acumular(chaves_sem_linhas=len(sem_linhas))
+    gravar_exportacao(df, os.path.join(pasta, spec.arquivo_saida))
+
+    resultado = ResultadoExtracao(spec.tabela, len(chaves), len(df),
+                                  sum(r.tempo_consulta for r in resultados),
+                                  sum(r.tempo_exportacao for r in resultados))
+    print(f"Tabela {spec.tabela}: {len(lotes)} lote(s) juntados em {spec.arquivo_saida}, {len(df)} linhas.")
+    return resultado
@@ -0,0 +1,98 @@
+import os
+
+import pandas as pd
+
+from configuracao import ARQUIVO_MAPEAMENTO_LOCAIS, PASTA_CACHE
+from cache_colunar import calcular_hash
+
+# Tipos de entrada da tabela de DE-PARA (coluna 'tipo' do CSV)
+TIPOS = ('cnpj', 'cidade')
+
+
+def dobrar_acentos(serie):
+    """
+    Chave de cidade comparável: sem acentos, em maiúsculas, sem espaços nas
+    pontas e com espaços internos simples ('São  Paulo ' -> 'SAO PAULO').
+    """
+    texto = serie.str.normalize('NFKD').str.encode('ascii', errors='ignore').str.decode('ascii')
+    return texto.str.upper().str.strip().str.replace(r'\s+', ' ', regex=True)
+
+
+def normalizar_cnpj(serie):
+    """CNPJ só com dígitos e sem zeros à esquerda, como o texto gerado do número ('<NA>' quando vazio)."""
+    digitos = serie.astype('string').str.replace(r'\D', '', regex=True)
+    return pd.to_numeric(digitos, errors='coerce').astype('Int64').astype(str)
+
+
+def ler_mapeamento(caminho=None):
+    """Tabela de DE-PARA como está no arquivo (tipo;valor;codigo)."""
+    tabela = pd.read_csv(caminho or ARQUIVO_MAPEAMENTO_LOCAIS, sep=';', dtype=str, encoding='utf-8')
+    tabela = tabela.dropna(subset=['tipo', 'valor', 'codigo'])
+    tabela['tipo'] = tabela['tipo'].str.strip().str.lower()
+    invalidos = sorted(set(tabela['tipo']) - set(TIPOS))
+    if invalidos:
+        raise ValueError(f"Tipo(s) desconhecido(s) na tabela de locais: {invalidos} (use {', '.join(TIPOS)})")
+    tabela['codigo'] = tabela['codigo'].str.strip().str.upper()
+    return tabela
+
+
+def compilar_indice(tabela):
+    """
+    Monta o índice de busca {'cnpj': Series, 'cidade': Series} (chave normalizada
+    -> código). Grafias que viram a mesma chave precisam apontar para o mesmo código.
+    """
+    chaves = pd.Series(index=tabela.index, dtype=object)
+    e_cnpj = tabela['tipo'] == 'cnpj'
+    chaves[e_cnpj] = normalizar_cnpj(tabela.loc[e_cnpj, 'valor'])
+    chaves[~e_cnpj] = dobrar_acentos(tabela.loc[~e_cnpj, 'valor'])
+    compilado = pd.DataFrame({'tipo': tabela['tipo'], 'chave': chaves, 'codigo': tabela['codigo']})
+    compilado = compilado.drop_duplicates()
+
+    conflitos = compilado[compilado.duplicated(['tipo', 'chave'], keep=False)]
+    if len(conflitos):
+        exemplos = conflitos.groupby(['tipo', 'chave'])['codigo'].apply(lambda c: '/'.join(sorted(c))).head(10)
+        raise ValueError("Chaves com mais de um código na tabela de locais: "
+                         + "; ".join(f"{tipo} '{chave}' -> {codigos}" for (tipo, chave), codigos in exemplos.items()))
+    return {tipo: compilado.loc[compilado['tipo'] == tipo].set_index('chave')['codigo'].sort_index()
+            for tipo in TIPOS}
+
+
+def carregar_indice(caminho=None, pasta_cache=None):
+    """
+    Índice de busca da tabela de locais. A compilação é guardada em Parquet
+    na pasta do cache, identificada pelo hash do arquivo: só é refeita quando
+    a tabela muda.
+    """
+    caminho = caminho or ARQUIVO_MAPEAMENTO_LOCAIS
+    pasta_cache = pasta_cache or PASTA_CACHE
+    arquivo_indice = os.path.join(pasta_cache, f"locais_{calcular_hash(caminho)[:16]}.parquet")
+    if os.path.exists(arquivo_indice):
+        compilado = pd.read_parquet(arquivo_indice)
+        return {tipo: compilado.loc[compilado['tipo'] == tipo].set_index('chave')['codigo'] for tipo in TIPOS}
+
+    indice = compilar_indice(ler_mapeamento(caminho))
+    os.makedirs(pasta_cache, exist_ok=True)
+    compilado = pd.concat([serie.rename('codigo').rename_axis('chave').reset_index().assign(tipo=tipo)
+                           for tipo, serie in indice.items()], ignore_index=True)
+    compilado.to_parquet(arquivo_indice + '.tmp', index=False)
+    os.replace(arquivo_indice + '.tmp', arquivo_indice)
+    print(f"Tabela de locais compilada: {len(indice['cnpj'])} CNPJs e {len(indice['cidade'])} cidades.")
+    return indice
+
+
+def consultar(chaves, tabela):
+    """Código de cada chave (NaN quando não está na tabela), por junção categórica com o índice."""
+    codigos = pd.Categorical(chaves, categories=tabela.index).codes
+    resultado = tabela.to_numpy(dtype=object).take(codigos)
+    resultado[codigos == -1] = float('nan')
+    return pd.Series(resultado, index=chaves.index, dtype=object)
+
+
+def codigo_cnpj(cnpjs, indice):
+    """Código do local pelo CNPJ já convertido em texto (ver JWM.cnpj_como_texto)."""
+    return consultar(normalizar_cnpj(cnpjs), indice['cnpj'])
+
+
+def codigo_cidade(cidades, indice):
+    """Código do local pelo nome da cidade, sem diferenciar acentos, maiúsculas e espaços."""
+    return consultar(dobrar_acentos(cidades), indice['cidade'])
@@ -0,0 +1,227 @@
+import json
+import os
+import statistics
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+
+from configuracao import PASTA_ONTIME, PASTA_RASTREAMENTO, RASTREAMENTO_HISTORICO_MAXIMO
+
+ARQUIVO_HISTORICO_EXECUCOES = 'historico_execucoes.jsonl'
+# Etapa mais lenta que isso vezes a mediana das execuções anteriores é apontada
+FATOR_REGRESSAO = 1.5
+# Execuções anteriores usadas na mediana
+EXECUCOES_COMPARADAS = 10
+
+# Registro da etapa que está rodando na thread atual (para registrar_linhas)
+_atual = threading.local()
+
+
+def tamanho_arquivo(caminho):
+    try:
+        return os.path.getsize(caminho)
+    except OSError:
+        return None
+
+
+@dataclass
+class RegistroEtapa:
+    """Medidas de uma etapa: tempo, linhas, tamanho dos arquivos e chamadas COM."""
+    nome: str
+    inicio: str
+    segundos: float = 0.0
+    linhas_entrada: int = None
+    linhas_saida: int = None
+    # {arquivo: bytes} no início (entradas) e no fim (saídas) da etapa
+    arquivos_entrada: dict = field(default_factory=dict)
+    arquivos_saida: dict = field(default_factory=dict)
+    # {método: chamadas}; leituras e escritas de propriedades como 'leitura:Busy' / 'escrita:text'
+    chamadas_com: dict = field(default_factory=dict)
+    # Medidas próprias da etapa (ex.: tempo de consulta e de exportação da SE16N)
+    extras: dict = field(default_factory=dict)
+    erro: str = None
+
+    def __post_init__(self):
+        self._contador = Counter()
+        self._lock = threading.Lock()
+
+    def contar(self, chamada):
+        with self._lock:
+            self._contador[chamada] += 1
+
+    def instrumentar(self, objeto):
+        """Devolve o objeto COM (ex.: a sessão SAP) com as chamadas contadas nesta etapa."""
+        return ObjetoContado(objeto, self)
+
+    def finalizar(self):
+        with self._lock:
+            self.chamadas_com = dict(self._contador.most_common())
+
+    def como_dict(self):
+        dados = asdict(self)
+        dados['total_chamadas_com'] = sum(self.chamadas_com.values())
+        dados['chamadas_find_by_id'] = sum(n for nome, n in self.chamadas_com.items() if nome.lower() == 'findbyid')
+        return dados
+
+
+class ObjetoContado:
+    """
+    Envolve um objeto COM do SAP GUI contando cada ida e volta: chamadas de
+    método, leituras e escritas de propriedades. Objetos COM devolvidos
+    (ex.: o elemento do findById) também são envolvidos.
+    """
+
+    def __init__(self, objeto, registro):
+        object.__setattr__(self, '_objeto', objeto)
+        object.__setattr__(self, '_registro', registro)
+
+    def _envolver(self, valor):
+        return ObjetoContado(valor, self._registro) if hasattr(valor, '_oleobj_') else valor
+
+    def __getattr__(self, nome):
+        valor = getattr(self._objeto, nome)
+        if not callable(valor) or hasattr(valor, '_oleobj_'):
+            self._registro.contar(f'leitura:{nome}')
+            return self._envolver(valor)
+
+        def chamar(*args, **kwargs):
+            self._registro.contar(nome)
+            return self._envolver(valor(*args, **kwargs))
+        return chamar
+
+    def __setattr__(self, nome, valor):
+        self._registro.contar(f'escrita:{nome}')
+        setattr(self._objeto, nome, valor)
+
+    def __call__(self, *args, **kwargs):
+        # Coleções COM chamadas direto, ex.: connection.Children(0)
+        self._registro.contar('()')
+        return self._envolver(self._objeto(*args, **kwargs))
+
+
+def registrar_linhas(entrada=None, saida=None):
+    """Registra as linhas lidas e gravadas pela etapa que roda nesta thread."""
+    registro = getattr(_atual, 'registro', None)
+    if registro is None:
+        return
+    if entrada is not None:
+        registro.linhas_entrada = (registro.linhas_entrada or 0) + int(entrada)
+    if saida is not None:
+        registro.linhas_saida = (registro.linhas_saida or 0) + int(saida)
+
+
+def registrar(**medidas):
+    """Guarda medidas próprias (segundos, contagens) na etapa que roda nesta thread."""
+    registro = getattr(_atual, 'registro', None)
+    if registro is not None:
+        registro.extras.update(medidas)
+
+
+def acumular(**contagens):
+    """Soma contagens (ex.: chaves sem linhas nos lotes) às da etapa que roda nesta thread."""
+    registro = getattr(_atual, 'registro', None)
+    if registro is not None:
+        for nome, valor in contagens.items():
+            registro.extras[nome] = registro.extras.get(nome, 0) + valor
+
+
+class Rastreador:
+    """
+    Rastreamento de uma execução: cada etapa (login, ZPMMT_287, cada tabela
+    SE16N, cada etapa de pandas) vira um RegistroEtapa. Ao final, gravar()
+    escreve o JSON da execução e acrescenta o resumo ao histórico.
+    """
+
+    def __init__(self, pasta=None, pasta_arquivos=None, parametros=None):
+        self.pasta = pasta or PASTA_RASTREAMENTO
+        self.pasta_arquivos = pasta_arquivos or PASTA_ONTIME
+        self.parametros = parametros or {}
+        self.inicio = datetime.now()
+        self._inicio_relogio = time.perf_counter()
+        self.registros = []
+        self._lock = threading.Lock()
+
+    def _tamanhos(self, arquivos):
+        return {nome: tamanho_arquivo(os.path.join(self.pasta_arquivos, nome)) for nome in arquivos}
+
+    @contextmanager
+    def etapa(self, nome, entradas=(), saidas=()):
+        """Mede o bloco como a etapa `nome`; o registro fica disponível dentro do bloco."""
+        registro = RegistroEtapa(nome, datetime.now().isoformat(timespec='seconds'),
+                                 arquivos_entrada=self._tamanhos(entradas))
+        anterior = getattr(_atual, 'registro', None)
+        _atual.registro = registro
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        except BaseException as e:
+            registro.erro = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            registro.segundos = time.perf_counter() - inicio
+            registro.arquivos_saida = self._tamanhos(saidas)
+            registro.finalizar()
+            _atual.registro = anterior
+            with self._lock:
+                self.registros.append(registro)
+
+    def resumo(self):
+        return {
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            'segundos': time.perf_counter() - self._inicio_relogio,
+            'parametros': self.parametros,
+            'sucesso': all(r.erro is None for r in self.registros),
+            'etapas': {r.nome: {'segundos': round(r.segundos, 3),
+                                'chamadas_com': sum(r.chamadas_com.values()),
+                                'linhas_saida': r.linhas_saida}
+                       for r in self.registros},
+        }
+
+    def gravar(self):
+        """Grava o JSON da execução e atualiza o histórico. Retorna o caminho do JSON."""
+        os.makedirs(self.pasta, exist_ok=True)
+        resumo = self.resumo()
+        anteriores = ler_historico(self.pasta)
+
+        caminho = os.path.join(self.pasta, f"execucao_{self.inicio:%Y%m%d_%H%M%S}.json")
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump({**resumo, 'etapas': [r.como_dict() for r in self.registros]},
+                      arquivo, indent=1, ensure_ascii=False)
+
+        historico = (anteriores + [resumo])[-RASTREAMENTO_HISTORICO_MAXIMO:]
+        caminho_historico = os.path.join(self.pasta, ARQUIVO_HISTORICO_EXECUCOES)
+        with open(caminho_historico + '.tmp', 'w', encoding='utf-8') as arquivo:
+            for execucao in historico:
+                arquivo.write(json.dumps(execucao, ensure_ascii=False) + '\n')
+        os.replace(caminho_historico + '.tmp', caminho_historico)
+
+        print(f"Rastreamento da execução gravado em {caminho}")
+        imprimir_comparacao(resumo, anteriores)
+        return caminho
+
+
+def ler_historico(pasta=None):
+    """Resumos das execuções anteriores, da mais antiga para a mais recente."""
+    try:
+        with open(os.path.join(pasta or PASTA_RASTREAMENTO, ARQUIVO_HISTORICO_EXECUCOES), encoding='utf-8') as arquivo:
+            return [json.loads(linha) for linha in arquivo if linha.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def imprimir_comparacao(resumo, anteriores):
+    """Compara cada etapa com a mediana das últimas execuções bem-sucedidas e aponta as mais lentas."""
+    anteriores = [e for e in anteriores if e.get('sucesso')][-EXECUCOES_COMPARADAS:]
+    if not anteriores:
+        return
+    print(f"\nComparação com as últimas {len(anteriores)} execuções (mediana):")
+    for nome, atual in resumo['etapas'].items():
+        tempos = [e['etapas'][nome]['segundos'] for e in anteriores if nome in e['etapas']]
+        if not tempos:
+            continue
+        mediana = statistics.median(tempos)
+        alerta = "  ⚠ mais lenta" if mediana and atual['segundos'] > FATOR_REGRESSAO * mediana else ""
+        print(f"  {nome:<18} {atual['segundos']:8.1f}s  mediana {mediana:8.1f}s{alerta}")
@@ -0,0 +1,187 @@
+"""
+Manifesto da execução e retomada do processo a partir da primeira etapa que
+falta.
+
+Cada etapa concluída fica registrada em manifesto_execucao.json com os
+parâmetros da execução (janela da ZPMMT, formatos) e a assinatura (hash,
+tamanho e data de modificação) dos arquivos que ela leu e gravou. Ao retomar,
+uma etapa é pulada só se continua válida: registrada com os mesmos parâmetros,
+com as saídas intactas e com as entradas iguais às que ela leu. As etapas
+inválidas e todas as que dependem delas rodam de novo.
+
+  python SAP.py --retomar                   pula as etapas válidas da última execução
+  python SAP.py --a-partir-de J_1BNFDOC     refaz a etapa e as que dependem dela
+  python SAP.py --somente MARA EBAN         refaz só as etapas indicadas
+"""
+import json
+import os
+import threading
+from datetime import datetime
+
+from configuracao import PASTA_ONTIME, ARQUIVO_MANIFESTO
+from agendador import montar_dependencias
+from cache_colunar import calcular_hash
+from conciliacao_nf import ARQUIVO_ENTREGAS, caminho_entregas
+from historico_zpmmt import ARQUIVO_HISTORICO, caminho_historico
+
+
+def caminho_arquivo(nome, pasta=None):
+    """Caminho de um arquivo de etapa: o histórico da ZPMMT e o índice de entregas ficam nas pastas próprias."""
+    if nome == ARQUIVO_HISTORICO:
+        return caminho_historico()
+    if nome == ARQUIVO_ENTREGAS:
+        return caminho_entregas()
+    return os.path.join(pasta or PASTA_ONTIME, nome)
+
+
+class ManifestoExecucao:
+    """
+    Etapas concluídas de uma execução: {nome: {'concluida_em', 'parametros',
+    'entradas': {arquivo: assinatura}, 'saidas': {arquivo: assinatura}}}.
+    Gravado de forma atômica a cada etapa concluída, para sobreviver a uma
+    falha no meio da execução.
+    """
+
+    def __init__(self, parametros, etapas=None, caminho=None, pasta_arquivos=None, inicio=None):
+        self.parametros = parametros
+        self.etapas = dict(etapas or {})
+        self.caminho = caminho or ARQUIVO_MANIFESTO
+        self.pasta_arquivos = pasta_arquivos or PASTA_ONTIME
+        self.inicio = inicio or datetime.now().isoformat(timespec='seconds')
+        self._lock = threading.Lock()
+
+    @classmethod
+    def carregar(cls, parametros=None, caminho=None, pasta_arquivos=None):
+        """
+        Manifesto gravado pela última execução, ou None se não existe. Com
+        `parametros`, eles substituem os gravados (as etapas registradas com
+        outros parâmetros deixam de valer).
+        """
+        caminho = caminho or ARQUIVO_MANIFESTO
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                dados = json.load(arquivo)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return cls(parametros if parametros is not None else dados.get('parametros', {}),
+                   dados.get('etapas', {}), caminho, pasta_arquivos, dados.get('inicio'))
+
+    def gravar(self):
+        os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+        with self._lock:
+            dados = {'inicio': self.inicio, 'parametros': self.parametros, 'etapas': self.etapas}
+            with open(self.caminho + '.tmp', 'w', encoding='utf-8') as arquivo:
+                json.dump(dados, arquivo, indent=1, ensure_ascii=False)
+            os.replace(self.caminho + '.tmp', self.caminho)
+
+    def assinatura(self, nome, conhecida=None):
+        """
+        {hash, tamanho, mtime} do arquivo, ou None se ele não existe. Se o
+        tamanho e a data de modificação são os da assinatura `conhecida`, o
+        hash não é recalculado.
+        """
+        caminho = caminho_arquivo(nome, self.pasta_arquivos)
+        try:
+            estado = os.stat(caminho)
+        except OSError:
+            return None
+        if conhecida and conhecida['tamanho'] == estado.st_size and conhecida['mtime'] == estado.st_mtime_ns:
+            return conhecida
+        return {'hash': calcular_hash(caminho), 'tamanho': estado.st_size, 'mtime': estado.st_mtime_ns}
+
+    def iniciar(self, etapa):
+        """Descarta o registro anterior da etapa: uma etapa interrompida não vale na retomada."""
+        with self._lock:
+            removido = self.etapas.pop(etapa.nome, None)
+        if removido is not None:
+            self.gravar()
+
+    def concluir(self, etapa):
+        """Registra a etapa com a assinatura dos arquivos que ela leu e gravou."""
+        registro = {
+            'concluida_em': datetime.now().isoformat(timespec='seconds'),
+            'parametros': self.parametros,
+            'entradas': {nome: self.assinatura(nome) for nome in etapa.entradas},
+            'saidas': {nome: self.assinatura(nome) for nome in etapa.saidas},
+        }
+        with self._lock:
+            self.etapas[etapa.nome] = registro
+        self.gravar()
+
+    def motivo_invalida(self, etapa):
+        """Por que a etapa precisa rodar de novo, ou None se o registro dela continua válido."""
+        registro = self.etapas.get(etapa.nome)
+        if registro is None:
+            return "não concluída"
+        if registro['parametros'] != self.parametros:
+            return "parâmetros diferentes"
+        for nome in etapa.saidas:
+            # Uma saída que a etapa não gerou (ex.: conciliação sem relatórios) continua válida ausente
+            gravada = registro['saidas'].get(nome)
+            atual = self.assinatura(nome, gravada)
+            if atual is None and gravada is not None:
+                return f"{nome} não existe"
+            if (atual and atual['hash']) != (gravada and gravada['hash']):
+                return f"{nome} foi alterado"
+        for nome in etapa.entradas:
+            lida = registro['entradas'].get(nome)
+            atual = self.assinatura(nome, lida)
+            if (atual and atual['hash']) != (lida and lida['hash']):
+                return f"entrada {nome} mudou"
+        return None
+
+
+def dependentes(etapas, nomes):
+    """`nomes` e todas as etapas que dependem deles, direta ou indiretamente."""
+    dependencias = montar_dependencias(etapas)
+    resultado = set(nomes)
+    mudou = True
+    while mudou:
+        novos = {nome for nome, deps in dependencias.items() if deps & resultado} - resultado
+        resultado |= novos
+        mudou = bool(novos)
+    return resultado
+
+
+def selecionar_etapas(etapas, manifesto, retomar=False, a_partir_de=None, somente=None):
+    """
+    Etapas que esta execução roda, na ordem da lista, e as que ela pula:
+    (a_executar, {etapa: motivo de rodar}, {etapa pulada: motivo}).
+
+    retomar      roda as etapas inválidas no manifesto e as que dependem delas
+    a_partir_de  roda as etapas indicadas e as que dependem delas; as demais,
+                 só se estiverem inválidas
+    somente      roda só as etapas indicadas; as demais ficam como estão
+    Sem nenhuma opção, roda todas.
+    """
+    nomes = [etapa.nome for etapa in etapas]
+    desconhecidas = sorted((set(a_partir_de or []) | set(somente or [])) - set(nomes))
+    if desconhecidas:
+        raise ValueError(f"Etapa(s) desconhecida(s): {', '.join(desconhecidas)} "
+                         f"(etapas: {', '.join(sorted(nomes))})")
+
+    if somente:
+        motivos = {nome: "--somente" for nome in somente}
+        puladas = {nome: "fora de --somente" for nome in nomes if nome not in motivos}
+    elif retomar or a_partir_de:
+        motivos = {nome: "--a-partir-de" for nome in a_partir_de or []}
+        for etapa in etapas:
+            if etapa.nome not in motivos:
+                motivo = manifesto.motivo_invalida(etapa)
+                if motivo is not None:
+                    motivos[etapa.nome] = motivo
+        for nome in sorted(dependentes(etapas, motivos) - set(motivos)):
+            motivos[nome] = "depende de uma etapa refeita"
+        puladas = {nome: "válida no manifesto" for nome in nomes if nome not in motivos}
+    else:
+        return list(etapas), {nome: "execução completa" for nome in nomes}, {}
+
+    # As entradas que as etapas puladas geram precisam existir
+    a_executar = [etapa for etapa in etapas if etapa.nome in motivos]
+    geradas = {saida: etapa.nome for etapa in etapas if etapa.nome in puladas for saida in etapa.saidas}
+    for etapa in a_executar:
+        for entrada in etapa.entradas:
+            if entrada in geradas and not os.path.exists(caminho_arquivo(entrada, manifesto.pasta_arquivos)):
+                raise ValueError(f"A etapa {etapa.nome} lê {entrada}, que não existe: "
+                                 f"rode também a etapa {geradas[entrada]}.")
+    return a_executar, motivos, puladas
@@ -0,0 +1,58 @@
+import time
+
+import configuracao
+
+
+def aguardar(condicao, timeout=None, descricao="condição", intervalo=None):
+    """
+    Executa `condicao()` repetidamente até ela retornar um valor diferente de
+    None/False e devolve esse valor. Gera TimeoutError se o tempo se esgotar.
+    """
+    if timeout is None:
+        timeout = configuracao.TIMEOUT_PADRAO
+    if intervalo is None:
+        intervalo = configuracao.INTERVALO_VERIFICACAO
+
+    limite = time.monotonic() + timeout
+    while True:
+        resultado = condicao()
+        if resultado is not None and resultado is not False:
+            return resultado
+        if time.monotonic() >= limite:
+            raise TimeoutError(f"Tempo esgotado ({timeout:.0f}s) aguardando {descricao}.")
+        time.sleep(intervalo)
+
+
+def aguardar_sessao(session, timeout=None):
+    """Aguarda a sessão SAP sair do estado ocupado (session.Busy)."""
+    aguardar(lambda: not session.Busy, timeout, "a sessão SAP ficar livre")
+
+
+def aguardar_elemento(session, id_elemento, timeout=None):
+    """
+    Aguarda a sessão ficar livre e o elemento (campo, botão ou janela) existir.
+    Retorna o elemento encontrado, pronto para uso.
+    """
+    def tentar():
+        if session.Busy:
+            return None
+        # O segundo parâmetro False faz o findById retornar None em vez de gerar erro
+        return session.findById(id_elemento, False)
+
+    return aguardar(tentar, timeout, f"o elemento '{id_elemento}'")
+
+
+def preencher(session, campos, timeout=None):
+    """
+    Preenche vários campos da mesma tela ({id: texto}). Só o primeiro espera a
+    sessão: preencher um campo não vai ao servidor, então os demais já estão na
+    tela e são preenchidos sem consultar session.Busy de novo.
+    """
+    for numero, (id_elemento, valor) in enumerate(campos.items()):
+        elemento = aguardar_elemento(session, id_elemento, timeout) if numero == 0 else session.findById(id_elemento)
+        elemento.text = valor
+
+
+def aguardar_janela(session, indice, timeout=None):
+    """Aguarda a janela wnd[indice] (ex.: diálogo wnd[1] ou wnd[2]) ser aberta."""
+    return aguardar_elemento(session, f"wnd[{indice}]", timeout)
@@ -0,0 +1,729 @@
+"""
+SAP GUI falso para medir o processo fora do Windows.
+
+Imita o pedaço do scripting engine que o processo usa (OpenConnection,
+Children, findById, press, sendVKey, Busy, Info, o login, a SE16N, a
+ZPMMT_287 e os diálogos de exportação &XXL / &PC), respondendo as consultas a partir de
+tabelas sintéticas com as mesmas colunas e relações de chave das reais.
+O ServidorRfcFalso responde às mesmas tabelas pela RFC_READ_TABLE e pela
+DDIF_FIELDINFO_GET, para o backend RFC (sap_rfc.py).
+"""
+import itertools
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from leitor_sap import gravar_exportacao
+from sap_se16n import TABELAS
+
+# Campo da tela de seleção -> coluna da tabela sintética que ele filtra
+CAMPOS = {
+    'EBAN': {'BANFN': 'Requisição de compras'},
+    'EKET': {'BANFN': 'Requisição de compras'},
+    'LIPS': {'VGBEL': 'Documento de referência'},
+    'VBFA': {'VBELV': 'Doc.SD precedente', 'BWART': 'Tipo de movimento'},
+    'J_1BNFLIN': {'REFKEY': 'Referência'},
+    'J_1BNFDOC': {'DOCNUM': 'Nº documento'},
+    'MARA': {'MATNR': 'Material'},
+    'ZPMMT': {'CENT1': 'Centro', 'CENT2': 'Centro'},
+}
+CENTROS = ['1001', '1002', '1003', '2001', '2002']
+
+# Dicionário das tabelas para o backend RFC: campo -> (tipo ABAP, tamanho, decimais, conversão)
+DICIONARIO = {
+    'EBAN': {'BANFN': ('C', 10, 0, 'ALPHA'), 'BNFPO': ('N', 5, 0, ''), 'MATNR': ('C', 40, 0, 'MATN1'),
+             'EBELN': ('C', 10, 0, 'ALPHA'), 'EBELP': ('N', 5, 0, '')},
+    'EKET': {'BANFN': ('C', 10, 0, 'ALPHA'), 'BNFPO': ('N', 5, 0, ''), 'EBELN': ('C', 10, 0, 'ALPHA'),
+             'EBELP': ('N', 5, 0, ''), 'EINDT': ('D', 8, 0, '')},
+    'LIPS': {'VGBEL': ('C', 10, 0, 'ALPHA'), 'VGPOS': ('N', 6, 0, ''), 'VBELN': ('C', 10, 0, 'ALPHA'),
+             'MATNR': ('C', 40, 0, 'MATN1'), 'LFIMG': ('P', 13, 3, '')},
+    'VBFA': {'VBELV': ('C', 10, 0, 'ALPHA'), 'VBELN': ('C', 10, 0, 'ALPHA'), 'MJAHR': ('N', 4, 0, ''),
+             'BWART': ('C', 3, 0, ''), 'RFMNG': ('P', 15, 3, ''), 'ERDAT': ('D', 8, 0, '')},
+    'J_1BNFLIN': {'REFKEY': ('C', 35, 0, ''), 'DOCNUM': ('N', 10, 0, ''), 'ITMNUM': ('N', 6, 0, ''),
+                  'MATNR': ('C', 40, 0, 'MATN1'), 'NETWR': ('P', 15, 2, '')},
+    'J_1BNFDOC': {'DOCNUM': ('N', 10, 0, ''), 'NFENUM': ('C', 9, 0, 'ALPHA'), 'SERIES': ('C', 3, 0, ''),
+                  'DOCDAT': ('D', 8, 0, ''), 'CGC': ('C', 16, 0, '')},
+    'MARA': {'MATNR': ('C', 40, 0, 'MATN1'), 'MATKL': ('C', 9, 0, '')},
+    'MAKT': {'MATNR': ('C', 40, 0, 'MATN1'), 'SPRAS': ('C', 1, 0, ''), 'MAKTX': ('C', 40, 0, '')},
+}
+# Campos-chave (KEYFLAG) por tabela, sem o mandante. Só onde as tabelas sintéticas têm a chave
+# completa; LIPS, VBFA e J_1BNFLIN não trazem o item e ficam sem chave.
+CHAVES_DICIONARIO = {'EBAN': ['BANFN', 'BNFPO'], 'EKET': ['BANFN', 'BNFPO'], 'J_1BNFDOC': ['DOCNUM'],
+                     'MARA': ['MATNR'], 'MAKT': ['MATNR', 'SPRAS']}
+RE_TOKEN_WHERE = re.compile(r"'(?:[^']|'')*'|[(),=]|[^\s(),=']+")
+
+RE_JANELA = re.compile(r'^wnd\[(\d+)\]')
+# Handles das janelas principais das sessões falsas
+HANDLES_JANELAS = itertools.count(0x10000)
+PREFIXO_VALOR_MULTIPLO = "wnd[1]/usr/tblSAPLSE16NMULTI_TC/ctxtGS_MULTI_SELECT-LOW["
+ID_OKCODE = "wnd[0]/tbar[0]/okcd"
+ID_USUARIO = "wnd[0]/usr/txtRSYST-BNAME"
+ID_GRADE = "wnd[0]/shellcont/shell"
+ID_CODIFICACAO = "wnd[1]/usr/ctxtDY_FILE_ENCODING"
+
+
+def gerar_tabelas(linhas, semente=42):
+    """
+    Gera as tabelas sintéticas a partir de `linhas` itens da ZPMMT_287:
+    requisições (2 itens cada) -> pedidos -> remessas -> movimentos (VBFA)
+    -> notas fiscais (J_1BNFLIN / J_1BNFDOC), e os materiais da MARA.
+    Retorna {nome: DataFrame}.
+    """
+    rng = np.random.default_rng(semente)
+    hoje = pd.Timestamp(datetime.now().date())
+    inicio = pd.Timestamp('2026-01-01')
+    dias = max(1, (hoje - inicio).days + 1)
+
+    requisicoes = 10_000_000 + np.arange(linhas) // 2
+    materiais = 400_000 + rng.integers(0, max(1, linhas // 10), linhas)
+    zpmmt = pd.DataFrame({
+        'Requisição de Compras': requisicoes,
+        'Item': (np.arange(linhas) % 2 + 1) * 10,
+        'Material': materiais,
+        'Centro': rng.choice(CENTROS, linhas),
+        'Data': inicio + pd.to_timedelta(rng.integers(0, dias, linhas), unit='D'),
+        'Quantidade': np.round(rng.uniform(1, 500, linhas), 3),
+    })
+
+    # 80% dos itens viram pedido; cada pedido atende ~2 requisições
+    com_pedido = rng.random(linhas) < 0.8
+    pedidos = np.where(com_pedido, 4_500_000_000 + requisicoes // 2, np.nan)
+    # Os itens das duas requisições do pedido são os itens 10 a 40 dele
+    itens_pedido = np.where(com_pedido, (np.arange(linhas) % 4 + 1) * 10, np.nan)
+    eban = pd.DataFrame({
+        'Requisição de compras': requisicoes,
+        'Item': zpmmt['Item'],
+        'Material': materiais,
+        'Pedido': pd.array(pedidos, dtype='Int64'),
+        'Item do pedido': pd.array(itens_pedido, dtype='Int64'),
+    })
+    eket = pd.DataFrame({
+        'Requisição de compras': requisicoes[com_pedido],
+        'Item': zpmmt['Item'][com_pedido].to_numpy(),
+        'Documento de compras': pedidos[com_pedido].astype(np.int64),
+        'Item do pedido': itens_pedido[com_pedido].astype(np.int64),
+        'Data de remessa': zpmmt['Data'][com_pedido].to_numpy() + pd.Timedelta(days=15),
+    })
+
+    # Uma remessa por pedido com os itens já entregues (~85%): os outros itens
+    # do pedido ficam em aberto (entrega parcial)
+    entregue = com_pedido & (rng.random(linhas) < 0.85)
+    pedidos_unicos, remessa_do_pedido = np.unique(pedidos[entregue].astype(np.int64), return_inverse=True)
+    lips = pd.DataFrame({
+        'Documento de referência': pedidos[entregue].astype(np.int64),
+        'Item de referência': itens_pedido[entregue].astype(np.int64),
+        'Remessa': 80_000_000 + remessa_do_pedido,
+        'Material': materiais[entregue],
+        'Quantidade': np.round(rng.uniform(1, 500, int(entregue.sum())), 3),
+    })
+
+    # Cada remessa gera 1 ou 2 movimentos de mercadoria
+    remessas_unicas = 80_000_000 + np.arange(len(pedidos_unicos))
+    remessas = np.repeat(remessas_unicas, rng.integers(1, 3, len(remessas_unicas)))
+    vbfa = pd.DataFrame({
+        'Doc.SD precedente': remessas,
+        'Doc.subsequente': 5_000_000_000 + np.arange(len(remessas)),
+        'Ano doc.material': rng.choice([2025, 2026], len(remessas), p=[0.1, 0.9]),
+        'Tipo de movimento': rng.choice([101, 862, 861], len(remessas), p=[0.6, 0.3, 0.1]),
+        'Quantidade': np.round(rng.uniform(1, 500, len(remessas)), 3),
+        'Criado em': inicio + pd.to_timedelta(rng.integers(0, dias, len(remessas)), unit='D'),
+    })
+
+    # Notas fiscais dos movimentos 101/862 (uma nota para cada 3 movimentos)
+    movimentos = vbfa[vbfa['Tipo de movimento'].isin([101, 862])]
+    referencias = movimentos['Doc.subsequente'].astype(str) + movimentos['Ano doc.material'].astype(str)
+    documentos = 1_000_000 + np.arange(len(movimentos)) // 3
+    j1bnflin = pd.DataFrame({
+        'Referência': referencias.to_numpy(),
+        'Nº documento': documentos,
+        'Item': 10,
+        'Material': rng.choice(materiais, len(movimentos)),
+        'Valor': np.round(rng.uniform(10, 100_000, len(movimentos)), 2),
+    })
+    documentos_unicos = np.unique(documentos)
+    j1bnfdoc = pd.DataFrame({
+        'Nº documento': documentos_unicos,
+        'Nº NF-e': 100_000 + np.arange(len(documentos_unicos)),
+        'Série': '1',
+        'Data do documento': inicio + pd.to_timedelta(rng.integers(0, dias, len(documentos_unicos)), unit='D'),
+        'CNPJ emissor': rng.choice(['61064838000180', '61064838008530', '61064838012406'], len(documentos_unicos)),
+    })
+
+    materiais_unicos = np.unique(materiais)
+    mara = pd.DataFrame({
+        'Material': materiais_unicos,
+        'Descrição': 'MATERIAL ' + pd.Series(materiais_unicos).astype(str),
+        'Grupo de mercadorias': rng.choice(['M001', 'M002', 'M003'], len(materiais_unicos)),
+    })
+
+    return {'ZPMMT': zpmmt, 'EBAN': eban, 'EKET': eket, 'LIPS': lips, 'VBFA': vbfa,
+            'J_1BNFLIN': j1bnflin, 'J_1BNFDOC': j1bnfdoc, 'MARA': mara}
+
+
+def gravar_codigos_bases(pasta):
+    """Arquivo CODIGO BASES.txt com os centros das tabelas sintéticas."""
+    with open(os.path.join(pasta, 'CODIGO BASES.txt'), 'w', encoding='utf-8') as arquivo:
+        arquivo.write('\n'.join(CENTROS) + '\n')
+
+
+@dataclass
+class LatenciaFalsa:
+    """Tempos simulados do SAP, em segundos."""
+    # Ida e volta de cada chamada COM (findById, press, ...)
+    chamada: float = 0.001
+    # Consulta: tempo fixo + tempo por linha retornada (a sessão fica Busy)
+    consulta: float = 0.05
+    consulta_por_linha: float = 1e-6
+    # Exportação: tempo fixo, além do tempo real de gravar o arquivo
+    exportacao: float = 0.05
+    # Gravação em segundo plano: o arquivo vai aparecendo aos poucos depois que a sessão fica livre,
+    # como no SAP GUI (0 grava o arquivo inteiro antes de liberar a sessão)
+    escrita: float = 0.0
+    # Abrir uma conexão nova (tela de login do SAP Logon)
+    conexao: float = 0.0
+
+
+class BaseFalsa:
+    """Tabelas sintéticas com as colunas de filtro já preparadas para consulta."""
+
+    def __init__(self, tabelas):
+        self.tabelas = tabelas
+        self._colunas = {}
+        self._lock = threading.Lock()
+
+    def coluna(self, tabela, coluna):
+        """(texto normalizado, valor numérico) da coluna, calculados uma vez."""
+        with self._lock:
+            chave = (tabela, coluna)
+            if chave not in self._colunas:
+                serie = self.tabelas[tabela][coluna]
+                numerico = pd.to_numeric(serie, errors='coerce').to_numpy(dtype=float)
+                texto = normalizar(serie.astype(str))
+                self._colunas[chave] = (texto, numerico)
+            return self._colunas[chave]
+
+    def consultar(self, tabela, selecoes):
+        """Linhas da tabela que atendem a todas as seleções {campo: [(de, ate), ...]}."""
+        df = self.tabelas[tabela]
+        mascara = np.ones(len(df), dtype=bool)
+        for campo, entradas in selecoes.items():
+            coluna = CAMPOS.get(tabela, {}).get(campo)
+            if coluna is None or not entradas:
+                continue
+            texto, numerico = self.coluna(tabela, coluna)
+            avulsas = [de for de, ate in entradas if not ate]
+            intervalos = sorted((int(de), int(ate)) for de, ate in entradas if ate)
+            filtro = texto.isin(normalizar(pd.Series(avulsas, dtype=str))).to_numpy()
+            if intervalos:
+                inicios = np.array([i for i, _ in intervalos], dtype=float)
+                fins = np.array([f for _, f in intervalos], dtype=float)
+                posicao = np.searchsorted(inicios, numerico, side='right') - 1
+                dentro = (posicao >= 0) & (numerico <= fins[np.clip(posicao, 0, None)])
+                filtro |= np.nan_to_num(dentro, nan=False).astype(bool)
+            mascara &= filtro
+        return df[mascara]
+
+
+def normalizar(serie):
+    """Texto sem espaços, sem '.0' e sem zeros à esquerda (como a conversão ALPHA)."""
+    texto = serie.str.strip().str.replace(r'\.0$', '', regex=True)
+    return texto.where(~texto.str.fullmatch(r'\d+'), texto.str.lstrip('0').replace('', '0'))
+
+
+def ler_upload(caminho):
+    """Entradas (de, ate) de um arquivo enviado à seleção múltipla."""
+    entradas = []
+    with open(caminho, encoding='utf-8', errors='ignore') as arquivo:
+        for linha in arquivo:
+            partes = linha.rstrip('\r\n').split('\t')
+            if partes[0].strip():
+                entradas.append((partes[0].strip(), partes[1].strip() if len(partes) > 1 else None))
+    return entradas
+
+
+class ObjetoComFalso:
+    """
+    Marca os objetos falsos como objetos COM, para que o rastreamento
+    (rastreamento.ObjetoContado) conte as chamadas feitas a eles.
+    """
+    _oleobj_ = None
+
+
+class ColecaoFalsa(list, ObjetoComFalso):
+    """Coleção COM: colecao(i) devolve o item e colecao.Count a quantidade."""
+
+    def __call__(self, indice):
+        return self[indice]
+
+    @property
+    def Count(self):
+        return len(self)
+
+
+class ElementoFalso(ObjetoComFalso):
+    """Campo, botão, janela ou grade da sessão falsa; as ações são tratadas pela sessão."""
+
+    def __init__(self, sessao, id_elemento):
+        object.__setattr__(self, '_sessao', sessao)
+        object.__setattr__(self, 'Id', id_elemento)
+
+    def __getattr__(self, nome):
+        if nome.lower() == 'text':
+            return self._sessao.campos.get(self.Id, '')
+        if nome == 'RowCount':
+            return len(self._sessao.resultado)
+        if nome == 'Handle' and self.Id == 'wnd[0]':
+            return self._sessao.handle
+        raise AttributeError(nome)
+
+    def __setattr__(self, nome, valor):
+        self._sessao.latencia_chamada()
+        if nome.lower() == 'text':
+            self._sessao.campos[self.Id] = str(valor)
+        # CaretPosition e outras propriedades visuais são ignoradas
+
+    def press(self):
+        self._sessao.pressionar(self.Id)
+
+    def select(self):
+        self._sessao.latencia_chamada()
+
+    def sendVKey(self, tecla):
+        self._sessao.tecla(tecla)
+
+    def pressToolbarContextButton(self, botao):
+        self._sessao.latencia_chamada()
+
+    def selectContextMenuItem(self, item):
+        self._sessao.menu_exportacao(item)
+
+    def maximize(self):
+        self._sessao.latencia_chamada()
+
+    Maximize = maximize
+
+    def SetFocus(self):
+        self._sessao.latencia_chamada()
+
+    def close(self):
+        self._sessao.latencia_chamada()
+
+
+class SessaoFalsa(ObjetoComFalso):
+    """Uma sessão do SAP GUI: estado da transação, diálogos abertos e resultado da consulta."""
+
+    def __init__(self, conexao, indice):
+        self.conexao = conexao
+        self.base = conexao.motor.base
+        self.latencia = conexao.motor.latencia
+        self.Id = f"{conexao.Id}/ses[{indice}]"
+        # Handle da janela principal (wnd[0].Handle), diferente para cada sessão aberta
+        self.handle = next(HANDLES_JANELAS)
+        self.campos = {}
+        self.transacao = None
+        self.tabela = None
+        # Pilha de diálogos abertos (wnd[1], wnd[2], ...)
+        self.dialogos = []
+        self.campo_atual = None
+        self.selecoes = {}
+        self.entradas_pendentes = []
+        self.resultado = None
+        self._ocupada_ate = 0.0
+        self.chamadas = 0
+
+    # --- Propriedades e métodos do scripting ---
+
+    @property
+    def Busy(self):
+        # Ler uma propriedade também é uma ida e volta COM
+        self.latencia_chamada()
+        return time.monotonic() < self._ocupada_ate
+
+    @property
+    def Info(self):
+        self.latencia_chamada()
+        return InfoSessaoFalsa(self)
+
+    def findById(self, id_elemento, gerar_erro=True):
+        self.latencia_chamada()
+        if self.existe(id_elemento):
+            return ElementoFalso(self, id_elemento)
+        if gerar_erro:
+            raise RuntimeError(f"The control could not be found by id: {id_elemento}")
+        return None
+
+    FindById = findById
+
+    def createSession(self):
+        self.latencia_chamada()
+        self.conexao.nova_sessao()
+
+    # --- Simulação ---
+
+    def latencia_chamada(self):
+        self.chamadas += 1
+        if self.latencia.chamada:
+            time.sleep(self.latencia.chamada)
+
+    def ocupar(self, segundos):
+        self._ocupada_ate = time.monotonic() + segundos
+
+    def existe(self, id_elemento):
+        if id_elemento == ID_GRADE:
+            return self.resultado is not None and not self.dialogos
+        if id_elemento == ID_CODIFICACAO:
+            return bool(self.dialogos) and self.dialogos[-1] == 'arquivo_pc'
+        encontrado = RE_JANELA.match(id_elemento)
+        return encontrado is None or int(encontrado.group(1)) <= len(self.dialogos)
+
+    def tecla(self, tecla):
+        self.latencia_chamada()
+        if tecla == 71:
+            self.dialogos.append('busca_campo')
+        elif tecla == 0 and self.conexao.usuario is None and self.campos.get(ID_USUARIO):
+            # Login: a conexão passa a ser do usuário e a sessão vai para o menu
+            self.conexao.usuario = self.campos.pop(ID_USUARIO).strip().upper()
+            self.transacao = ''
+        elif tecla == 0 and self.campos.get(ID_OKCODE):
+            self.iniciar_transacao(self.campos.pop(ID_OKCODE))
+
+    def iniciar_transacao(self, codigo):
+        self.transacao = re.sub(r'^/N', '', codigo.strip().upper())
+        self.tabela = 'ZPMMT' if self.transacao == 'ZPMMT_287' else None
+        self.campos = {}
+        self.dialogos = []
+        self.selecoes = {}
+        self.resultado = None
+
+    def pressionar(self, id_elemento):
+        self.latencia_chamada()
+        topo = self.dialogos[-1] if self.dialogos else None
+        botao = id_elemento.rsplit('/', 1)[-1]
+        if id_elemento.startswith("wnd[0]/usr/subTAB_SUB") and id_elemento.endswith("btnPUSH[4,0]"):
+            self.abrir_selecao(self.campo_atual)
+        elif id_elemento.startswith("wnd[0]/usr/btn%_S_CENT"):
+            self.abrir_selecao(id_elemento[len("wnd[0]/usr/btn%_S_"):].split('_')[0])
+        elif id_elemento == "wnd[0]/tbar[1]/btn[8]":
+            self.executar()
+        elif topo == 'busca_campo' and botao == 'btn[0]':
+            self.campo_atual = self.campos.get("wnd[1]/usr/sub:SAPLSPO4:0300/txtSVALD-VALUE[0,21]", '').strip()
+            self.dialogos.pop()
+        elif topo == 'selecao_multipla' and botao in ('btn[21]', 'btn[23]'):
+            self.dialogos.append('upload')
+        elif topo == 'upload' and botao == 'btn[0]':
+            caminho = os.path.join(self.campos.get("wnd[2]/usr/ctxtDY_PATH", ''),
+                                   self.campos.get("wnd[2]/usr/ctxtDY_FILENAME", ''))
+            self.entradas_pendentes += ler_upload(caminho)
+            self.dialogos.pop()
+        elif topo == 'selecao_multipla' and botao == 'btn[8]':
+            digitados = sorted((id_campo, valor) for id_campo, valor in self.campos.items()
+                               if id_campo.startswith(PREFIXO_VALOR_MULTIPLO))
+            self.entradas_pendentes += [(valor, None) for _, valor in digitados if valor]
+            for id_campo, _ in digitados:
+                del self.campos[id_campo]
+            self.selecoes[self.campo_atual] = self.entradas_pendentes
+            self.dialogos.pop()
+        elif topo == 'exportar_xxl' and botao == 'btn[20]':
+            self.dialogos[-1] = 'arquivo_xxl'
+        elif topo == 'formato_pc' and botao == 'btn[0]':
+            self.dialogos[-1] = 'arquivo_pc'
+        elif topo in ('arquivo_xxl', 'arquivo_pc') and botao == 'btn[11]':
+            self.gravar_exportacao(topo)
+
+    def abrir_selecao(self, campo):
+        self.campo_atual = campo
+        self.entradas_pendentes = []
+        self.dialogos.append('selecao_multipla')
+
+    def executar(self):
+        if self.tabela is None:
+            self.tabela = self.campos.get("wnd[0]/usr/ctxtGD-TAB", '').strip().upper()
+        resultado = self.base.consultar(self.tabela, self.selecoes)
+        if self.tabela == 'ZPMMT':
+            de = pd.to_datetime(self.campos.get("wnd[0]/usr/ctxtS_DATA-LOW"), format='%d.%m.%Y')
+            ate = pd.to_datetime(self.campos.get("wnd[0]/usr/ctxtS_DATA-HIGH"), format='%d.%m.%Y')
+            resultado = resultado[resultado['Data'].between(de, ate)]
+        self.resultado = resultado
+        self.ocupar(self.latencia.consulta + self.latencia.consulta_por_linha * len(resultado))
+
+    def menu_exportacao(self, item):
+        self.latencia_chamada()
+        self.dialogos.append('exportar_xxl' if item == '&XXL' else 'formato_pc')
+
+    def gravar_exportacao(self, dialogo):
+        pasta = self.campos.get("wnd[1]/usr/ctxtDY_PATH", '')
+        if dialogo == 'arquivo_xxl':
+            nome = self.campos.get(
+                "wnd[1]/usr/ssubSUB_CONFIGURATION:SAPLSALV_GUI_CUL_EXPORT_AS:0512/txtGS_EXPORT-FILE_NAME", '')
+            caminho = os.path.join(pasta, nome + '.xlsx')
+        else:
+            caminho = os.path.join(pasta, self.campos.get("wnd[1]/usr/ctxtDY_FILENAME", ''))
+        if self.latencia.escrita:
+            temporario = os.path.join(pasta, '~' + os.path.basename(caminho))
+            gravar_exportacao(self.resultado, temporario)
+            threading.Thread(target=self.gravar_aos_poucos, args=(temporario, caminho), daemon=True).start()
+        else:
+            gravar_exportacao(self.resultado, caminho)
+            self.conexao.motor.gravacoes[caminho] = time.monotonic()
+        self.dialogos.pop()
+        self.ocupar(self.latencia.exportacao)
+
+    def gravar_aos_poucos(self, temporario, caminho, partes=10):
+        with open(temporario, 'rb') as arquivo:
+            conteudo = arquivo.read()
+        os.remove(temporario)
+        tamanho = -(-len(conteudo) // partes)
+        with open(caminho, 'wb') as arquivo:
+            for inicio in range(0, len(conteudo), tamanho):
+                time.sleep(self.latencia.escrita / partes)
+                arquivo.write(conteudo[inicio:inicio + tamanho])
+                arquivo.flush()
+        self.conexao.motor.gravacoes[caminho] = time.monotonic()
+
+
+class InfoSessaoFalsa(ObjetoComFalso):
+    """session.Info: sistema, mandante, usuário e transação da sessão."""
+
+    def __init__(self, sessao):
+        conexao = sessao.conexao
+        self.SystemName = conexao.motor.sistema
+        self.Client = conexao.motor.mandante
+        self.User = conexao.usuario or ''
+        # Sem login a sessão está na tela de logon (S000); depois, no menu ou na transação
+        self.Transaction = 'S000' if conexao.usuario is None else (sessao.transacao or 'SESSION_MANAGER')
+
+
+class ConexaoFalsa(ObjetoComFalso):
+    def __init__(self, motor, indice):
+        self.motor = motor
+        self.Id = f"/app/con[{indice}]"
+        self.Children = ColecaoFalsa()
+        # Usuário logado (None até o login); as sessões novas herdam o login
+        self.usuario = None
+        if motor.latencia.conexao:
+            time.sleep(motor.latencia.conexao)
+        self.nova_sessao()
+
+    @property
+    def Sessions(self):
+        return self.Children
+
+    def nova_sessao(self):
+        sessao = SessaoFalsa(self, len(self.Children))
+        if self.usuario is not None:
+            sessao.transacao = ''
+        self.Children.append(sessao)
+
+
+class MotorSapFalso(ObjetoComFalso):
+    """Scripting engine falso (o objeto devolvido por GetObject('SAPGUI').GetScriptingEngine)."""
+
+    def __init__(self, tabelas, latencia=None, sistema='PS4', mandante='100'):
+        self.base = BaseFalsa(tabelas)
+        self.latencia = latencia or LatenciaFalsa()
+        self.sistema = sistema
+        self.mandante = mandante
+        self.Children = ColecaoFalsa()
+        # Caminho exportado -> instante (time.monotonic) em que a gravação terminou
+        self.gravacoes = {}
+
+    @property
+    def Connections(self):
+        return self.Children
+
+    def OpenConnection(self, descricao, sincrono=True):
+        self.Children.append(ConexaoFalsa(self, len(self.Children)))
+        return self.Children[-1]
+
+    def findById(self, id_elemento):
+        for conexao in self.Children:
+            for sessao in conexao.Children:
+                if sessao.Id == id_elemento:
+                    return sessao
+        raise RuntimeError(f"The control could not be found by id: {id_elemento}")
+
+
+def largura_saida(tipo, tamanho, decimais):
+    """Largura do campo na linha da RFC_READ_TABLE (números com separadores e sinal)."""
+    if tipo == 'P':
+        return tamanho + tamanho // 3 + 2
+    return tamanho
+
+
+def texto_interno(serie, tipo, tamanho, decimais, conversao):
+    """
+    Valores como a RFC_READ_TABLE os devolve: chaves completadas com zeros
+    (NUMC, ALPHA, MATN1), datas AAAAMMDD e números com o WRITE do usuário
+    brasileiro ('1.234,567', '12,50-').
+    """
+    if tipo == 'D':
+        return pd.to_datetime(serie).dt.strftime('%Y%m%d').fillna('00000000')
+    if tipo == 'P':
+        valores = pd.to_numeric(serie, errors='coerce')
+        texto = valores.abs().map(lambda v: f"{v:,.{decimais}f}".translate(str.maketrans(',.', '.,')), na_action='ignore')
+        texto = texto.where(valores >= 0, texto + '-')
+        return texto.fillna('').astype(object)
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        texto = serie.astype('Int64').astype('string')
+    else:
+        texto = serie.astype('string').str.strip()
+    texto = texto.fillna('')
+    if tipo == 'N' or conversao in ('ALPHA', 'MATN1'):
+        completar = 18 if conversao == 'MATN1' else tamanho
+        texto = texto.where(~texto.str.isdigit(), texto.str.zfill(completar))
+    return texto.astype(object)
+
+
+class ServidorRfcFalso:
+    """
+    Servidor RFC falso sobre as tabelas sintéticas: guarda os valores já no
+    formato interno e avalia as cláusulas WHERE geradas pelo sap_rfc.py
+    (IN, =, BETWEEN, AND, OR e parênteses).
+    """
+
+    def __init__(self, tabelas, latencia=None):
+        self.tabelas = dict(tabelas)
+        mara = self.tabelas['MARA']
+        self.tabelas['MAKT'] = pd.DataFrame({'Material': mara['Material'], 'Idioma': 'P',
+                                             'Descrição': mara['Descrição']})
+        self.latencia = latencia or LatenciaFalsa()
+        self._internos = {}
+        self._lock = threading.Lock()
+        self.chamadas = 0
+
+    def conectar(self):
+        return ConexaoRfcFalsa(self)
+
+    def colunas(self, tabela):
+        """Campo do dicionário -> coluna da tabela sintética."""
+        if tabela == 'MAKT':
+            return {'MATNR': 'Material', 'SPRAS': 'Idioma', 'MAKTX': 'Descrição'}
+        return TABELAS[tabela].campos
+
+    def interno(self, tabela):
+        """Tabela com todos os campos no formato interno, calculada uma vez."""
+        with self._lock:
+            if tabela not in self._internos:
+                df = self.tabelas[tabela]
+                self._internos[tabela] = pd.DataFrame({
+                    campo: texto_interno(df[coluna], *DICIONARIO[tabela][campo])
+                    for campo, coluna in self.colunas(tabela).items()})
+            return self._internos[tabela]
+
+    def filtrar(self, tabela, opcoes):
+        """Máscara das linhas que atendem à cláusula WHERE (linhas de OPTIONS)."""
+        df = self.interno(tabela)
+        tokens = RE_TOKEN_WHERE.findall(' '.join(linha['TEXT'] for linha in opcoes))
+        if not tokens:
+            return np.ones(len(df), dtype=bool)
+        posicao = 0
+
+        def proximo():
+            nonlocal posicao
+            posicao += 1
+            return tokens[posicao - 1]
+
+        def valor(token):
+            return token[1:-1].replace("''", "'")
+
+        def expressao():
+            mascara = termo()
+            while posicao < len(tokens) and tokens[posicao].upper() == 'OR':
+                proximo()
+                mascara = mascara | termo()
+            return mascara
+
+        def termo():
+            mascara = fator()
+            while posicao < len(tokens) and tokens[posicao].upper() == 'AND':
+                proximo()
+                mascara = mascara & fator()
+            return mascara
+
+        def fator():
+            token = proximo()
+            if token == '(':
+                mascara = expressao()
+                proximo()
+                return mascara
+            coluna = df[token.upper()]
+            operador = proximo().upper()
+            if operador == '=':
+                return (coluna == valor(proximo())).to_numpy()
+            if operador == 'BETWEEN':
+                de = valor(proximo())
+                proximo()
+                ate = valor(proximo())
+                return ((coluna >= de) & (coluna <= ate)).to_numpy()
+            if operador == 'IN':
+                proximo()
+                valores = []
+                while (token := proximo()) != ')':
+                    if token != ',':
+                        valores.append(valor(token))
+                return coluna.isin(valores).to_numpy()
+            raise RuntimeError(f"Operador não suportado na cláusula WHERE falsa: {operador}")
+
+        return expressao()
+
+    def chamar(self, funcao, parametros):
+        with self._lock:
+            self.chamadas += 1
+        if funcao == 'DDIF_FIELDINFO_GET':
+            tabela = parametros['TABNAME']
+            chaves = CHAVES_DICIONARIO.get(tabela, [])
+            return {'DFIES_TAB': [{'FIELDNAME': campo, 'INTTYPE': tipo, 'LENG': f"{tamanho:06d}",
+                                   'DECIMALS': f"{decimais:06d}", 'CONVEXIT': conversao,
+                                   'KEYFLAG': 'X' if campo in chaves else ''}
+                                  for campo, (tipo, tamanho, decimais, conversao) in DICIONARIO[tabela].items()]}
+        if funcao != 'RFC_READ_TABLE':
+            raise RuntimeError(f"FU_NOT_FOUND: {funcao}")
+
+        tabela = parametros['QUERY_TABLE']
+        campos = [linha['FIELDNAME'] for linha in parametros.get('FIELDS') or []] or list(DICIONARIO[tabela])
+        descricao = []
+        deslocamento = 0
+        for campo in campos:
+            tipo, tamanho, decimais, _ = DICIONARIO[tabela][campo]
+            largura = largura_saida(tipo, tamanho, decimais)
+            descricao.append({'FIELDNAME': campo, 'OFFSET': f"{deslocamento:06d}", 'LENGTH': f"{largura:06d}",
+                              'TYPE': tipo, 'FIELDTEXT': ''})
+            deslocamento += largura
+        if deslocamento > 512:
+            raise RuntimeError("DATA_BUFFER_EXCEEDED")
+        if parametros.get('NO_DATA'):
+            return {'FIELDS': descricao, 'DATA': []}
+
+        selecionadas = self.interno(tabela)[self.filtrar(tabela, parametros.get('OPTIONS') or [])]
+        pular = int(parametros.get('ROWSKIPS') or 0)
+        quantidade = int(parametros.get('ROWCOUNT') or 0)
+        selecionadas = selecionadas.iloc[pular:pular + quantidade] if quantidade else selecionadas.iloc[pular:]
+        linhas = pd.Series('', index=selecionadas.index, dtype=object)
+        for campo, item in zip(campos, descricao):
+            largura = int(item['LENGTH'])
+            valores = selecionadas[campo]
+            linhas = linhas + (valores.str.rjust(largura) if item['TYPE'] == 'P' else valores.str.ljust(largura))
+        time.sleep(self.latencia.consulta + self.latencia.consulta_por_linha * len(linhas))
+        return {'FIELDS': descricao, 'DATA': [{'WA': wa} for wa in linhas.str.rstrip()]}
+
+
+class ConexaoRfcFalsa:
+    """Conexão com a mesma interface do pyrfc.Connection (call e close)."""
+
+    def __init__(self, servidor):
+        self.servidor = servidor
+        self.aberta = True
+
+    def call(self, funcao, **parametros):
+        if not self.aberta:
+            raise RuntimeError("Conexão RFC fechada")
+        return self.servidor.chamar(funcao, parametros)
+
+    def close(self):
+        self.aberta = False
@@ -0,0 +1,433 @@
+"""
+Backend RFC das extrações do registro TABELAS (ver extratores.py): lê as
+tabelas com a RFC_READ_TABLE pelo pyrfc, sem SE16N, ALV nem arquivo
+exportado pelo SAP GUI.
+
+Só os campos de spec.campos são pedidos. As chaves de spec.arquivo_chaves
+viram cláusulas WHERE de até RFC_LOTE_CHAVES chaves: IN para as avulsas,
+BETWEEN para as sequências numéricas. Cada chamada traz no máximo
+RFC_LINHAS_PAGINA linhas (ROWCOUNT); quando a resposta enche a página, as
+chaves do lote são divididas ao meio e lidas de novo. Não há ROWSKIPS: a
+RFC_READ_TABLE não ordena as linhas, e no HANA a ordem pode mudar de uma
+chamada para outra. Campos que passam da largura da linha são lidos em
+grupos, cada um com os campos-chave da tabela, e juntados pela chave. Os
+lotes rodam em paralelo num pool de RFC_CONEXOES conexões. O resultado sai
+com os cabeçalhos e os tipos da exportação da SE16N (números, datas e chaves
+sem zeros à esquerda).
+
+A conexão é qualquer objeto com call(funcao, **parametros), como o
+pyrfc.Connection. Os testes sem SAP usam a ConexaoRfcFalsa do sap_fake.py.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import pandas as pd
+
+from configuracao import (PASTA_ONTIME, RFC_PARAMETROS, RFC_FUNCAO_LEITURA, RFC_CONEXOES, RFC_LOTE_CHAVES,
+                          RFC_LINHAS_PAGINA)
+from leitor_sap import converter_deduzido, gravar_exportacao
+from lotes_chaves import compactar_intervalos, dividir_lotes, ler_chaves
+from rastreamento import registrar
+from sap_se16n import ResultadoExtracao
+
+# Largura máxima de uma linha da RFC_READ_TABLE (campo WA da tabela DATA)
+LARGURA_MAXIMA = 512
+# Tamanho de cada linha da tabela OPTIONS (cláusula WHERE)
+TAMANHO_LINHA_WHERE = 72
+# Rotinas de conversão que completam números com zeros à esquerda (None = até o tamanho do campo).
+# A MATN1 completa até 18 posições também no S/4 (sem o material de 40 caracteres ativo).
+CONVERSOES_COM_ZEROS = {'ALPHA': None, 'MATN1': 18}
+# Tipos ABAP numéricos sem casas decimais fixas
+TIPOS_NUMERICOS = {'F', 'I', 'b', 's', '8', 'a', 'e'}
+
+
+def abrir_conexao_pyrfc(parametros=None):
+    """Abre uma conexão RFC com os parâmetros de RFC_PARAMETROS e o usuário do login."""
+    try:
+        from pyrfc import Connection
+    except ImportError as e:
+        raise RuntimeError("O backend RFC precisa do pyrfc e do SAP NW RFC SDK (pip install pyrfc); "
+                           "use SAP_BACKEND_EXTRACAO=gui para extrair pelo SAP GUI.") from e
+    parametros = dict(parametros or RFC_PARAMETROS)
+    parametros.setdefault('user', os.getenv('SAP_USER'))
+    parametros.setdefault('passwd', os.getenv('SAP_PASSWORD'))
+    return Connection(**{nome: valor for nome, valor in parametros.items() if valor})
+
+
+class PoolConexoes:
+    """
+    Até `tamanho` conexões, abertas na primeira vez que são pedidas e
+    reaproveitadas depois; cada conexão é usada por uma thread de cada vez.
+    """
+
+    def __init__(self, abrir, tamanho):
+        self.abrir = abrir
+        self.tamanho = max(1, int(tamanho))
+        self._livres = queue.Queue()
+        self._abertas = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def emprestar(self):
+        conexao = None
+        with self._lock:
+            if self._livres.empty() and len(self._abertas) < self.tamanho:
+                conexao = self.abrir()
+                self._abertas.append(conexao)
+        if conexao is None:
+            conexao = self._livres.get()
+        try:
+            yield conexao
+        finally:
+            self._livres.put(conexao)
+
+    def fechar(self):
+        with self._lock:
+            for conexao in self._abertas:
+                fechar = getattr(conexao, 'close', None)
+                if fechar is not None:
+                    fechar()
+            self._abertas = []
+            self._livres = queue.Queue()
+
+
+@dataclass
+class CampoRfc:
+    """
+    Um campo do dicionário: tipo ABAP, tamanho, casas decimais, rotina de conversão,
+    largura na linha lida e se faz parte da chave primária da tabela.
+    """
+    nome: str
+    tipo: str
+    tamanho: int
+    decimais: int = 0
+    conversao: str = ''
+    largura: int = 0
+    chave: bool = False
+
+    @property
+    def completa_zeros(self):
+        return self.tipo == 'N' or self.conversao in CONVERSOES_COM_ZEROS
+
+    def valor_interno(self, valor):
+        """Valor como está gravado no banco: '4500001' -> '0004500001' em campos NUMC e com ALPHA."""
+        valor = str(valor).strip()
+        if self.completa_zeros and valor.isdigit():
+            return valor.zfill(CONVERSOES_COM_ZEROS.get(self.conversao) or self.tamanho)
+        return valor
+
+
+def literal(valor):
+    return "'" + valor.replace("'", "''") + "'"
+
+
+def quebrar_linhas(tokens, tamanho=TAMANHO_LINHA_WHERE):
+    """Junta os tokens da cláusula WHERE em linhas de até `tamanho` caracteres (sem cortar token)."""
+    linhas = []
+    atual = ''
+    for token in tokens:
+        if atual and len(atual) + 1 + len(token) > tamanho:
+            linhas.append(atual)
+            atual = token
+        else:
+            atual = f"{atual} {token}" if atual else token
+    if atual:
+        linhas.append(atual)
+    return linhas
+
+
+def condicao_valores(campo, valores):
+    """Tokens de `CAMPO IN ( 'a' , 'b' )` (ou `CAMPO = 'a'` para um valor só)."""
+    valores = [literal(campo.valor_interno(v)) for v in valores]
+    if len(valores) == 1:
+        return [campo.nome, '=', valores[0]]
+    tokens = [campo.nome, 'IN', '(']
+    for posicao, valor in enumerate(valores):
+        tokens += [valor, ','] if posicao < len(valores) - 1 else [valor]
+    return tokens + [')']
+
+
+def montar_where(campo_chave, entradas, filtros, campos):
+    """
+    Linhas da tabela OPTIONS: as chaves do lote (avulsas em IN, intervalos em
+    BETWEEN) e os filtros fixos {campo: [valores]}.
+    """
+    chave = campos[campo_chave]
+    partes = []
+    avulsas = [de for de, ate in entradas if ate is None]
+    if avulsas:
+        partes.append(condicao_valores(chave, avulsas))
+    for de, ate in entradas:
+        if ate is not None:
+            partes.append([chave.nome, 'BETWEEN', literal(chave.valor_interno(de)), 'AND',
+                           literal(chave.valor_interno(ate))])
+    tokens = ['(']
+    for posicao, parte in enumerate(partes):
+        tokens += parte + (['OR'] if posicao < len(partes) - 1 else [])
+    tokens.append(')')
+    for nome, valores in (filtros or {}).items():
+        tokens += ['AND', '('] + condicao_valores(campos[nome], valores) + [')']
+    return quebrar_linhas(tokens)
+
+
+def agrupar_campos(campos, chaves=(), limite=LARGURA_MAXIMA):
+    """
+    Divide os campos em grupos cuja linha cabe na RFC_READ_TABLE (uma leitura por grupo).
+    Com mais de um grupo, cada um leva também os campos-chave da tabela (`chaves`), para
+    as leituras serem juntadas pela chave: a ordem das linhas não é a mesma entre chamadas.
+    """
+    campos = list(campos)
+    if sum(campo.largura for campo in campos) <= limite:
+        return [campos]
+    if not chaves:
+        raise ValueError(f"Os campos {[campo.nome for campo in campos]} passam de {limite} caracteres por linha "
+                         f"e a tabela não informa campos-chave para juntar as leituras; "
+                         f"reduza `campos` em TABELAS (sap_se16n.py).")
+    nomes_chaves = {campo.nome for campo in chaves}
+    largura_chaves = sum(campo.largura for campo in chaves)
+    grupos = [[]]
+    largura = largura_chaves
+    for campo in campos:
+        if campo.nome in nomes_chaves:
+            continue
+        if largura_chaves + campo.largura > limite:
+            raise ValueError(f"O campo {campo.nome} não cabe numa linha da RFC_READ_TABLE junto com os "
+                             f"campos-chave {sorted(nomes_chaves)}.")
+        if grupos[-1] and largura + campo.largura > limite:
+            grupos.append([])
+            largura = largura_chaves
+        grupos[-1].append(campo)
+        largura += campo.largura
+    return [list(chaves) + grupo for grupo in grupos]
+
+
+def dividir_entradas(entradas):
+    """
+    Divide as entradas (chave, None) / (de, até) em duas metades; um intervalo sozinho
+    é partido no meio. Retorna None quando sobra uma chave só, que não dá para dividir.
+    """
+    if len(entradas) > 1:
+        meio = len(entradas) // 2
+        return [entradas[:meio], entradas[meio:]]
+    de, ate = entradas[0]
+    if ate is None or int(ate) <= int(de):
+        return None
+    meio = (int(de) + int(ate)) // 2
+
+    def entrada(inicio, fim):
+        inicio, fim = str(inicio).zfill(len(de)), str(fim).zfill(len(de))
+        return (inicio, None) if inicio == fim else (inicio, fim)
+
+    return [[entrada(de, meio)], [entrada(meio + 1, ate)]]
+
+
+def fatiar_linhas(linhas, campos_resposta):
+    """Quebra as linhas de largura fixa (DATA-WA) nas colunas descritas em FIELDS, ainda como texto."""
+    serie = pd.Series(linhas, dtype=object)
+    colunas = {}
+    for campo in campos_resposta:
+        inicio = int(campo['OFFSET'])
+        colunas[campo['FIELDNAME'].strip()] = serie.str.slice(inicio, inicio + int(campo['LENGTH'])).str.strip()
+    return pd.DataFrame(colunas, index=serie.index)
+
+
+def tipar(serie, campo):
+    """
+    Converte o texto lido para o tipo que a coluna teria na exportação da SE16N:
+    datas (AAAAMMDD ou dd.mm.aaaa), decimais pelas casas do dicionário e, nos
+    campos de texto, a mesma dedução do leitor_sap (chaves numéricas viram inteiros).
+    """
+    serie = serie.fillna('')
+    if campo.tipo == 'D':
+        vazias = serie.isin(['', '00000000'])
+        com_pontos = serie.str.contains(r'[./]', regex=True)
+        datas = pd.to_datetime(serie.where(~com_pontos & ~vazias), format='%Y%m%d', errors='coerce')
+        if com_pontos.any():
+            datas[com_pontos] = pd.to_datetime(serie[com_pontos].str.replace('/', '.', regex=False),
+                                               format='%d.%m.%Y', errors='coerce')
+        return datas
+    if campo.tipo == 'P':
+        # A RFC_READ_TABLE formata o número com as convenções do usuário ('1.234,567', '12,50-');
+        # com as casas decimais do dicionário, só os dígitos e o sinal importam
+        negativo = serie.str.contains('-', regex=False)
+        digitos = serie.str.replace(r'\D', '', regex=True)
+        numeros = pd.to_numeric(digitos.where(digitos != ''), errors='coerce') / 10 ** campo.decimais
+        numeros = numeros.where(~negativo, -numeros)
+        return numeros.round().astype('Int64') if campo.decimais == 0 else numeros.astype('float64')
+    if campo.tipo in TIPOS_NUMERICOS:
+        return pd.to_numeric(serie.str.replace(',', '.', regex=False).where(serie != ''), errors='coerce')
+    return converter_deduzido(serie)[1]
+
+
+class ExtratorRFC:
+    """Extração pela RFC_READ_TABLE (ou cópia Z), com lotes de chaves paralelos num pool de conexões."""
+    nome = 'rfc'
+    usa_sessao = False
+
+    def __init__(self, abrir_conexao=None, conexoes=None, lote_chaves=None, linhas_pagina=None, funcao=None):
+        self.pool = PoolConexoes(abrir_conexao or abrir_conexao_pyrfc, conexoes or RFC_CONEXOES)
+        self.lote_chaves = lote_chaves or RFC_LOTE_CHAVES
+        self.linhas_pagina = linhas_pagina or RFC_LINHAS_PAGINA
+        self.funcao = funcao or RFC_FUNCAO_LEITURA
+        self._dicionarios = {}
+        self._lock = threading.Lock()
+
+    def fechar(self):
+        self.pool.fechar()
+
+    def dicionario(self, conexao, tabela, nomes):
+        """
+        CampoRfc de cada campo pedido: tipo, tamanho e conversão pela DDIF_FIELDINFO_GET
+        e a largura na linha pela RFC_READ_TABLE sem dados (NO_DATA). Guardado por tabela.
+        """
+        with self._lock:
+            if tabela in self._dicionarios:
+                return self._dicionarios[tabela]
+        resposta = conexao.call('DDIF_FIELDINFO_GET', TABNAME=tabela, ALL_TYPES='X')
+        infos = {linha['FIELDNAME'].strip(): linha for linha in resposta['DFIES_TAB']}
+        faltando = [nome for nome in nomes if nome not in infos]
+        if faltando:
+            raise ValueError(f"Campo(s) {faltando} não existem na tabela {tabela}; ajuste `campos` em TABELAS (sap_se16n.py)")
+        # Os campos-chave (sem o mandante, implícito na RFC) entram no dicionário para juntar leituras em grupos
+        chaves = [nome for nome, info in infos.items()
+                  if (info.get('KEYFLAG') or '').strip() == 'X' and (info.get('DATATYPE') or '').strip() != 'CLNT'
+                  and nome != 'MANDT']
+        nomes = list(dict.fromkeys([*nomes, *chaves]))
+        larguras = conexao.call(self.funcao, QUERY_TABLE=tabela, NO_DATA='X', DELIMITER='',
+                                FIELDS=[{'FIELDNAME': nome} for nome in nomes])['FIELDS']
+        larguras = {linha['FIELDNAME'].strip(): int(linha['LENGTH']) for linha in larguras}
+        campos = {nome: CampoRfc(nome, infos[nome]['INTTYPE'], int(infos[nome]['LENG']),
+                                 int(infos[nome].get('DECIMALS') or 0), (infos[nome].get('CONVEXIT') or '').strip(),
+                                 larguras[nome], nome in chaves)
+                  for nome in infos if nome in nomes}
+        with self._lock:
+            self._dicionarios[tabela] = campos
+        return campos
+
+    def ler_pagina(self, conexao, tabela, grupos, opcoes):
+        """
+        Uma chamada por grupo de campos, sem ROWSKIPS. Retorna (DataFrame, chamadas feitas),
+        com None no lugar do DataFrame quando uma resposta enche a página (pode haver mais linhas).
+        Com mais de um grupo, as leituras são juntadas pelos campos-chave que todos trazem.
+        """
+        partes = []
+        for grupo in grupos:
+            resposta = conexao.call(self.funcao, QUERY_TABLE=tabela, DELIMITER='', ROWCOUNT=self.linhas_pagina,
+                                    OPTIONS=[{'TEXT': linha} for linha in opcoes],
+                                    FIELDS=[{'FIELDNAME': campo.nome} for campo in grupo])
+            if len(resposta['DATA']) >= self.linhas_pagina:
+                return None, len(partes) + 1
+            partes.append(fatiar_linhas([linha['WA'] for linha in resposta['DATA']], resposta['FIELDS']))
+        df = partes[0]
+        if len(partes) > 1:
+            chaves = [campo.nome for campo in grupos[0] if campo.chave]
+            for parte in partes[1:]:
+                juntas = df.merge(parte, on=chaves, how='inner', validate='one_to_one')
+                if not len(juntas) == len(df) == len(parte):
+                    raise RuntimeError(f"A tabela {tabela} mudou durante a leitura em grupos de campos; "
+                                       f"execute de novo.")
+                df = juntas
+        return df, len(partes)
+
+    def ler_tabela_rfc(self, conexao, tabela, campos, dicionario, campo_chave, entradas, filtros=None):
+        """
+        Todas as linhas das `entradas` (chaves avulsas e intervalos de campo_chave) com os
+        filtros fixos, como texto, uma coluna por campo. Retorna (DataFrame, chamadas feitas).
+        Se uma resposta enche a página, as entradas são divididas ao meio e lidas de novo.
+        """
+        grupos = agrupar_campos(campos, [campo for campo in dicionario.values() if campo.chave])
+        partes = []
+        chamadas = 0
+        pendentes = [entradas]
+        while pendentes:
+            atuais = pendentes.pop()
+            df, feitas = self.ler_pagina(conexao, tabela, grupos,
+                                         montar_where(campo_chave, atuais, filtros, dicionario))
+            chamadas += feitas
+            if df is not None:
+                partes.append(df)
+                continue
+            metades = dividir_entradas(atuais)
+            if metades is None:
+                raise RuntimeError(f"A chave {atuais[0][0]} tem {self.linhas_pagina} linhas ou mais na tabela "
+                                   f"{tabela}; aumente SAP_RFC_LINHAS_PAGINA.")
+            pendentes += reversed(metades)
+        return pd.concat(partes, ignore_index=True), chamadas
+
+    def ler_lote(self, spec, entradas, dicionario, campos_textos):
+        """Linhas (texto) de um lote de chaves, com a coluna da tabela de textos. Retorna (DataFrame, chamadas)."""
+        lidos = list(spec.campos)
+        if spec.textos is not None and spec.campo_chave not in lidos:
+            lidos.append(spec.campo_chave)
+        with self.pool.emprestar() as conexao:
+            df, chamadas = self.ler_tabela_rfc(conexao, spec.tabela, [dicionario[nome] for nome in lidos],
+                                               dicionario, spec.campo_chave, entradas, spec.filtros)
+            if spec.textos is not None:
+                textos, chamadas_textos = self.ler_tabela_rfc(
+                    conexao, spec.textos.tabela,
+                    [campos_textos[spec.campo_chave], campos_textos[spec.textos.campo]],
+                    campos_textos, spec.campo_chave, entradas, {'SPRAS': [spec.textos.idioma]})
+                chamadas += chamadas_textos
+                df = df.merge(textos.drop_duplicates(spec.campo_chave), on=spec.campo_chave, how='left')
+        return df, chamadas
+
+    def ler(self, spec, chaves):
+        """
+        Linhas da tabela `spec` para as `chaves`, com os cabeçalhos e os tipos
+        da exportação da SE16N. Retorna (DataFrame, chamadas RFC, lotes).
+        """
+        if not spec.campos:
+            raise ValueError(f"A tabela {spec.tabela} não tem `campos` no registro TABELAS (sap_se16n.py); "
+                             f"o backend RFC precisa saber quais campos ler.")
+        nomes = list(dict.fromkeys([*spec.campos, spec.campo_chave, *(spec.filtros or {})]))
+        with self.pool.emprestar() as conexao:
+            dicionario = self.dicionario(conexao, spec.tabela, nomes)
+            campos_textos = None
+            if spec.textos is not None:
+                campos_textos = self.dicionario(conexao, spec.textos.tabela,
+                                                [spec.campo_chave, 'SPRAS', spec.textos.campo])
+        # Sequências só viram BETWEEN quando a chave é completada com zeros: aí a ordem
+        # do texto no banco é a mesma dos números
+        entradas = (compactar_intervalos(chaves) if dicionario[spec.campo_chave].completa_zeros
+                    else [(chave, None) for chave in chaves])
+        lotes = dividir_lotes(entradas, self.lote_chaves)
+
+        if lotes:
+            with ThreadPoolExecutor(max_workers=min(self.pool.tamanho, len(lotes))) as executor:
+                resultados = list(executor.map(
+                    lambda lote: self.ler_lote(spec, lote, dicionario, campos_textos), lotes))
+            texto = pd.concat([df for df, _ in resultados], ignore_index=True)
+            chamadas = sum(n for _, n in resultados)
+        else:
+            texto = pd.DataFrame(columns=nomes + ([spec.textos.campo] if spec.textos else []), dtype=object)
+            chamadas = 0
+
+        colunas = {}
+        for nome, cabecalho in spec.campos.items():
+            colunas[cabecalho] = tipar(texto[nome], dicionario[nome])
+            if spec.textos is not None and nome == spec.campo_chave:
+                colunas[spec.textos.cabecalho] = tipar(texto[spec.textos.campo], campos_textos[spec.textos.campo])
+        return pd.DataFrame(colunas), chamadas, len(lotes)
+
+    def extrair(self, sessoes, spec, pasta=PASTA_ONTIME):
+        """Lê a tabela pelas chaves de spec.arquivo_chaves e grava spec.arquivo_saida, como a exportação da SE16N."""
+        chaves = ler_chaves(os.path.join(pasta, spec.arquivo_chaves))
+        print(f"Processando tabela {spec.tabela} por RFC ({len(chaves)} chaves em {spec.arquivo_chaves})...")
+        inicio = time.perf_counter()
+        df, chamadas, lotes = self.ler(spec, chaves)
+        tempo_consulta = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        gravar_exportacao(df, os.path.join(pasta, spec.arquivo_saida))
+        tempo_exportacao = time.perf_counter() - inicio
+
+        registrar(chamadas_rfc=chamadas, lotes_rfc=lotes)
+        print(f"Dados da tabela {spec.tabela} gravados em {spec.arquivo_saida}: {len(df)} linhas "
+              f"({chamadas} chamadas RFC em {lotes} lote(s); leitura {tempo_consulta:.1f}s, "
+              f"gravação {tempo_exportacao:.1f}s)")
+        return ResultadoExtracao(spec.tabela, len(chaves), len(df), tempo_consulta, tempo_exportacao)
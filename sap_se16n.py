@@ -0,0 +1,246 @@
+import os
+import time
+from dataclasses import dataclass, field
+
+from configuracao import PASTA_ONTIME, TIMEOUT_CONSULTA, FORMATO_EXPORTACAO, MAX_SESSOES
+from leitor_sap import arquivo_exportado
+from sap_espera import aguardar_elemento, aguardar_sessao, preencher
+from vigia_exportacao import preparar_destino, aguardar_exportacao, vigiar_planilha
+
+# IDs da tela de seleção da SE16N
+ID_CAMPO_TABELA = "wnd[0]/usr/ctxtGD-TAB"
+ID_VARIANTE = "wnd[0]/usr/ctxtGD-VARIANT"
+ID_MAX_LINHAS = "wnd[0]/usr/txtGD-MAX_LINES"
+ID_BOTAO_SELECAO_MULTIPLA = "wnd[0]/usr/subTAB_SUB:SAPLSE16N:0121/tblSAPLSE16NSELFIELDS_TC/btnPUSH[4,0]"
+ID_BUSCA_CAMPO = "wnd[1]/usr/sub:SAPLSPO4:0300/txtSVALD-VALUE[0,21]"
+ID_VALOR_MULTIPLO = "wnd[1]/usr/tblSAPLSE16NMULTI_TC/ctxtGS_MULTI_SELECT-LOW[1,{linha}]"
+ID_GRADE_RESULTADO = "wnd[0]/shellcont/shell"
+ID_NOME_EXPORTACAO = "wnd[1]/usr/ssubSUB_CONFIGURATION:SAPLSALV_GUI_CUL_EXPORT_AS:0512/txtGS_EXPORT-FILE_NAME"
+# Opção "Texto com tabulações" do diálogo de arquivo local (&PC); a linha 0 é "Não convertido"
+ID_OPCAO_TEXTO_TABULADO = "wnd[1]/usr/subSUBSCREEN_STEPLOOP:SAPLSPO5:0150/sub:SAPLSPO5:0150/radSPOPLI-SELFLAG[1,0]"
+ID_CODIFICACAO = "wnd[1]/usr/ctxtDY_FILE_ENCODING"
+# Código de página SAP para UTF-8
+CODIFICACAO_UTF8 = "4110"
+
+
+@dataclass
+class TextosSE16N:
+    """Tabela de textos mostrada junto na SE16N (ex.: MAKT para a descrição do material)."""
+    tabela: str
+    campo: str
+    cabecalho: str
+    idioma: str = 'P'
+
+
+@dataclass
+class TabelaSE16N:
+    """Tudo o que muda de uma extração SE16N para outra."""
+    tabela: str
+    campo_chave: str
+    arquivo_chaves: str
+    # Filtros fixos adicionais: {campo: [valores]}
+    filtros: dict = field(default_factory=dict)
+    variante: str = "/LOG_ONTIME"
+    # Nome do arquivo exportado (sem extensão); por padrão, o nome da tabela
+    saida: str = None
+    # Cache de chaves (cache_chaves.py): coluna da exportação que traz o campo-chave
+    # (None desliga o cache) e por quantos dias uma linha guardada vale (None = sempre)
+    coluna_chave: str = None
+    validade_dias: float = None
+    # Sessões que a extração pode usar ao mesmo tempo quando as chaves são
+    # divididas em lotes (lotes_chaves.py)
+    sessoes: int = 1
+    # Backend RFC (sap_rfc.py): campos lidos {campo do dicionário: cabeçalho da exportação},
+    # na ordem das colunas da variante, e a tabela de textos (entra logo após o campo-chave)
+    campos: dict = None
+    textos: TextosSE16N = None
+
+    @property
+    def arquivo_saida(self):
+        return arquivo_exportado(self.saida or self.tabela)
+
+    @property
+    def coluna_campo_chave(self):
+        """Coluna da exportação que traz o campo-chave: coluna_chave ou o cabeçalho do campo em `campos`."""
+        return self.coluna_chave or (self.campos or {}).get(self.campo_chave)
+
+
+@dataclass
+class ResultadoExtracao:
+    """Tempos e contagens de uma extração, para achar as tabelas mais lentas."""
+    tabela: str
+    chaves: int
+    linhas: int
+    tempo_consulta: float
+    tempo_exportacao: float
+
+    @property
+    def tempo_total(self):
+        return self.tempo_consulta + self.tempo_exportacao
+
+
+# Registro das tabelas extraídas pela SE16N.
+# Para incluir uma nova tabela basta acrescentar uma entrada aqui.
+# Documentos lançados (notas fiscais) não mudam: suas linhas ficam no cache de
+# chaves sem prazo; fluxo de documentos e materiais são consultados de novo após a validade.
+# As tabelas do caminho crítico (LIPS → VBFA → J_1BNFLIN → J_1BNFDOC) rodam sozinhas
+# e podem dividir os lotes de chaves entre todas as sessões.
+TABELAS = {
+    'EBAN': TabelaSE16N('EBAN', 'BANFN', 'ZPMMT_REQ.txt',
+                        campos={'BANFN': 'Requisição de compras', 'BNFPO': 'Item', 'MATNR': 'Material',
+                                'EBELN': 'Pedido', 'EBELP': 'Item do pedido'}),
+    'EKET': TabelaSE16N('EKET', 'BANFN', 'ZPMMT_REQ.txt',
+                        campos={'BANFN': 'Requisição de compras', 'BNFPO': 'Item', 'EBELN': 'Documento de compras',
+                                'EBELP': 'Item do pedido', 'EINDT': 'Data de remessa'}),
+    'LIPS': TabelaSE16N('LIPS', 'VGBEL', 'PEDIDOS_CONSOLIDADO.txt', sessoes=MAX_SESSOES,
+                        campos={'VGBEL': 'Documento de referência', 'VGPOS': 'Item de referência',
+                                'VBELN': 'Remessa', 'MATNR': 'Material', 'LFIMG': 'Quantidade'}),
+    'VBFA': TabelaSE16N('VBFA', 'VBELV', 'REMESSA.txt', filtros={'BWART': ['101', '862', '861']},
+                        coluna_chave='Doc.SD precedente', validade_dias=7, sessoes=MAX_SESSOES,
+                        campos={'VBELV': 'Doc.SD precedente', 'VBELN': 'Doc.subsequente', 'MJAHR': 'Ano doc.material',
+                                'BWART': 'Tipo de movimento', 'RFMNG': 'Quantidade', 'ERDAT': 'Criado em'}),
+    'J_1BNFLIN': TabelaSE16N('J_1BNFLIN', 'REFKEY', 'VBFA_CONSOLIDADO.txt', coluna_chave='Referência',
+                             sessoes=MAX_SESSOES,
+                             campos={'REFKEY': 'Referência', 'DOCNUM': 'Nº documento', 'ITMNUM': 'Item',
+                                     'MATNR': 'Material', 'NETWR': 'Valor'}),
+    'J_1BNFDOC': TabelaSE16N('J_1BNFDOC', 'DOCNUM', 'JLIN.txt', coluna_chave='Nº documento',
+                             sessoes=MAX_SESSOES,
+                             campos={'DOCNUM': 'Nº documento', 'NFENUM': 'Nº NF-e', 'SERIES': 'Série',
+                                     'DOCDAT': 'Data do documento', 'CGC': 'CNPJ emissor'}),
+    'MARA': TabelaSE16N('MARA', 'MATNR', 'MARA.txt', coluna_chave='Material', validade_dias=30,
+                        campos={'MATNR': 'Material', 'MATKL': 'Grupo de mercadorias'},
+                        textos=TextosSE16N('MAKT', 'MAKTX', 'Descrição')),
+}
+
+
+def contar_linhas(caminho):
+    """Conta as linhas não vazias de um arquivo de chaves."""
+    with open(caminho, encoding='utf-8', errors='ignore') as arquivo:
+        return sum(1 for linha in arquivo if linha.strip())
+
+
+def abrir_selecao_multipla(session, campo):
+    """Localiza o campo na tela de seleção (Ctrl+F) e abre sua seleção múltipla."""
+    session.findById("wnd[0]").sendVKey(71)
+    aguardar_elemento(session, ID_BUSCA_CAMPO).text = campo
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[0]").press()
+    # A busca traz o campo encontrado para a primeira linha da lista de campos
+    aguardar_elemento(session, ID_BOTAO_SELECAO_MULTIPLA).press()
+
+
+def carregar_arquivo_chaves(session, pasta, nome_arquivo):
+    """Carrega um arquivo de chaves (uma por linha) na seleção múltipla aberta."""
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[21]").press()
+    preencher(session, {"wnd[2]/usr/ctxtDY_PATH": pasta, "wnd[2]/usr/ctxtDY_FILENAME": nome_arquivo})
+    aguardar_elemento(session, "wnd[2]/tbar[0]/btn[0]").press()
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[8]").press()
+
+
+def digitar_valores(session, valores):
+    """Digita valores fixos na seleção múltipla aberta (ex.: tipos de movimento)."""
+    preencher(session, {ID_VALOR_MULTIPLO.format(linha=linha): valor for linha, valor in enumerate(valores)})
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[8]").press()
+
+
+def exportar_xxl(session, nome_arquivo, pasta=PASTA_ONTIME):
+    """
+    Exporta a grade de resultado (ALV) para <pasta>/<nome_arquivo>.xlsx e
+    espera a planilha ficar pronta; o Excel que o SAP GUI abre com ela é fechado.
+    """
+    caminho = os.path.join(pasta, arquivo_exportado(nome_arquivo, 'xlsx'))
+    preparar_destino(caminho)
+    grade = aguardar_elemento(session, ID_GRADE_RESULTADO, TIMEOUT_CONSULTA)
+    grade.pressToolbarContextButton("&MB_EXPORT")
+    grade.selectContextMenuItem("&XXL")
+    aguardar_elemento(session, ID_NOME_EXPORTACAO).text = nome_arquivo
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[20]").press()
+    aguardar_elemento(session, "wnd[1]/usr/ctxtDY_PATH").text = pasta
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[11]").press()
+    aguardar_sessao(session)
+    aguardar_exportacao(caminho)
+    vigiar_planilha(caminho)
+
+
+def exportar_texto(session, nome_arquivo, pasta=PASTA_ONTIME):
+    """
+    Exporta a grade de resultado (ALV) como "Texto com tabulações" em
+    <pasta>/<nome_arquivo>.tsv, sem passar pela geração de planilha, e
+    espera o arquivo ficar pronto.
+    """
+    caminho = os.path.join(pasta, arquivo_exportado(nome_arquivo, 'txt'))
+    preparar_destino(caminho)
+    grade = aguardar_elemento(session, ID_GRADE_RESULTADO, TIMEOUT_CONSULTA)
+    grade.pressToolbarContextButton("&MB_EXPORT")
+    grade.selectContextMenuItem("&PC")
+    aguardar_elemento(session, ID_OPCAO_TEXTO_TABULADO).select()
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[0]").press()
+    preencher(session, {"wnd[1]/usr/ctxtDY_PATH": pasta,
+                        "wnd[1]/usr/ctxtDY_FILENAME": arquivo_exportado(nome_arquivo, 'txt')})
+    # Nem toda versão do SAP GUI mostra o campo de codificação
+    codificacao = session.findById(ID_CODIFICACAO, False)
+    if codificacao is not None:
+        codificacao.text = CODIFICACAO_UTF8
+    aguardar_elemento(session, "wnd[1]/tbar[0]/btn[11]").press()
+    aguardar_sessao(session)
+    aguardar_exportacao(caminho)
+
+
+def exportar_resultado(session, nome_arquivo, pasta=PASTA_ONTIME, formato=None):
+    """Exporta a grade de resultado no formato configurado (SAP_FORMATO_EXPORTACAO)."""
+    if (formato or FORMATO_EXPORTACAO) == 'txt':
+        exportar_texto(session, nome_arquivo, pasta)
+    else:
+        exportar_xxl(session, nome_arquivo, pasta)
+
+
+def extrair_se16n(session, tabela, campo_chave, arquivo_chaves, filtros=None,
+                  variante="/LOG_ONTIME", saida=None, pasta=PASTA_ONTIME):
+    """
+    Consulta `tabela` na SE16N filtrando `campo_chave` pelas chaves do arquivo
+    `arquivo_chaves` (e pelos `filtros` fixos) e exporta o resultado para
+    <pasta>/<saida> no formato configurado. Retorna um ResultadoExtracao com tempos e contagens.
+    """
+    saida = saida or tabela
+    chaves = contar_linhas(os.path.join(pasta, arquivo_chaves))
+    print(f"Processando tabela {tabela} ({chaves} chaves em {arquivo_chaves})...")
+    inicio = time.perf_counter()
+
+    aguardar_elemento(session, "wnd[0]/tbar[0]/okcd").text = "/NSE16N"
+    session.findById("wnd[0]").sendVKey(0)
+    aguardar_elemento(session, ID_CAMPO_TABELA).text = tabela
+    session.findById("wnd[0]").sendVKey(0)
+
+    abrir_selecao_multipla(session, campo_chave)
+    carregar_arquivo_chaves(session, pasta, arquivo_chaves)
+    for campo, valores in (filtros or {}).items():
+        abrir_selecao_multipla(session, campo)
+        digitar_valores(session, valores)
+
+    preencher(session, {ID_VARIANTE: variante, ID_MAX_LINHAS: ""})
+    aguardar_elemento(session, "wnd[0]/tbar[1]/btn[8]").press()
+    grade = aguardar_elemento(session, ID_GRADE_RESULTADO, TIMEOUT_CONSULTA)
+    linhas = grade.RowCount
+    tempo_consulta = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    exportar_resultado(session, saida, pasta)
+    tempo_exportacao = time.perf_counter() - inicio
+
+    resultado = ResultadoExtracao(tabela, chaves, linhas, tempo_consulta, tempo_exportacao)
+    print(f"Dados da tabela {tabela} exportados para {arquivo_exportado(saida)}: {linhas} linhas "
+          f"(consulta {tempo_consulta:.1f}s, exportação {tempo_exportacao:.1f}s)")
+    return resultado
+
+
+def extrair_tabela(session, spec, pasta=PASTA_ONTIME):
+    """Executa a extração descrita por uma entrada do registro TABELAS."""
+    return extrair_se16n(session, spec.tabela, spec.campo_chave, spec.arquivo_chaves,
+                         spec.filtros, spec.variante, spec.saida, pasta)
+
+
+def imprimir_resumo(resultados):
+    """Lista as extrações da mais lenta para a mais rápida."""
+    print("\nResumo das extrações SE16N (mais lenta primeiro):")
+    for r in sorted(resultados, key=lambda r: r.tempo_total, reverse=True):
+        print(f"  {r.tabela:<10} {r.tempo_total:7.1f}s  chaves: {r.chaves:>8}  linhas: {r.linhas:>8}  "
+              f"(consulta {r.tempo_consulta:.1f}s, exportação {r.tempo_exportacao:.1f}s)")
@@ -0,0 +1,586 @@
+"""
+Serviço residente de extração: mantém as sessões SAP logadas e atende
+pedidos avulsos (tabela do registro TABELAS, chaves e filtros) sem refazer o
+login e sem rodar o processo On-Time inteiro a cada pergunta.
+
+Os pedidos entram numa fila, pela API HTTP local, pela linha de comando ou
+pela agenda (agenda_servico.json). Cada sessão tem um trabalhador que pega o
+pedido mais antigo de uma tabela livre e junta a ele todos os pedidos da
+mesma tabela e dos mesmos filtros que estão na fila: as chaves são unidas sem
+repetição e vão numa consulta só, e o resultado é separado por pedido. Um
+pedido cujas chaves já estão numa consulta em andamento pega carona nela. As
+tabelas com cache de chaves (cache_chaves.py) só consultam as chaves novas.
+
+  python servico_extracao.py iniciar [--sessoes N]
+  python servico_extracao.py enviar LIPS 80001234 80001235 --esperar
+  python servico_extracao.py enviar VBFA --arquivo REMESSA.txt --filtro BWART=101,862
+  python servico_extracao.py trabalho 17
+  python servico_extracao.py estado
+
+API HTTP (JSON, em ONTIME_SERVICO_HOST:ONTIME_SERVICO_PORTA):
+
+  POST /trabalhos               {"tabela", "chaves", "filtros", "atualizar"}
+  GET  /trabalhos/<id>          estado do pedido (?esperar=S aguarda até S segundos)
+  GET  /trabalhos/<id>/linhas   linhas do resultado
+  GET  /estado                  fila, pedidos em execução, consultas e latências
+
+O resultado de cada pedido fica em PASTA_SERVICO/resultados, no formato das
+exportações (lido com leitor_sap.ler_exportacao).
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from configuracao import (PASTA_ONTIME, PASTA_SERVICO, ARQUIVO_AGENDA, SERVICO_HOST, SERVICO_PORTA,
+                          SERVICO_ESPERA_AGRUPAMENTO, MAX_SESSOES)
+from cache_chaves import extrair_com_cache
+from extratores import criar_extrator
+from gravador_tabelas import gravar_chaves
+from leitor_sap import arquivo_exportado, gravar_exportacao, ler_exportacao
+from lotes_chaves import ler_chaves, normalizar_chaves
+from sap_se16n import TABELAS
+
+# Pedidos concluídos guardados para consulta (os mais antigos são descartados)
+TRABALHOS_GUARDADOS = 1000
+# Latências guardadas para os percentis de /estado
+LATENCIAS_GUARDADAS = 1000
+
+
+@dataclass
+class Trabalho:
+    """Um pedido de extração e o que aconteceu com ele."""
+    id: int
+    tabela: str
+    # Chaves normalizadas (lotes_chaves.normalizar_chaves), sem repetição
+    chaves: list
+    # Filtros além dos fixos do registro: {campo: [valores]}
+    filtros: dict = field(default_factory=dict)
+    # Consulta de novo as chaves que já estão no cache de chaves
+    atualizar: bool = False
+    origem: str = 'api'
+    estado: str = 'na_fila'
+    criado_em: float = field(default_factory=time.time)
+    iniciado_em: float = None
+    concluido_em: float = None
+    # Pedidos atendidos pela mesma consulta (incluindo este)
+    agrupado_com: int = None
+    arquivo: str = None
+    linhas: int = None
+    erro: str = None
+
+    @property
+    def assinatura(self):
+        """Pedidos com a mesma assinatura podem ir na mesma consulta."""
+        return self.tabela, json.dumps(self.filtros, sort_keys=True), self.atualizar
+
+    def como_dict(self):
+        dados = {nome: getattr(self, nome) for nome in ('id', 'tabela', 'filtros', 'atualizar', 'origem', 'estado',
+                                                        'agrupado_com', 'arquivo', 'linhas', 'erro')}
+        dados['chaves'] = len(self.chaves)
+        for nome in ('criado_em', 'iniciado_em', 'concluido_em'):
+            valor = getattr(self, nome)
+            dados[nome] = datetime.fromtimestamp(valor).isoformat(timespec='milliseconds') if valor else None
+        dados['espera_s'] = round(self.iniciado_em - self.criado_em, 3) if self.iniciado_em else None
+        dados['latencia_s'] = round(self.concluido_em - self.criado_em, 3) if self.concluido_em else None
+        return dados
+
+
+@dataclass
+class LoteExtracao:
+    """Pedidos de uma tabela atendidos por uma consulta só."""
+    numero: int
+    tabela: str
+    filtros: dict
+    atualizar: bool
+    trabalhos: list
+    chaves: set
+    # Deixa de aceitar caronas quando o resultado começa a ser separado
+    aberto: bool = True
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return round(ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))], 3)
+
+
+class FilaExtracao:
+    """
+    Fila dos pedidos. Só um lote por tabela roda de cada vez (o cache de
+    chaves e os arquivos de trabalho são por tabela); enquanto isso os pedidos
+    da tabela se acumulam e vão juntos no lote seguinte.
+    """
+
+    def __init__(self, espera_agrupamento=None):
+        self.espera_agrupamento = SERVICO_ESPERA_AGRUPAMENTO if espera_agrupamento is None else espera_agrupamento
+        self.pendentes = []
+        self.em_execucao = {}
+        self.trabalhos = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lotes = itertools.count(1)
+        self._condicao = threading.Condition()
+        self.inicio = time.time()
+        self.contagens = {'recebidos': 0, 'concluidos': 0, 'com_erro': 0, 'caronas': 0, 'lotes': 0,
+                          'consultas_sap': 0, 'chaves_pedidas': 0, 'chaves_consultadas': 0}
+        self.esperas = deque(maxlen=LATENCIAS_GUARDADAS)
+        self.latencias = deque(maxlen=LATENCIAS_GUARDADAS)
+
+    def enviar(self, tabela, chaves, filtros=None, atualizar=False, origem='api'):
+        """Coloca um pedido na fila e devolve o Trabalho (acompanhe com esperar)."""
+        tabela = str(tabela).strip().upper()
+        if tabela not in TABELAS:
+            raise ValueError(f"Tabela desconhecida: '{tabela}' (tabelas: {', '.join(TABELAS)})")
+        chaves = list(pd.Index(normalizar_chaves(pd.Series(list(chaves), dtype=str))).unique())
+        if not chaves:
+            raise ValueError("O pedido não tem chaves.")
+        filtros = {campo: [str(v) for v in (valores if isinstance(valores, list) else [valores])]
+                   for campo, valores in (filtros or {}).items()}
+        with self._condicao:
+            trabalho = Trabalho(next(self._ids), tabela, chaves, filtros, bool(atualizar), origem)
+            self.trabalhos[trabalho.id] = trabalho
+            self.contagens['recebidos'] += 1
+            self.contagens['chaves_pedidas'] += len(chaves)
+            lote = self.em_execucao.get(tabela)
+            if (lote is not None and lote.aberto and not atualizar
+                    and (lote.tabela, json.dumps(lote.filtros, sort_keys=True), lote.atualizar) == trabalho.assinatura
+                    and lote.chaves.issuperset(chaves)):
+                # As chaves já estão na consulta em andamento: o pedido usa o resultado dela
+                trabalho.estado, trabalho.iniciado_em = 'executando', time.time()
+                lote.trabalhos.append(trabalho)
+                self.contagens['caronas'] += 1
+            else:
+                self.pendentes.append(trabalho)
+            self._descartar_antigos()
+            self._condicao.notify_all()
+        return trabalho
+
+    def _descartar_antigos(self):
+        while len(self.trabalhos) > TRABALHOS_GUARDADOS:
+            id_antigo, antigo = next(iter(self.trabalhos.items()))
+            if antigo.estado not in ('concluido', 'erro'):
+                break
+            del self.trabalhos[id_antigo]
+
+    def proximo_lote(self, timeout=None):
+        """
+        Tira da fila o pedido mais antigo de uma tabela que não está em
+        execução, junto com os pedidos compatíveis com ele. Espera até
+        `timeout` segundos por um pedido; retorna None se não chegou nenhum.
+        """
+        limite = time.time() + timeout if timeout is not None else None
+        with self._condicao:
+            while True:
+                agora = time.time()
+                primeiro = next((t for t in self.pendentes if t.tabela not in self.em_execucao), None)
+                if primeiro is not None:
+                    # Dá aos pedidos que chegam juntos a chance de irem na mesma consulta
+                    restante = primeiro.criado_em + self.espera_agrupamento - agora
+                    if restante <= 0:
+                        break
+                    espera = restante
+                else:
+                    espera = None
+                if limite is not None:
+                    if agora >= limite:
+                        return None
+                    espera = min(espera, limite - agora) if espera is not None else limite - agora
+                self._condicao.wait(espera)
+
+            juntos = [t for t in self.pendentes if t.assinatura == primeiro.assinatura]
+            self.pendentes = [t for t in self.pendentes if t.assinatura != primeiro.assinatura]
+            lote = LoteExtracao(next(self._lotes), primeiro.tabela, primeiro.filtros, primeiro.atualizar, juntos,
+                                {chave for t in juntos for chave in t.chaves})
+            for trabalho in juntos:
+                trabalho.estado, trabalho.iniciado_em = 'executando', agora
+            self.em_execucao[lote.tabela] = lote
+            self.contagens['lotes'] += 1
+            self.contagens['chaves_consultadas'] += len(lote.chaves)
+            return lote
+
+    def fechar_lote(self, lote):
+        """Encerra as caronas do lote e devolve os pedidos que ele atende."""
+        with self._condicao:
+            lote.aberto = False
+            return list(lote.trabalhos)
+
+    def concluir(self, lote, consultou_sap=True, erro=None):
+        """Marca os pedidos do lote como concluídos (ou com erro) e libera a tabela."""
+        with self._condicao:
+            lote.aberto = False
+            agora = time.time()
+            for trabalho in lote.trabalhos:
+                trabalho.concluido_em = agora
+                trabalho.agrupado_com = len(lote.trabalhos)
+                if erro is not None:
+                    trabalho.estado, trabalho.erro = 'erro', f"{type(erro).__name__}: {erro}"
+                    self.contagens['com_erro'] += 1
+                else:
+                    trabalho.estado = 'concluido'
+                    self.contagens['concluidos'] += 1
+                self.esperas.append(trabalho.iniciado_em - trabalho.criado_em)
+                self.latencias.append(agora - trabalho.criado_em)
+            self.contagens['consultas_sap'] += bool(consultou_sap and erro is None)
+            del self.em_execucao[lote.tabela]
+            self._condicao.notify_all()
+
+    def esperar(self, id_trabalho, timeout=None):
+        """O Trabalho, depois de concluído ou de `timeout` segundos. KeyError se o id não existe."""
+        with self._condicao:
+            trabalho = self.trabalhos[id_trabalho]
+            self._condicao.wait_for(lambda: trabalho.estado in ('concluido', 'erro'), timeout)
+            return trabalho
+
+    def estado(self):
+        with self._condicao:
+            executando = sum(len(lote.trabalhos) for lote in self.em_execucao.values())
+            esperas, latencias = list(self.esperas), list(self.latencias)
+            contagens = dict(self.contagens)
+            pendentes_por_tabela = {}
+            for trabalho in self.pendentes:
+                pendentes_por_tabela[trabalho.tabela] = pendentes_por_tabela.get(trabalho.tabela, 0) + 1
+        atendidos = contagens['concluidos'] + contagens['com_erro']
+        return {
+            'ativo_desde': datetime.fromtimestamp(self.inicio).isoformat(timespec='seconds'),
+            'fila': sum(pendentes_por_tabela.values()),
+            'fila_por_tabela': pendentes_por_tabela,
+            'executando': executando,
+            'tabelas_em_execucao': sorted(self.em_execucao),
+            **contagens,
+            'pedidos_por_lote': round(atendidos / contagens['lotes'], 2) if contagens['lotes'] else None,
+            'espera_s': {'p50': percentil(esperas, 50), 'p95': percentil(esperas, 95)},
+            'latencia_s': {'p50': percentil(latencias, 50), 'p95': percentil(latencias, 95)},
+        }
+
+
+class ServicoExtracao:
+    """
+    Trabalhadores que atendem a fila, um por sessão SAP (ou por conexão RFC
+    do pool, com o backend RFC). `sessoes` é a lista de funções que abrem,
+    na thread do trabalhador, cada sessão já logada.
+    """
+
+    def __init__(self, sessoes=None, extrator=None, pasta=None, pasta_cache=None, fila=None):
+        self.extrator = extrator or criar_extrator()
+        self.sessoes = list(sessoes or [])
+        if self.extrator.usa_sessao and not self.sessoes:
+            raise ValueError(f"O backend '{self.extrator.nome}' precisa de sessões SAP.")
+        self.pasta = pasta or PASTA_SERVICO
+        self.pasta_resultados = os.path.join(self.pasta, 'resultados')
+        self.pasta_cache = pasta_cache
+        self.fila = fila or FilaExtracao()
+        self._parar = threading.Event()
+        self._threads = []
+
+    def iniciar(self):
+        os.makedirs(self.pasta_resultados, exist_ok=True)
+        abridores = self.sessoes if self.extrator.usa_sessao else [None] * MAX_SESSOES
+        for numero, abrir_sessao in enumerate(abridores, 1):
+            thread = threading.Thread(target=self.trabalhar, args=(abrir_sessao,), daemon=True,
+                                      name=f"trabalhador-{numero}")
+            thread.start()
+            self._threads.append(thread)
+        print(f"✔ Serviço de extração com {len(abridores)} trabalhador(es) (backend {self.extrator.nome}).")
+
+    def parar(self):
+        self._parar.set()
+        for thread in self._threads:
+            thread.join()
+
+    def trabalhar(self, abrir_sessao):
+        sessoes = [abrir_sessao] if abrir_sessao is not None else None
+        while not self._parar.is_set():
+            lote = self.fila.proximo_lote(timeout=0.5)
+            if lote is None:
+                continue
+            try:
+                consultou = self.executar_lote(lote, sessoes)
+            except Exception as e:
+                print(f"❌ Lote {lote.numero} da {lote.tabela} ({len(lote.trabalhos)} pedido(s)): {e}")
+                self.fila.concluir(lote, erro=e)
+            else:
+                self.fila.concluir(lote, consultou)
+
+    def executar_lote(self, lote, sessoes):
+        """Extrai as chaves do lote numa consulta e grava o resultado de cada pedido. Retorna se consultou o SAP."""
+        base = TABELAS[lote.tabela]
+        nome = f"{lote.tabela}_SERVICO{lote.numero}"
+        spec = replace(base, arquivo_chaves=f"{nome}.txt", saida=nome, filtros={**base.filtros, **lote.filtros})
+        caminho_chaves = os.path.join(self.pasta, spec.arquivo_chaves)
+        caminho_saida = os.path.join(self.pasta, spec.arquivo_saida)
+        print(f"Lote {lote.numero}: {lote.tabela}, {len(lote.chaves)} chave(s) de {len(lote.trabalhos)} pedido(s).")
+        gravar_chaves(pd.Series(sorted(lote.chaves)), caminho_chaves)
+        try:
+            if lote.filtros:
+                # O cache de chaves só guarda linhas com os filtros do registro
+                resultado = self.extrator.extrair(sessoes, spec, self.pasta)
+            else:
+                resultado = extrair_com_cache(sessoes, spec, self.pasta, self.pasta_cache, self.extrator,
+                                              forcar=lote.atualizar)
+            df = ler_exportacao(caminho_saida)
+        finally:
+            for caminho in (caminho_chaves, caminho_saida):
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+
+        coluna = spec.coluna_campo_chave
+        if coluna not in df.columns:
+            # Sem a coluna não há como separar as linhas de cada pedido do lote
+            raise ValueError(f"Coluna '{coluna}' do campo {spec.campo_chave} não encontrada na exportação da "
+                             f"{lote.tabela}; ajuste `coluna_chave`/`campos` em TABELAS (sap_se16n.py) ou a variante.")
+        chaves_df = normalizar_chaves(df[coluna])
+        for trabalho in self.fila.fechar_lote(lote):
+            parte = df[chaves_df.isin(trabalho.chaves)]
+            trabalho.arquivo = os.path.join(self.pasta_resultados, arquivo_exportado(f"{lote.tabela}_{trabalho.id}"))
+            gravar_exportacao(parte, trabalho.arquivo + '.tmp')
+            os.replace(trabalho.arquivo + '.tmp', trabalho.arquivo)
+            trabalho.linhas = len(parte)
+        return resultado.chaves > 0
+
+
+class AgendaExtracao:
+    """
+    Pedidos recorrentes de ARQUIVO_AGENDA, relido quando muda:
+    [{"tabela": "MARA", "arquivo_chaves": "MARA.txt", "a_cada_minutos": 60, "atualizar": true}]
+    `arquivo_chaves` é relativo a PASTA_ONTIME (as chaves da última execução
+    do processo); `chaves` traz a lista direto. Cada item roda ao iniciar o
+    serviço e depois a cada `a_cada_minutos`.
+    """
+
+    def __init__(self, fila, caminho=None, pasta_chaves=None):
+        self.fila = fila
+        self.caminho = caminho or ARQUIVO_AGENDA
+        self.pasta_chaves = pasta_chaves or PASTA_ONTIME
+        self.itens = []
+        self.proximas = {}
+        self._modificado = None
+        self._parar = threading.Event()
+
+    def recarregar(self):
+        try:
+            modificado = os.stat(self.caminho).st_mtime_ns
+        except OSError:
+            self.itens, self._modificado = [], None
+            return
+        if modificado == self._modificado:
+            return
+        try:
+            with open(self.caminho, encoding='utf-8') as arquivo:
+                self.itens = json.load(arquivo)
+            print(f"✔ Agenda do serviço: {len(self.itens)} extração(ões) recorrente(s).")
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠ Agenda {self.caminho} ignorada: {e}")
+            self.itens = []
+        self._modificado = modificado
+
+    def verificar(self, agora=None):
+        """Envia à fila os itens da agenda que estão na hora. Retorna os Trabalhos criados."""
+        agora = agora or time.time()
+        self.recarregar()
+        enviados = []
+        for indice, item in enumerate(self.itens):
+            chave = json.dumps(item, sort_keys=True)
+            if self.proximas.get(chave, 0) > agora:
+                continue
+            self.proximas[chave] = agora + float(item.get('a_cada_minutos', 60)) * 60
+            try:
+                if 'arquivo_chaves' in item:
+                    chaves = ler_chaves(os.path.join(self.pasta_chaves, item['arquivo_chaves']))
+                else:
+                    chaves = item.get('chaves', [])
+                enviados.append(self.fila.enviar(item['tabela'], chaves, item.get('filtros'),
+                                                 item.get('atualizar', False), origem='agenda'))
+            except (OSError, KeyError, ValueError) as e:
+                print(f"⚠ Item {indice + 1} da agenda não enviado: {e}")
+        return enviados
+
+    def rodar(self, intervalo=1.0):
+        while not self._parar.wait(intervalo):
+            self.verificar()
+
+    def iniciar(self):
+        self.verificar()
+        threading.Thread(target=self.rodar, daemon=True, name='agenda').start()
+
+    def parar(self):
+        self._parar.set()
+
+
+class ManipuladorHTTP(BaseHTTPRequestHandler):
+    """API JSON do serviço; self.server.fila é a FilaExtracao."""
+
+    def log_message(self, formato, *args):
+        # Sem uma linha no console por requisição
+        pass
+
+    def responder(self, status, dados):
+        corpo = (dados if isinstance(dados, str) else json.dumps(dados, ensure_ascii=False)).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        partes = [p for p in url.path.split('/') if p]
+        esperar = float(parse_qs(url.query).get('esperar', ['0'])[0])
+        if partes == ['estado']:
+            return self.responder(200, self.server.fila.estado())
+        if len(partes) in (2, 3) and partes[0] == 'trabalhos' and partes[1].isdigit():
+            try:
+                trabalho = self.server.fila.esperar(int(partes[1]), esperar)
+            except KeyError:
+                return self.responder(404, {'erro': f"Pedido {partes[1]} não encontrado."})
+            if len(partes) == 2:
+                return self.responder(200, trabalho.como_dict())
+            if partes[2] == 'linhas':
+                if trabalho.estado != 'concluido':
+                    return self.responder(409, {'erro': f"Pedido {trabalho.id} está {trabalho.estado}."})
+                df = ler_exportacao(trabalho.arquivo)
+                return self.responder(200, df.to_json(orient='records', date_format='iso', force_ascii=False))
+        self.responder(404, {'erro': f"Caminho desconhecido: {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != '/trabalhos':
+            return self.responder(404, {'erro': f"Caminho desconhecido: {url.path}"})
+        try:
+            pedido = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            trabalho = self.server.fila.enviar(pedido['tabela'], pedido.get('chaves', []), pedido.get('filtros'),
+                                               pedido.get('atualizar', False), pedido.get('origem', 'api'))
+        except (KeyError, ValueError) as e:
+            return self.responder(400, {'erro': str(e)})
+        esperar = float(parse_qs(url.query).get('esperar', ['0'])[0])
+        if esperar:
+            trabalho = self.server.fila.esperar(trabalho.id, esperar)
+        self.responder(200 if trabalho.estado in ('concluido', 'erro') else 202, trabalho.como_dict())
+
+
+def criar_servidor_http(fila, host=None, porta=None):
+    """Servidor da API (uma thread por requisição); rode com serve_forever()."""
+    servidor = ThreadingHTTPServer((host or SERVICO_HOST, SERVICO_PORTA if porta is None else porta),
+                                   ManipuladorHTTP)
+    servidor.daemon_threads = True
+    servidor.fila = fila
+    return servidor
+
+
+def chamar_api(metodo, caminho, dados=None, host=None, porta=None, timeout=None):
+    """Requisição JSON ao serviço em execução. Retorna (status, resposta)."""
+    import urllib.error
+    import urllib.request
+    url = f"http://{host or SERVICO_HOST}:{SERVICO_PORTA if porta is None else porta}{caminho}"
+    corpo = json.dumps(dados).encode('utf-8') if dados is not None else None
+    requisicao = urllib.request.Request(url, corpo, {'Content-Type': 'application/json'}, method=metodo)
+    try:
+        with urllib.request.urlopen(requisicao, timeout=timeout) as resposta:
+            return resposta.status, json.loads(resposta.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def iniciar_servico(argumentos):
+    """Login (ou sessões reaproveitadas), trabalhadores, agenda e API até Ctrl+C."""
+    from dotenv import load_dotenv
+    from rastreamento import Rastreador
+    from sessoes_sap import conectar_sessoes, sessao_na_thread
+
+    load_dotenv()
+    extrator = criar_extrator()
+    sessoes = []
+    if extrator.usa_sessao:
+        sap_usuario, sap_senha = os.getenv('SAP_USER'), os.getenv('SAP_PASSWORD')
+        if not sap_usuario or not sap_senha:
+            print("Erro: Variáveis de ambiente 'SAP_USER' e 'SAP_PASSWORD' não encontradas. Verifique seu arquivo .env.")
+            exit()
+        rastreio = Rastreador(parametros={'modo': 'servico', 'backend_extracao': extrator.nome})
+        with rastreio.etapa('LOGIN') as registro_login:
+            ids_sessoes = conectar_sessoes(registro_login, sap_usuario, sap_senha, argumentos.sessoes)
+        rastreio.gravar()
+        sessoes = [lambda id_sessao=id_sessao: sessao_na_thread(id_sessao) for id_sessao in ids_sessoes]
+
+    servico = ServicoExtracao(sessoes, extrator)
+    agenda = AgendaExtracao(servico.fila)
+    servidor = criar_servidor_http(servico.fila, porta=argumentos.porta)
+    servico.iniciar()
+    agenda.iniciar()
+    print(f"✔ Serviço de extração ouvindo em http://{servidor.server_address[0]}:{servidor.server_address[1]} "
+          f"(Ctrl+C para encerrar).")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("Encerrando o serviço de extração...")
+    finally:
+        servidor.server_close()
+        agenda.parar()
+        servico.parar()
+        extrator.fechar()
+
+
+def ler_argumentos():
+    parser = argparse.ArgumentParser(description="Serviço residente de extração SAP")
+    parser.add_argument('--porta', type=int, default=None, help="Porta da API (padrão: ONTIME_SERVICO_PORTA)")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    iniciar = comandos.add_parser('iniciar', help="Loga no SAP e atende os pedidos até Ctrl+C")
+    iniciar.add_argument('--sessoes', type=int, default=None, help="Sessões SAP (padrão: SAP_MAX_SESSOES)")
+
+    enviar = comandos.add_parser('enviar', help="Envia um pedido de extração ao serviço")
+    enviar.add_argument('tabela', help=f"Tabela do registro ({', '.join(TABELAS)})")
+    enviar.add_argument('chaves', nargs='*', help="Chaves do campo-chave da tabela")
+    enviar.add_argument('--arquivo', help="Arquivo com uma chave por linha (relativo a ONTIME_PASTA)")
+    enviar.add_argument('--filtro', action='append', default=[], metavar='CAMPO=V1,V2',
+                        help="Filtro além dos fixos da tabela (pode repetir)")
+    enviar.add_argument('--atualizar', action='store_true', help="Consulta de novo as chaves já guardadas no cache")
+    enviar.add_argument('--esperar', type=float, nargs='?', const=600, default=0, metavar='S',
+                        help="Aguarda o resultado (até S segundos, padrão 600)")
+
+    trabalho = comandos.add_parser('trabalho', help="Estado de um pedido")
+    trabalho.add_argument('id', type=int)
+    trabalho.add_argument('--esperar', type=float, nargs='?', const=600, default=0, metavar='S')
+
+    comandos.add_parser('estado', help="Fila, pedidos em execução e latências do serviço")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    argumentos = ler_argumentos()
+    if argumentos.comando == 'iniciar':
+        iniciar_servico(argumentos)
+        exit()
+
+    try:
+        if argumentos.comando == 'enviar':
+            chaves = list(argumentos.chaves)
+            if argumentos.arquivo:
+                chaves += ler_chaves(os.path.join(PASTA_ONTIME, argumentos.arquivo))
+            filtros = {}
+            for filtro in argumentos.filtro:
+                campo, _, valores = filtro.partition('=')
+                filtros[campo.strip().upper()] = [v.strip() for v in valores.split(',') if v.strip()]
+            status, resposta = chamar_api('POST', f"/trabalhos?esperar={argumentos.esperar}",
+                                          {'tabela': argumentos.tabela, 'chaves': chaves, 'filtros': filtros,
+                                           'atualizar': argumentos.atualizar, 'origem': 'cli'},
+                                          porta=argumentos.porta)
+        elif argumentos.comando == 'trabalho':
+            status, resposta = chamar_api('GET', f"/trabalhos/{argumentos.id}?esperar={argumentos.esperar}",
+                                          porta=argumentos.porta)
+        else:
+            status, resposta = chamar_api('GET', '/estado', porta=argumentos.porta)
+    except OSError as e:
+        print(f"❌ Serviço de extração não está respondendo ({e}). Inicie com: python servico_extracao.py iniciar")
+        exit(1)
+    print(json.dumps(resposta, indent=1, ensure_ascii=False))
+    if status >= 400 or resposta.get('estado') == 'erro':
+        exit(1)
@@ -0,0 +1,361 @@
+"""
+Sessões do SAP GUI para as etapas: reaproveita uma conexão já logada no
+sistema, mandante e usuário certos em vez de fechar o SAP e logar de novo.
+
+Uma sessão só é reaproveitada se está livre (não Busy), sem diálogo aberto e
+parada no menu. As sessões que o próprio processo usou ficam registradas
+(Id e janela principal, em sessoes_sap.json na pasta do ONTIME) e podem
+estar também numa das consultas do processo; só essas voltam ao menu com /n.
+Uma sessão do usuário numa transação, mesmo a SE16N, pode ter trabalho em
+andamento e fica como está. As sessões que faltam para chegar a
+SAP_MAX_SESSOES são abertas com createSession na mesma conexão; sem sessão
+livre, a partir de uma sessão do usuário que não esteja ocupada (ela continua
+onde está). Se todas estão ocupadas, espera SAP_TIMEOUT_PADRAO e desiste com
+uma mensagem. Só sem nenhuma conexão logada do usuário é feito o login, numa
+conexão nova, sem fechar nada. Nos dois casos, as planilhas de exportações
+anteriores que ficaram abertas no Excel são fechadas.
+
+Usado pelo SAP.py e pelo serviço de extração (servico_extracao.py). O
+win32com e o pywinauto são importados só nas funções que falam com o SAP GUI
+de verdade, para que o resto rode com o SAP falso (sap_fake.py).
+"""
+import json
+import os
+
+from configuracao import (PASTA_ONTIME, SISTEMA_SAP, MANDANTE_SAP, TIMEOUT_LOGON, MAX_SESSOES, CONEXAO_SAP,
+                          REUTILIZAR_SESSOES)
+from sap_espera import aguardar, aguardar_sessao, aguardar_elemento
+from vigia_exportacao import fechar_planilhas_da_pasta
+
+# Transações em que qualquer sessão do usuário pode ser reaproveitada: o menu (SAP Easy Access)
+TRANSACOES_OCIOSAS = {'', 'SESSION_MANAGER', 'SMEN'}
+# Consultas que o próprio processo deixa abertas; só as sessões registradas são reaproveitadas nelas
+TRANSACOES_DO_PROCESSO = {'SE16N', 'ZPMMT_287'}
+# Registro das sessões usadas pelo processo (na pasta do ONTIME)
+ARQUIVO_SESSOES = 'sessoes_sap.json'
+
+
+def obter_engine_aberto():
+    """Scripting engine do SAP GUI já aberto, ou None se o SAP Logon não está rodando."""
+    # Importado aqui: o módulo também é usado com o SAP falso, fora do Windows
+    import win32com.client
+    try:
+        return win32com.client.GetObject('SAPGUI').GetScriptingEngine
+    except Exception:
+        return None
+
+
+def ler_info(session):
+    """(sistema, mandante, usuário, transação) da sessão, ou None se ela não responde."""
+    try:
+        info = session.Info
+        return (str(info.SystemName).upper(), str(info.Client), str(info.User).upper(),
+                str(info.Transaction).upper())
+    except Exception:
+        return None
+
+
+def sessao_do_usuario(info, sistema, mandante, usuario):
+    """Sessão logada no sistema e mandante esperados, com o mesmo usuário."""
+    return (info is not None and info[2] != '' and info[0] == sistema.upper()
+            and (not mandante or info[1] == str(mandante)) and info[2] == usuario.upper())
+
+
+def identificar(session):
+    """
+    Id da sessão com o handle da janela principal: o Id sozinho volta a ser usado
+    por outra sessão depois que o SAP é fechado. None se a sessão não responde.
+    """
+    try:
+        return f"{session.Id}#{session.findById('wnd[0]').Handle}"
+    except Exception:
+        return None
+
+
+def ler_sessoes_proprias(pasta=None):
+    """Identificadores (identificar) das sessões usadas pelo processo na última execução."""
+    caminho = os.path.join(pasta or PASTA_ONTIME, ARQUIVO_SESSOES)
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            return set(json.load(arquivo))
+    except (OSError, ValueError):
+        return set()
+
+
+def registrar_sessoes_proprias(sessoes, pasta=None):
+    """Grava os identificadores das `sessoes` usadas pelo processo."""
+    caminho = os.path.join(pasta or PASTA_ONTIME, ARQUIVO_SESSOES)
+    identificadores = [identificador for identificador in map(identificar, sessoes) if identificador]
+    try:
+        with open(caminho + '.tmp', 'w', encoding='utf-8') as arquivo:
+            json.dump(identificadores, arquivo, indent=1)
+        os.replace(caminho + '.tmp', caminho)
+    except OSError as e:
+        # Sem o registro, a próxima execução só reaproveita as sessões paradas no menu
+        print(f"⚠ Não foi possível registrar as sessões SAP em {caminho} ({e}).")
+
+
+def sessao_livre(session, info, proprias=()):
+    """
+    Sem processamento em andamento, sem diálogo aberto e parada no menu ou,
+    se é uma sessão registrada do processo, numa das consultas do processo.
+    """
+    try:
+        if session.Busy or session.findById("wnd[1]", False) is not None:
+            return False
+        if info[3] in TRANSACOES_OCIOSAS:
+            return True
+        return info[3] in TRANSACOES_DO_PROCESSO and identificar(session) in proprias
+    except Exception:
+        return False
+
+
+def procurar_conexao(application, usuario, sistema=None, mandante=None, proprias=()):
+    """
+    Conexão já logada com o usuário no sistema/mandante, as sessões livres
+    dela (ver sessao_livre) e todas as sessões do usuário nela. Entre várias,
+    a com mais sessões livres. Retorna (conexão, [livres], [do usuário]) ou
+    (None, [], []).
+    """
+    sistema = sistema or SISTEMA_SAP
+    mandante = MANDANTE_SAP if mandante is None else mandante
+    melhor, livres_melhor, do_usuario_melhor = None, [], []
+    for i in range(application.Children.Count):
+        connection = application.Children(i)
+        try:
+            sessoes = [connection.Children(j) for j in range(connection.Children.Count)]
+        except Exception:
+            # Conexão encerrada pelo servidor
+            continue
+        infos = [(session, info) for session in sessoes
+                 if sessao_do_usuario(info := ler_info(session), sistema, mandante, usuario)]
+        if not infos:
+            continue
+        livres = [session for session, info in infos if sessao_livre(session, info, proprias)]
+        if melhor is None or len(livres) > len(livres_melhor):
+            melhor, livres_melhor, do_usuario_melhor = connection, livres, [session for session, _ in infos]
+    return melhor, livres_melhor, do_usuario_melhor
+
+
+def voltar_ao_menu(session):
+    """Encerra a transação da sessão (/n) e espera ela ficar livre."""
+    session.findById("wnd[0]/tbar[0]/okcd").text = "/n"
+    session.findById("wnd[0]").sendVKey(0)
+    aguardar_sessao(session)
+
+
+def abrir_sessao(connection, session):
+    """Abre uma sessão nova (createSession) a partir de `session`, na mesma conexão, e espera ela ficar livre."""
+    total_antes = connection.Children.Count
+    session.createSession()
+    nova = aguardar(lambda: connection.Children(connection.Children.Count - 1)
+                    if connection.Children.Count > total_antes else None,
+                    TIMEOUT_LOGON, "a nova sessão SAP")
+    aguardar_sessao(nova)
+    return nova
+
+
+def sessao_desocupada(sessoes, timeout=None):
+    """
+    Uma das `sessoes` fora de processamento (não Busy), para abrir sessões novas a
+    partir dela; a transação e a tela dela não mudam. Espera até `timeout`.
+    """
+    def tentar():
+        for session in sessoes:
+            try:
+                if not session.Busy:
+                    return session
+            except Exception:
+                continue
+        return None
+
+    try:
+        return aguardar(tentar, timeout, "uma sessão SAP desocupada")
+    except TimeoutError as e:
+        raise RuntimeError("Todas as sessões da conexão SAP aberta estão ocupadas e nenhuma está no menu; "
+                           "espere uma terminar ou deixe uma sessão no menu e execute de novo.") from e
+
+
+def abrir_sessoes_paralelas(connection, session, quantidade, existentes=None, pasta=None):
+    """
+    Completa `quantidade` sessões na mesma conexão: primeiro a `session`
+    principal e as `existentes`, depois sessões novas (createSession).
+    As sessões ficam registradas como do processo (registrar_sessoes_proprias).
+    Retorna a lista com o Id de cada sessão, começando pela principal.
+    """
+    usadas = [session] + [s for s in existentes or [] if s.Id != session.Id][:quantidade - 1]
+    ids_sessoes = [s.Id for s in usadas]
+    while len(ids_sessoes) < quantidade:
+        try:
+            nova = abrir_sessao(connection, session)
+        except Exception as e:
+            # Limite de sessões do servidor atingido: segue com as que já existem
+            print(f"Não foi possível abrir mais sessões SAP ({e}).")
+            break
+        usadas.append(nova)
+        ids_sessoes.append(nova.Id)
+    registrar_sessoes_proprias(usadas, pasta)
+    print(f"{len(ids_sessoes)} sessão(ões) SAP disponível(is) para extração.")
+    return ids_sessoes
+
+
+def reaproveitar_sessoes(application, usuario, quantidade, sistema=None, mandante=None, pasta=None):
+    """
+    Ids de `quantidade` sessões (ou as que o servidor permitir) numa conexão
+    já logada, ou None se não há conexão logada e é preciso logar. Só as
+    sessões registradas do processo voltam ao menu (/n). Sem sessão livre, as
+    sessões são abertas a partir de uma sessão desocupada do usuário, que fica
+    como está; se todas estão ocupadas e nenhuma desocupa, gera RuntimeError.
+    """
+    if application is None or not usuario:
+        return None
+    proprias = ler_sessoes_proprias(pasta)
+    connection, livres, do_usuario = procurar_conexao(application, usuario, sistema, mandante, proprias)
+    if connection is None:
+        return None
+    if not livres:
+        print("⚠ Conexão SAP aberta sem sessão livre: abrindo sessões novas, sem mexer nas do usuário.")
+        base = sessao_desocupada(do_usuario)
+        try:
+            primeira = abrir_sessao(connection, base)
+        except Exception as e:
+            raise RuntimeError(f"Não foi possível abrir uma sessão na conexão SAP aberta ({e}); "
+                               f"feche uma sessão sem uso ou deixe uma no menu e execute de novo.") from e
+        return abrir_sessoes_paralelas(connection, primeira, quantidade, pasta=pasta)
+    for session in livres[:quantidade]:
+        if identificar(session) in proprias:
+            voltar_ao_menu(session)
+    print(f"✔ Reaproveitando a conexão SAP aberta ({len(livres)} sessão(ões) livre(s)).")
+    return abrir_sessoes_paralelas(connection, livres[0], quantidade, livres[1:], pasta)
+
+
+def fechar_sap_existente():
+    """
+    Tenta fechar todas as instâncias e sessões existentes do SAP GUI.
+    Esta função é robusta e não depende de uma sessão pré-existente.
+    """
+    import win32com.client
+    print("Tentando fechar instâncias existentes do SAP...")
+    try:
+        # Tenta obter o objeto SAPGUI. Se não houver SAP GUI aberto, isso falhará.
+        SapGuiAuto = win32com.client.GetObject("SAPGUI")
+        application = SapGuiAuto.GetScriptingEngine
+
+        # Itera sobre todas as conexões abertas
+        for i in range(application.Connections.Count):
+            connection = application.Children(i)
+            # Itera sobre todas as sessões em cada conexão
+            for j in range(connection.Sessions.Count):
+                session = connection.Children(j)
+                try:
+                    # Tenta maximizar e fechar a janela principal da sessão
+                    session.findById("wnd[0]").maximize() # Corrigido: .maximize() é um método
+                    session.findById("wnd[0]").close()
+                    # Tenta lidar com o diálogo de logoff, se aparecer
+                    try:
+                        session.findById("wnd[1]/usr/btnSPOP-OPTION1").press() # Pressiona "Sim" ou "OK"
+                        print(f"Diálogo de logoff tratado para sessão {j} da conexão {i}.")
+                    except Exception:
+                        # Se o diálogo não aparecer, apenas ignora
+                        print(f"Nenhum diálogo de logoff encontrado para sessão {j} da conexão {i}.")
+                    print(f"Sessão {j} da conexão {i} fechada com sucesso.")
+                except Exception as e:
+                    print(f"Erro ao fechar sessão {j} da conexão {i}: {e}")
+    except Exception as e:
+        # Captura o erro se o objeto SAPGUI não for encontrado (SAP não está aberto)
+        print("Nenhuma instância do SAP GUI encontrada ou erro ao acessar: ", e)
+    print("Tentativa de fechamento de instâncias SAP concluída.")
+
+
+def obter_scripting_engine(timeout):
+    """
+    Aguarda o SAP Logon registrar o objeto SAPGUI e retorna o scripting engine.
+    """
+    import win32com.client
+
+    def tentar():
+        try:
+            return win32com.client.GetObject('SAPGUI').GetScriptingEngine
+        except Exception:
+            # O SAP Logon ainda está abrindo
+            return None
+
+    return aguardar(tentar, timeout, "o SAP Logon registrar o objeto SAPGUI")
+
+
+def fazer_login(registro_login, sap_usuario, sap_senha, quantidade=None, engine=None):
+    """
+    Abre o SAP Logon (ou usa o `engine` do que já está aberto), conecta em
+    CONEXAO_SAP, faz o login e abre até `quantidade` sessões (SAP_MAX_SESSOES).
+    Retorna a lista com o Id de cada sessão.
+    """
+    if engine is None:
+        from pywinauto.application import Application
+        # Caminho para o executável SAP Logon
+        sap_logon_path = r'C:\Program Files (x86)\SAP\FrontEnd\SAPgui\saplogon.exe'
+
+        print("Iniciando SAP Logon...")
+        Application(backend="uia").start(sap_logon_path)
+        # Espera o SAP Logon registrar o scripting engine (em vez de um tempo fixo)
+        engine = obter_scripting_engine(TIMEOUT_LOGON)
+        print("SAP Logon aberto com sucesso.")
+    application = registro_login.instrumentar(engine)
+
+    print(f"Conectando ao {CONEXAO_SAP}...")
+    # Abre a conexão com o sistema SAP especificado
+    connection = application.OpenConnection(CONEXAO_SAP, True)
+    session = aguardar(lambda: connection.Children(0) if connection.Children.Count > 0 else None,
+                       TIMEOUT_LOGON, f"a sessão da conexão {CONEXAO_SAP}")
+    aguardar_elemento(session, "wnd[0]/usr/txtRSYST-BNAME", TIMEOUT_LOGON)
+    session.findById('wnd[0]').maximize()
+    print("Conexão estabelecida com sucesso.")
+
+    session.FindById("wnd[0]").Maximize()
+
+    print("Realizando login no SAP...")
+    # Preenche os campos de usuário e senha
+    aguardar_elemento(session, "wnd[0]/usr/txtRSYST-BNAME").Text = sap_usuario
+    aguardar_elemento(session, "wnd[0]/usr/pwdRSYST-BCODE").Text = sap_senha
+    aguardar_elemento(session, "wnd[0]/usr/pwdRSYST-BCODE").SetFocus() # Corrigido: .SetFocus() é um método
+    aguardar_elemento(session, "wnd[0]/usr/pwdRSYST-BCODE").CaretPosition = 8
+    session.findById("wnd[0]").sendVKey(0) # Pressiona Enter para logar
+    print("Login realizado com sucesso.")
+
+    return abrir_sessoes_paralelas(connection, session, quantidade or MAX_SESSOES)
+
+
+def sessao_na_thread(id_sessao):
+    """
+    Retorna a sessão SAP pelo Id para uso na thread atual.
+    Objetos COM não podem ser compartilhados entre threads, então cada thread
+    inicializa o COM e busca a sessão novamente no scripting engine.
+    """
+    import pythoncom
+    import win32com.client
+    pythoncom.CoInitialize()
+    return win32com.client.GetObject('SAPGUI').GetScriptingEngine.findById(id_sessao)
+
+
+def conectar_sessoes(registro_login, sap_usuario, sap_senha, quantidade=None):
+    """
+    Ids das sessões para as etapas: as de uma conexão já logada, quando há
+    (SAP_REUTILIZAR_SESSOES), ou as de um login completo. Com o reaproveitamento
+    ligado, o login usa o SAP Logon aberto e não fecha nenhuma sessão; desligado,
+    fecha o SAP antes de logar. `registro_login` (rastreamento) conta as chamadas
+    COM e guarda se houve reaproveitamento.
+    """
+    quantidade = quantidade or MAX_SESSOES
+    engine = obter_engine_aberto() if REUTILIZAR_SESSOES else None
+    ids_sessoes = None
+    if engine is not None:
+        ids_sessoes = reaproveitar_sessoes(registro_login.instrumentar(engine), sap_usuario, quantidade)
+    registro_login.extras['sessoes_reaproveitadas'] = bool(ids_sessoes)
+    # As planilhas &XXL da execução anterior abertas no Excel bloqueariam os arquivos
+    fechar_planilhas_da_pasta(PASTA_ONTIME)
+    if ids_sessoes:
+        return ids_sessoes
+    if not REUTILIZAR_SESSOES:
+        # Chama a função para fechar qualquer instância existente do SAP antes de iniciar uma nova
+        fechar_sap_existente()
+    # Sem conexão logada do usuário: conexão nova no SAP Logon aberto, sem fechar as outras
+    return fazer_login(registro_login, sap_usuario, sap_senha, quantidade, engine)
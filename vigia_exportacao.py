@@ -0,0 +1,207 @@
+"""
+Espera a exportação do SAP GUI ficar pronta e fecha o Excel que o SAP abre
+com ela.
+
+Depois do "Substituir" (btn[11]) o SAP GUI grava o arquivo por conta própria:
+a sessão pode ficar livre antes do fim da gravação e, na exportação &XXL, a
+planilha é aberta no Excel, que a mantém bloqueada. Em vez de ler o arquivo
+logo em seguida (leitura parcial, arquivo bloqueado) ou esperar um tempo
+fixo, aguardar_exportacao devolve o caminho assim que o arquivo existe, está
+completo e ninguém mais o mantém aberto:
+
+  .xlsx  o zip já tem o registro de fim do diretório central (gravado por último)
+  texto  tamanho e data de modificação sem mudar por SAP_EXPORTACAO_ESTAVEL segundos
+
+O arquivo da exportação anterior é apagado antes do btn[11] (preparar_destino),
+então um arquivo antigo nunca passa por pronto. Se quem bloqueia é o Excel, a
+planilha é fechada na hora; se o Excel só abre depois, VIGIA_EXCEL a fecha em
+segundo plano. O Excel só é encerrado quando não sobra nenhuma pasta de
+trabalho aberta: as planilhas do usuário ficam como estão.
+"""
+import os
+import threading
+import time
+
+from configuracao import TIMEOUT_EXPORTACAO, EXPORTACAO_ESTAVEL, FECHAR_EXCEL_EXPORTACAO, ESPERA_EXCEL_EXPORTACAO
+from sap_espera import aguardar
+
+# Assinatura do registro de fim do diretório central do zip (.xlsx), que fica nos
+# últimos 22 bytes do arquivo, mais até 64 KB de comentário
+FIM_ZIP = b'PK\x05\x06'
+TAMANHO_MAXIMO_FIM_ZIP = 22 + 65535
+
+
+def zip_completo(caminho):
+    """O .xlsx já foi gravado até o fim (o registro final do zip está lá)."""
+    try:
+        with open(caminho, 'rb') as arquivo:
+            arquivo.seek(0, os.SEEK_END)
+            tamanho = arquivo.tell()
+            arquivo.seek(max(0, tamanho - TAMANHO_MAXIMO_FIM_ZIP))
+            return FIM_ZIP in arquivo.read()
+    except OSError:
+        return False
+
+
+def arquivo_bloqueado(caminho):
+    """
+    Outro processo (o SAP GUI gravando, o Excel com a planilha aberta) mantém
+    o arquivo aberto. Só o Windows bloqueia arquivos abertos; nos demais
+    sistemas o arquivo nunca está bloqueado.
+    """
+    if os.name != 'nt':
+        return False
+    try:
+        os.close(os.open(caminho, os.O_RDWR | getattr(os, 'O_BINARY', 0)))
+        return False
+    except OSError:
+        return True
+
+
+def fechar_planilhas(pertence):
+    """
+    Fecha, sem salvar, as pastas de trabalho do Excel aberto cujo caminho
+    (os.path.normcase) satisfaz `pertence`, e encerra o Excel se não sobrar
+    nenhuma. Retorna os caminhos fechados.
+    """
+    if os.name != 'nt':
+        return set()
+    import pythoncom
+    import win32com.client
+    # Cada thread que usa o COM precisa inicializá-lo (a do VIGIA_EXCEL, por exemplo)
+    pythoncom.CoInitialize()
+    try:
+        # Só se conecta a um Excel já aberto: Dispatch abriria um Excel novo só para fechá-lo
+        xl = win32com.client.GetActiveObject("Excel.Application")
+    except Exception:
+        return set()
+    fechados = set()
+    try:
+        xl.DisplayAlerts = False
+        for wb in list(xl.Workbooks):
+            nome = os.path.normcase(str(wb.FullName))
+            if pertence(nome):
+                wb.Close(SaveChanges=False)
+                fechados.add(nome)
+        if fechados and xl.Workbooks.Count == 0:
+            xl.Quit()
+    except Exception as e:
+        print(f"⚠ Erro ao fechar as planilhas no Excel: {e}")
+    return fechados
+
+
+def fechar_planilha(caminho):
+    """Fecha no Excel a planilha `caminho`, se estiver aberta. Retorna se fechou."""
+    alvo = os.path.normcase(os.path.abspath(caminho))
+    return bool(fechar_planilhas(lambda nome: nome == alvo))
+
+
+def fechar_planilhas_da_pasta(pasta):
+    """Fecha as planilhas de `pasta` que ficaram abertas no Excel (exportações de execuções anteriores)."""
+    prefixo = os.path.join(os.path.normcase(os.path.abspath(pasta)), '')
+    fechados = fechar_planilhas(lambda nome: nome.startswith(prefixo))
+    if fechados:
+        print(f"{len(fechados)} planilha(s) de exportações anteriores fechada(s) no Excel.")
+    return fechados
+
+
+def preparar_destino(caminho):
+    """
+    Apaga o arquivo da exportação anterior antes de exportar de novo, fechando
+    a planilha no Excel se for ela que o mantém aberto.
+    """
+    for tentativa in range(2):
+        try:
+            os.remove(caminho)
+            return
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            if tentativa or not fechar_planilha(caminho):
+                print(f"⚠ Não foi possível apagar a exportação anterior {os.path.basename(caminho)}: {e}")
+                return
+
+
+def aguardar_exportacao(caminho, timeout=None, fechar_excel=None, estavel=None):
+    """
+    Aguarda o arquivo exportado em `caminho` existir, estar completo e
+    desbloqueado (até SAP_TIMEOUT_EXPORTACAO) e devolve o caminho. Gera
+    TimeoutError se o arquivo não ficar pronto a tempo.
+    """
+    timeout = TIMEOUT_EXPORTACAO if timeout is None else timeout
+    fechar_excel = FECHAR_EXCEL_EXPORTACAO if fechar_excel is None else fechar_excel
+    estavel = EXPORTACAO_ESTAVEL if estavel is None else estavel
+    planilha = caminho.lower().endswith('.xlsx')
+    # (tamanho, data de modificação) da última verificação e desde quando não mudam
+    anterior = [None, None]
+
+    def pronto():
+        try:
+            estado = os.stat(caminho)
+        except OSError:
+            return False
+        if planilha:
+            if not zip_completo(caminho):
+                return False
+        else:
+            assinatura, agora = (estado.st_size, estado.st_mtime_ns), time.monotonic()
+            if assinatura != anterior[0]:
+                anterior[:] = assinatura, agora
+            if estado.st_size == 0 or agora - anterior[1] < estavel:
+                return False
+        if arquivo_bloqueado(caminho):
+            # Completo mas aberto: quase sempre o Excel que o SAP GUI abriu com a planilha
+            if planilha and fechar_excel:
+                fechar_planilha(caminho)
+            return False
+        return caminho
+
+    return aguardar(pronto, timeout, f"a exportação {os.path.basename(caminho)} ficar pronta")
+
+
+class VigiaExcel:
+    """
+    Fecha em segundo plano as planilhas que o SAP GUI abre no Excel depois
+    que a exportação já foi lida, por até `espera` segundos depois de cada
+    exportação.
+    """
+
+    def __init__(self, espera=None, intervalo=0.5):
+        self.espera = ESPERA_EXCEL_EXPORTACAO if espera is None else espera
+        self.intervalo = intervalo
+        self.pendentes = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def vigiar(self, caminho):
+        if os.name != 'nt':
+            return
+        with self._lock:
+            self.pendentes[os.path.normcase(os.path.abspath(caminho))] = time.monotonic() + self.espera
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.rodar, daemon=True, name='vigia-excel')
+                self._thread.start()
+
+    def rodar(self):
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self.pendentes = {nome: limite for nome, limite in self.pendentes.items() if limite > agora}
+                if not self.pendentes:
+                    self._thread = None
+                    return
+                alvos = set(self.pendentes)
+            fechados = fechar_planilhas(alvos.__contains__)
+            with self._lock:
+                for nome in fechados:
+                    self.pendentes.pop(nome, None)
+            time.sleep(self.intervalo)
+
+
+VIGIA_EXCEL = VigiaExcel()
+
+
+def vigiar_planilha(caminho):
+    """Fecha a planilha `caminho` se o SAP GUI ainda abri-la no Excel (SAP_FECHAR_EXCEL_EXPORTACAO)."""
+    if FECHAR_EXCEL_EXPORTACAO and caminho.lower().endswith('.xlsx'):
+        VIGIA_EXCEL.vigiar(caminho)